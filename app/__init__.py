@@ -6,6 +6,9 @@ from app.routes.cart_api import cart_api_bp
 from app.routes.items_admin import items_bp
 from app.routes.users_admin import user_bp
 from app.routes.orders_admin import order_bp
+from app.routes.monitoring import monitoring_bp
+from app.schema import init_schema_cli
+from app.metrics import init_metrics
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = environ.get("SECRET_KEY", "secret")
@@ -15,4 +18,9 @@ app.register_blueprint(cart_api_bp)
 app.register_blueprint(items_bp)
 app.register_blueprint(user_bp)
 app.register_blueprint(order_bp)
+app.register_blueprint(monitoring_bp)
 init_user_management(app, login)
+init_metrics(app)
+
+# `flask init-schema`; the schema is never bootstrapped inside a request
+init_schema_cli(app)
@@ -0,0 +1,542 @@
+"""ASGI entry point: the cart API and catalog reads on asyncio, Flask for the rest.
+
+    uvicorn app.asgi:application --workers 4
+
+The Flask views hold a worker thread for every in-flight request while
+pymongo waits on the server. Here /api/cart/* and /api/catalog are served
+by coroutines on pymongo's AsyncMongoClient, so one process can keep
+thousands of cart requests waiting on Mongo at once. Every other path (pages,
+admin, login) is handed to the Flask app through asgiref's WsgiToAsgi.
+
+Request parsing, cart operations and pricing come from app.cart_service and
+app.records.carts, the same code the Flask views in app.routes.cart_api
+use; the login comes from the same Flask session cookie (or auth token) the
+Flask app issues. Only checkout runs on a thread: order placement keeps its
+single sync implementation (transactions + compensation) in
+app.records.orders.
+"""
+
+import asyncio
+import json
+import os
+import time
+from http.cookies import SimpleCookie
+from typing import Optional
+from urllib.parse import parse_qsl, quote
+
+from asgiref.wsgi import WsgiToAsgi
+from bson import ObjectId
+from bson.errors import InvalidId
+
+import app.database
+from app import app as flask_app
+from app.metrics import observe_request
+from app.cart_service import (
+    CART_CACHE_CONTROL,
+    CartInputError,
+    batch_item_ids,
+    batch_ops,
+    cart_etag,
+    cart_item_ids,
+    changed_lines,
+    check_discount,
+    etag_matches,
+    expected_version,
+    order_document,
+    parse_batch,
+    parse_product_id,
+    parse_quantity,
+    price_cart,
+    pricing_generations_async,
+    shortage_message,
+)
+from app.catalog import catalog_args, catalog_json, catalog_page_async
+from app.records.carts import (
+    CartConflict,
+    CartState,
+    add_ops,
+    clear_ops,
+    db_cart_apply_async,
+    db_cart_get_async,
+    discount_ops,
+    remove_ops,
+    set_ops,
+)
+from app.records.orders import InsufficientStock, db_order_place
+from app.schema import bootstrap_schema
+from app.discounts import discount_table
+from app.records.users import (
+    SESSION_PROJECTION,
+    VERSION_PROJECTION,
+    cache_model,
+    cached_model,
+    still_current,
+    token_cache,
+    user_cache,
+)
+
+MAX_BODY_BYTES = 64 * 1024
+
+# what the Flask user_loader treats as the demo account (no user document)
+DEMO_USER_ID = "1"
+
+
+class Request:
+    """The bits of an ASGI HTTP request the cart views need."""
+
+    def __init__(self, scope: dict, body: bytes):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.args = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        self.headers = {
+            name.decode("latin-1").lower(): value.decode("latin-1")
+            for name, value in scope.get("headers", [])
+        }
+        self.body = body
+
+    def cookie(self, name: str) -> Optional[str]:
+        jar = SimpleCookie()
+        try:
+            jar.load(self.headers.get("cookie", ""))
+        except Exception:
+            return None
+        morsel = jar.get(name)
+        return morsel.value if morsel is not None else None
+
+    def get_json(self) -> dict:
+        try:
+            data = json.loads(self.body or b"null")
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+
+class Response:
+    def __init__(self, body, status: int = 200, headers: Optional[dict] = None):
+        self.body = body
+        self.status = status
+        self.headers = headers or {}
+
+    async def send(self, send) -> None:
+        if isinstance(self.body, (bytes, str)):
+            payload = self.body.encode() if isinstance(self.body, str) else self.body
+            content_type = "text/plain; charset=utf-8"
+        else:
+            payload = json.dumps(self.body, default=str).encode()
+            content_type = "application/json"
+        headers = {"content-type": content_type, "content-length": str(len(payload))}
+        headers.update(self.headers)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status,
+                "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+            }
+        )
+        await send({"type": "http.response.body", "body": payload})
+
+
+def _no_cart() -> Response:
+    return Response({"message": "Carts need a registered account."}, 403)
+
+
+def _bad_request(e: CartInputError) -> Response:
+    return Response({"message": str(e)}, 400)
+
+
+# -- login -----------------------------------------------------------------
+
+
+class SessionReader:
+    """Reads the Flask session cookie with the Flask app's own serializer."""
+
+    def __init__(self, flask):
+        self.flask = flask
+        self._serializer = None
+
+    def user_id(self, request: Request) -> Optional[str]:
+        cookie = request.cookie(self.flask.config["SESSION_COOKIE_NAME"])
+        if not cookie:
+            return None
+        if self._serializer is None:
+            self._serializer = self.flask.session_interface.get_signing_serializer(
+                self.flask
+            )
+        if self._serializer is None:  # no SECRET_KEY
+            return None
+        max_age = int(self.flask.permanent_session_lifetime.total_seconds())
+        try:
+            data = self._serializer.loads(cookie, max_age=max_age)
+        except Exception:
+            return None
+        return data.get("_user_id")
+
+
+SESSIONS = SessionReader(flask_app)
+
+
+async def _cached_lookup(cache, key, query: dict) -> Optional[dict]:
+    # app.records.users._cached_lookup on the async client
+    model, check = cached_model(cache, key)
+    if model is not None and not check:
+        return model
+    database = app.database.get_async_db()
+    if database is None:
+        return None
+    users = database["users"]
+    if model is not None:
+        stored = await users.find_one({"_id": model["_id"]}, VERSION_PROJECTION)
+        if still_current(model, stored):
+            cache_model(cache, key, model)
+            return model
+        cache.invalidate(key)
+    model = await users.find_one(query, SESSION_PROJECTION)
+    if model is not None:
+        cache_model(cache, key, model)
+    return model
+
+
+async def _session_model(user_id) -> Optional[dict]:
+    return await _cached_lookup(user_cache, user_id, {"_id": user_id})
+
+
+async def _token_model(token: str) -> Optional[dict]:
+    if not token:
+        return None
+    return await _cached_lookup(token_cache, token, {"auth_token": token})
+
+
+async def current_owner(request: Request, sessions: SessionReader):
+    """(logged in?, cart owner ObjectId or None for the demo user).
+
+    Same order as Flask-Login: the session first, then the auth_token query
+    parameter, then a Bearer header.
+    """
+    user_id = sessions.user_id(request)
+    if user_id == DEMO_USER_ID:
+        return True, None
+    if user_id:
+        try:
+            model = await _session_model(ObjectId(user_id))
+        except InvalidId:
+            model = None
+        if model is not None:
+            return True, model["_id"]
+
+    for token in (
+        request.args.get("auth_token"),
+        request.headers.get("authorization", "").replace("Bearer ", "").strip(),
+    ):
+        model = await _token_model(token)
+        if model is not None:
+            return True, model["_id"]
+    return False, None
+
+
+# -- cart views --------------------------------------------------------------
+
+
+async def _refresh_discounts() -> None:
+    # the table's occasional version check is a sync query; keep it off the loop
+    if discount_table.refresh_due():
+        await asyncio.to_thread(discount_table.refresh)
+
+
+async def _cart_data(cart: Optional[CartState], fresh: bool = False) -> dict:
+    cart = cart or CartState(None)
+    products = await app.database.get_items_by_ids_async(
+        cart_item_ids(cart), fresh=fresh
+    )
+    await _refresh_discounts()
+    return price_cart(cart, products, refresh_discounts=False)
+
+
+async def _conflict(owner) -> Response:
+    cart_data = await _cart_data(await db_cart_get_async(owner))
+    return Response(
+        {"message": "Your cart was changed somewhere else.", "cart": cart_data}, 409
+    )
+
+
+def _revalidate(etag: str) -> Response:
+    return Response(
+        b"", 304, {"etag": f'"{etag}"', "cache-control": CART_CACHE_CONTROL}
+    )
+
+
+def _with_etag(body: dict, etag: str) -> Response:
+    return Response(
+        body, 200, {"etag": f'"{etag}"', "cache-control": CART_CACHE_CONTROL}
+    )
+
+
+async def get_cart(request: Request, owner) -> Response:
+    cart = await db_cart_get_async(owner)
+    await _refresh_discounts()
+    etag = cart_etag(owner, cart.version, *(await pricing_generations_async()))
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return _revalidate(etag)
+    return _with_etag(await _cart_data(cart), etag)
+
+
+async def get_cart_count(request: Request) -> Response:
+    """/api/cart/count: guests get 0 instead of a login redirect."""
+    logged_in, owner = await current_owner(request, SESSIONS)
+    if not logged_in or owner is None:
+        return Response({"item_count": 0, "cart_version": 0})
+    cart = await db_cart_get_async(owner)
+    etag = f"count-{cart_etag(owner, cart.version)}"
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return _revalidate(etag)
+    return _with_etag(
+        {"item_count": cart.item_count, "cart_version": cart.version}, etag
+    )
+
+
+async def add_to_cart(request: Request, owner) -> Response:
+    data = request.get_json()
+    try:
+        obj_id = parse_product_id(data)
+        quantity = parse_quantity(data)
+    except CartInputError as e:
+        return _bad_request(e)
+    if quantity < 1:
+        return Response({"message": "Quantity must be at least 1."}, 400)
+
+    product = (await app.database.get_items_by_ids_async([obj_id])).get(obj_id)
+    if not product:
+        return Response({"message": "Invalid product."}, 400)
+
+    try:
+        cart = await db_cart_apply_async(
+            owner, add_ops(obj_id, quantity), expected_version(data)
+        )
+    except CartConflict:
+        return await _conflict(owner)
+
+    cart_data = await _cart_data(cart)
+    return Response(
+        {
+            "message": f"Added {product.name or 'item'} to cart!",
+            "cart_item_count": cart_data["item_count"],
+            "cart_version": cart_data["cart_version"],
+        }
+    )
+
+
+async def update_cart_item(request: Request, owner) -> Response:
+    data = request.get_json()
+    try:
+        obj_id = parse_product_id(data)
+        quantity = parse_quantity(data)
+    except CartInputError as e:
+        return _bad_request(e)
+
+    product = (await app.database.get_items_by_ids_async([obj_id])).get(obj_id)
+    if not product:
+        return Response({"message": "Invalid product."}, 400)
+
+    try:
+        cart = await db_cart_apply_async(
+            owner, set_ops(obj_id, quantity), expected_version(data)
+        )
+    except CartConflict:
+        return await _conflict(owner)
+    return Response(await _cart_data(cart))
+
+
+async def remove_cart_item(request: Request, owner) -> Response:
+    data = request.get_json()
+    try:
+        obj_id = parse_product_id(data)
+    except CartInputError as e:
+        return _bad_request(e)
+
+    try:
+        cart = await db_cart_apply_async(
+            owner, remove_ops(obj_id), expected_version(data)
+        )
+    except CartConflict:
+        return await _conflict(owner)
+    return Response(await _cart_data(cart))
+
+
+async def batch_update_cart(request: Request, owner) -> Response:
+    data = request.get_json()
+    try:
+        parsed = parse_batch(data)
+        products = await app.database.get_items_by_ids_async(batch_item_ids(parsed))
+        ops = batch_ops(parsed, products)
+    except CartInputError as e:
+        return _bad_request(e)
+
+    try:
+        cart = await db_cart_apply_async(owner, ops, expected_version(data))
+    except CartConflict:
+        return await _conflict(owner)
+    return Response(changed_lines(await _cart_data(cart), parsed))
+
+
+async def apply_discount(request: Request, owner) -> Response:
+    data = request.get_json()
+    code = (data.get("code") or "").strip().upper()
+    if not code:
+        return Response({"ok": False, "message": "Please enter a code."}, 400)
+
+    cart = await db_cart_get_async(owner)
+    if not cart.lines:
+        await db_cart_apply_async(owner, discount_ops(None))
+        return Response({"ok": False, "message": "Your cart is empty."}, 400)
+
+    await _refresh_discounts()
+    rule = discount_table.get(code, refresh=False)
+    cart.discount = {"code": code}
+    problem = check_discount(code, await _cart_data(cart), rule)
+    if problem:
+        await db_cart_apply_async(owner, discount_ops(None))
+        return Response({"ok": False, "message": problem}, 404 if rule is None else 400)
+
+    cart = await db_cart_apply_async(
+        owner, discount_ops({"code": rule.code, "percent_off": rule.percent_off})
+    )
+    return Response(
+        {
+            "ok": True,
+            "message": f"Code {rule.code} applied: {rule.percent_off:.0f}% off.",
+            "cart": await _cart_data(cart),
+        }
+    )
+
+
+async def checkout(request: Request, owner) -> Response:
+    cart = await db_cart_get_async(owner)
+    if not cart.lines:
+        return Response({"ok": False, "message": "Your cart is empty."}, 400)
+
+    # current prices and stock, not the item cache's
+    cart_data = await _cart_data(cart, fresh=True)
+    if cart_data["item_count"] == 0:
+        return Response({"ok": False, "message": "Your cart is empty."}, 400)
+
+    # claim the priced version so a double submit can't place two orders
+    try:
+        await db_cart_apply_async(owner, [], expected_version=cart.version)
+    except CartConflict:
+        return await _conflict(owner)
+
+    order_doc = order_document(str(owner), cart_data)
+    try:
+        # the reservation logic (transactions or compensation) stays sync-only
+        result = await asyncio.to_thread(db_order_place, order_doc)
+    except InsufficientStock as e:
+        return Response(
+            {
+                "ok": False,
+                "message": shortage_message(e.shortages),
+                "insufficient": e.shortages,
+            },
+            409,
+        )
+    if result is None:
+        return Response({"ok": False, "message": "Internal error"}, 500)
+
+    await db_cart_apply_async(owner, clear_ops(order_doc["items"]))
+    return Response(
+        {"ok": True, "message": "Order placed successfully!", "order_id": str(result)}
+    )
+
+
+async def catalog_api(request: Request) -> Response:
+    q, sort, after, page_size = catalog_args(
+        request.args, flask_app.config.get("CATALOG_PAGE_SIZE")
+    )
+    database = app.database.get_async_db()
+    if database is None:
+        return Response({"message": "Internal error"}, 500)
+    rows, next_token = await catalog_page_async(
+        database["items"], q, sort, after, page_size
+    )
+    app.database.cache_items(rows)
+    return Response(catalog_json(rows, next_token))
+
+
+CART_ROUTES = {
+    ("GET", "/api/cart"): get_cart,
+    ("POST", "/api/cart/add"): add_to_cart,
+    ("POST", "/api/cart/update"): update_cart_item,
+    ("POST", "/api/cart/remove"): remove_cart_item,
+    ("POST", "/api/cart/batch"): batch_update_cart,
+    ("POST", "/api/cart/apply-discount"): apply_discount,
+    ("POST", "/api/cart/checkout"): checkout,
+}
+PUBLIC_ROUTES = {
+    ("GET", "/api/catalog"): catalog_api,
+    ("GET", "/api/cart/count"): get_cart_count,
+}
+
+
+class Application:
+    """Routes the async paths itself and hands everything else to Flask."""
+
+    def __init__(self, flask):
+        self.flask = flask
+        self.wsgi = WsgiToAsgi(flask)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] == "http":
+            key = (scope["method"], scope["path"])
+            if key in CART_ROUTES or key in PUBLIC_ROUTES:
+                return await self._dispatch(key, scope, receive, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if os.environ.get("CONFIG_SCHEMA_BOOTSTRAP", "1") != "0":
+                    # once per worker, before it accepts requests
+                    await asyncio.to_thread(bootstrap_schema)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await app.database.close_async_db()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _dispatch(self, key, scope, receive, send):
+        # Flask's hooks don't see these routes, so time them here
+        started = time.perf_counter()
+        body = b""
+        more = True
+        while more:
+            message = await receive()
+            body += message.get("body", b"")
+            more = message.get("more_body", False)
+            if len(body) > MAX_BODY_BYTES:
+                response = Response({"message": "Request too large."}, 413)
+                observe_request(key[0], key[1], 413, time.perf_counter() - started)
+                return await response.send(send)
+        request = Request(scope, body)
+
+        try:
+            if key in PUBLIC_ROUTES:
+                response = await PUBLIC_ROUTES[key](request)
+            else:
+                logged_in, owner = await current_owner(request, SESSIONS)
+                if not logged_in:
+                    # same as @login_required with login_view = "login"
+                    location = "/login?next=" + quote(request.path)
+                    response = Response(b"", 302, {"location": location})
+                elif owner is None:
+                    response = _no_cart()
+                else:
+                    response = await CART_ROUTES[key](request, owner)
+        except Exception as e:
+            print(e)
+            response = Response({"message": "Internal error"}, 500)
+        observe_request(key[0], key[1], response.status, time.perf_counter() - started)
+        await response.send(send)
+
+
+application = Application(flask_app)
@@ -0,0 +1,267 @@
+"""Cart request handling shared by the Flask views and the ASGI app.
+
+Everything here is plain Python: parsing and validating request bodies,
+turning them into cart operations (app.records.carts) and pricing a cart
+from ItemLine records. The sync views in app.routes.cart_api and the async
+ones in app.asgi only differ in how they talk to Mongo, so both always
+agree on what a request means and what a cart costs.
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+import app.database
+from app.discounts import apply_rule, discount_table
+from app.pricing import TAX_RATE_BP, line_total, quote
+from app.records.carts import CartState, add_ops, remove_ops, set_ops
+from app.records.repositories import ItemLine
+
+# carts are per user; browsers may keep a copy but must revalidate it
+CART_CACHE_CONTROL = "private, no-cache"
+
+BATCH_OPS = ("add", "update", "remove")
+MAX_BATCH_OPS = 100
+
+
+class CartInputError(ValueError):
+    """The request body doesn't describe a valid cart change (HTTP 400)."""
+
+
+def expected_version(data: dict) -> Optional[int]:
+    """Optional cart_version sent by the client for conflict detection."""
+    version = data.get("cart_version")
+    if version is None:
+        return None
+    try:
+        return int(version)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_product_id(data: dict) -> ObjectId:
+    product_id = data.get("product_id")
+    if not product_id:
+        raise CartInputError("Missing product_id.")
+    try:
+        return ObjectId(product_id)
+    except (InvalidId, TypeError):
+        raise CartInputError("Invalid product_id.")
+
+
+def parse_quantity(data: dict) -> int:
+    try:
+        return int(data.get("quantity", 1))
+    except (TypeError, ValueError):
+        raise CartInputError("Invalid quantity.")
+
+
+def parse_batch(data: dict) -> List[Tuple[str, ObjectId, int]]:
+    """Validate a /batch body into [(op, item id, quantity)]."""
+    raw_ops = data.get("ops")
+    if not isinstance(raw_ops, list) or not raw_ops:
+        raise CartInputError("Missing ops.")
+    if len(raw_ops) > MAX_BATCH_OPS:
+        raise CartInputError(f"At most {MAX_BATCH_OPS} ops per batch.")
+
+    parsed = []
+    for index, entry in enumerate(raw_ops):
+        if not isinstance(entry, dict) or entry.get("op") not in BATCH_OPS:
+            raise CartInputError(f"Op {index}: unknown op.")
+        try:
+            obj_id = ObjectId(entry.get("product_id"))
+            quantity = int(entry.get("quantity", 1))
+        except Exception:
+            raise CartInputError(f"Op {index}: invalid product_id or quantity.")
+        if entry["op"] == "add" and quantity < 1:
+            raise CartInputError(f"Op {index}: quantity must be at least 1.")
+        parsed.append((entry["op"], obj_id, quantity))
+    return parsed
+
+
+def batch_item_ids(parsed) -> List[ObjectId]:
+    """Items a batch needs to look up (removals don't)."""
+    return [obj_id for op, obj_id, _ in parsed if op != "remove"]
+
+
+def batch_ops(parsed, products: Dict[ObjectId, ItemLine]) -> list:
+    """Cart operations for a parsed batch; every added/updated item must exist."""
+    ops = []
+    for index, (op, obj_id, quantity) in enumerate(parsed):
+        if op == "remove":
+            ops += remove_ops(obj_id)
+        elif obj_id not in products:
+            raise CartInputError(f"Op {index}: invalid product.")
+        elif op == "add":
+            ops += add_ops(obj_id, quantity)
+        else:
+            ops += set_ops(obj_id, quantity)
+    return ops
+
+
+def changed_lines(cart_data: dict, parsed) -> dict:
+    """Swap the full item list for just the lines a batch touched."""
+    touched = {str(obj_id) for _, obj_id, _ in parsed}
+    lines = {line["product_id"]: line for line in cart_data.pop("items")}
+    cart_data["changed"] = [
+        lines.get(pid, {"product_id": pid, "quantity": 0}) for pid in sorted(touched)
+    ]
+    return cart_data
+
+
+def cart_item_ids(cart: CartState) -> List[ObjectId]:
+    ids = []
+    for pid in cart.lines:
+        try:
+            ids.append(ObjectId(pid))
+        except InvalidId:
+            pass  # Skip invalid IDs
+    return ids
+
+
+def price_cart(
+    cart: CartState, products: Dict[ObjectId, ItemLine], refresh_discounts: bool = True
+) -> dict:
+    """Cart totals as the API returns them; `products` from get_items_by_ids().
+
+    The cart only remembers the discount *code*; its rules come from the
+    in-memory discount table (app.discounts), so a code that expired or was
+    switched off stops applying on the next pricing. refresh_discounts=False
+    never touches Mongo (the async path refreshes the table on a thread).
+    """
+    line_items = []
+    priced = []  # (ItemLine, line total) for the discount pass
+    item_count = 0
+
+    if not cart.lines:
+        # Return empty cart structure
+        return {
+            "items": [],
+            "item_count": 0,
+            "subtotal_cents": 0,
+            "tax_cents": 0,
+            "total_cents": 0,
+            "cart_version": cart.version,
+        }
+
+    code = (cart.discount or {}).get("code")
+    rule = discount_table.get(code, refresh=refresh_discounts) if code else None
+
+    # Map by id for quick lookup
+    product_map = {str(oid): p for oid, p in products.items()}
+
+    for product_id, quantity in cart.lines.items():
+        product = product_map.get(product_id)
+        if not product:
+            # Product was deleted or missing then skip it
+            continue
+
+        # price_cents is already stored in cents in ItemModel
+        price_cents = product.price_cents
+        line_total_cents = line_total(price_cents, quantity)
+        priced.append((product, line_total_cents))
+        item_count += quantity
+
+        line_items.append(
+            {
+                "product_id": product_id,
+                "name": product.name,
+                "price_cents": price_cents,
+                # ItemLine falls back to a placeholder image for the love of the game
+                "image_url": product.image_url,
+                "quantity": quantity,
+                "total_price_cents": line_total_cents,
+                # kept on the order so reports can re-run a scoped discount
+                "discount_eligible": rule is not None and rule.applies_to(product),
+            }
+        )
+
+    # --- Discount handling: one pass, integer cents ---
+    subtotal_cents, _, discount_cents, discount_note = apply_rule(rule, priced)
+    applied = rule is not None and discount_cents > 0
+
+    # Tax (8.25%) applied after discount, rounded half up to the cent
+    totals = quote(subtotal_cents, discount_cents)
+
+    data = {
+        "items": line_items,
+        "item_count": item_count,
+        "subtotal_cents": totals.subtotal_cents,
+        "discount_cents": totals.discount_cents,
+        "tax_cents": totals.tax_cents,
+        "total_cents": totals.total_cents,
+        "discount_code": rule.code if applied else None,
+        "discount_percent": rule.percent_off if applied else 0,
+        "cart_version": cart.version,
+    }
+    if code and not applied:
+        data["discount_note"] = discount_note or f"Code {code} is no longer valid."
+    return data
+
+
+def check_discount(code: str, cart_data: dict, rule) -> Optional[str]:
+    """Why `code` can't be applied to a priced cart, or None if it can."""
+    if rule is None:
+        return "Invalid or expired code."
+    if cart_data.get("discount_code") != rule.code:
+        return (
+            cart_data.get("discount_note") or f"Code {code} doesn't apply to this cart."
+        )
+    return None
+
+
+def order_document(owner_id: str, cart_data: dict) -> dict:
+    """The order checkout inserts for a priced cart."""
+    return {
+        "owner": owner_id,
+        # list of {product_id, name, price_cents, quantity, total_price_cents, image_url}
+        "items": cart_data["items"],
+        "item_count": cart_data["item_count"],
+        "subtotal_cents": cart_data["subtotal_cents"],
+        "discount_cents": cart_data.get("discount_cents", 0),
+        "tax_cents": cart_data["tax_cents"],
+        "total_cents": cart_data["total_cents"],
+        "discount_code": cart_data.get("discount_code"),
+        "discount_percent": cart_data.get("discount_percent", 0),
+        # the rate this order was taxed at, so reports can re-run it exactly
+        "tax_rate_bp": TAX_RATE_BP,
+        "created_at": datetime.utcnow(),
+        "status": "pending",  # could be 'pending', 'paid', etc later
+    }
+
+
+def shortage_message(shortages: List[dict]) -> str:
+    names = ", ".join(line["name"] or line["product_id"] for line in shortages)
+    return f"Not enough stock for: {names}."
+
+
+def cart_etag(owner: ObjectId, version: int, *generations) -> str:
+    """Changes whenever the cart (version) or anything it is priced from does."""
+    return "-".join(str(part) for part in (owner, version) + generations)
+
+
+def pricing_generations() -> tuple:
+    """What a priced cart depends on besides the cart: items and discount codes."""
+    return (app.database.catalog_generation(), discount_table.version or 0)
+
+
+async def pricing_generations_async() -> tuple:
+    """pricing_generations() without blocking the event loop (app.asgi)."""
+    return (await app.database.catalog_generation_async(), discount_table.version or 0)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Does an If-None-Match header value name this (strong) ETag?"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
@@ -0,0 +1,103 @@
+"""Shop catalog queries: search, sort modes and keyset pages.
+
+The route only picks the sort mode and passes the page token through; the
+query is built here as an aggregation pipeline so every sort mode pages the
+same way.
+"""
+
+import os
+from typing import List, Optional, Tuple
+
+from app.pagination import decode_cursor, seek_filter, split_page
+from app.records.repositories import ItemCard
+from app.search import SCORE_FIELD, text_filter
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("CATALOG_PAGE_SIZE", "24"))
+MAX_PAGE_SIZE = int(os.environ.get("CATALOG_MAX_PAGE_SIZE", "96"))
+
+# every sort mode ends on _id so page boundaries are unambiguous
+SORT_MODES = {
+    "relevance": [(SCORE_FIELD, -1), ("_id", 1)],
+    "name": [("name", 1), ("_id", 1)],  # A → Z
+    "price_asc": [("price_cents", 1), ("_id", 1)],  # low → high
+    "price_desc": [("price_cents", -1), ("_id", -1)],  # high → low
+    "availability": [("stock", -1), ("_id", -1)],  # most available first
+}
+
+
+def resolve_sort(sort: Optional[str], q: str) -> str:
+    """Pick a valid sort mode. Searches default to best match."""
+    if not sort:
+        return "relevance" if q else "name"
+    if sort not in SORT_MODES or (sort == "relevance" and not q):
+        return "name"
+    return sort
+
+
+def clamp_page_size(value: Optional[int]) -> int:
+    if not value or value < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(value, MAX_PAGE_SIZE)
+
+
+def catalog_pipeline(q: str, sort: str, after: Optional[str], page_size: int) -> list:
+    """Aggregation pipeline for one catalog page (fetches one extra row)."""
+    spec = SORT_MODES[sort]
+    pipeline: list = []
+    if q:
+        # $text has to be the first stage
+        pipeline.append({"$match": text_filter(q)})
+        pipeline.append({"$addFields": {SCORE_FIELD: {"$meta": "textScore"}}})
+    values = decode_cursor(after, len(spec))
+    if values is not None:
+        pipeline.append({"$match": seek_filter(spec, values)})
+    pipeline.append({"$sort": dict(spec)})
+    pipeline.append({"$limit": page_size + 1})
+    # only what a product card shows (plus the score the page token needs)
+    project = ItemCard.project_stage()
+    if q:
+        project[SCORE_FIELD] = 1
+    pipeline.append({"$project": project})
+    return pipeline
+
+
+def catalog_page(
+    items, q: str, sort: str, after: Optional[str], page_size: int
+) -> Tuple[List[dict], Optional[str]]:
+    """Fetch a catalog page. Returns (documents, next page token or None).
+
+    The documents carry ItemCard's fields; see ItemCard.from_doc.
+    """
+    rows = list(items.aggregate(catalog_pipeline(q, sort, after, page_size)))
+    return split_page(rows, page_size, SORT_MODES[sort])
+
+
+async def catalog_page_async(
+    items, q: str, sort: str, after: Optional[str], page_size: int
+) -> Tuple[List[dict], Optional[str]]:
+    """catalog_page() on an AsyncMongoClient collection."""
+    cursor = await items.aggregate(catalog_pipeline(q, sort, after, page_size))
+    rows = await cursor.to_list()
+    return split_page(rows, page_size, SORT_MODES[sort])
+
+
+def catalog_args(
+    args, default_page_size: Optional[int] = None
+) -> Tuple[str, str, Optional[str], int]:
+    """(q, sort, after, page_size) from query string args (a dict-like)."""
+    q = (args.get("q") or "").strip()
+    sort = resolve_sort(args.get("sort"), q)
+    after = args.get("after")  # opaque keyset token, see app.pagination
+    try:
+        per_page = int(args.get("per_page") or 0)
+    except (TypeError, ValueError):
+        per_page = 0
+    return q, sort, after, clamp_page_size(per_page or default_page_size)
+
+
+def catalog_json(rows: List[dict], next_token: Optional[str]) -> dict:
+    """JSON body for /api/catalog."""
+    return {
+        "items": [ItemCard.from_doc(row).to_dict() for row in rows],
+        "next_token": next_token,
+    }
@@ -0,0 +1,547 @@
+"""Bulk catalog import and export.
+
+Rows come in as CSV (one column per ItemModel field, list fields separated
+by "|") or NDJSON (one item object per line). Each row is validated against
+ItemModel/ItemCategory and turned into an upsert: by `_id` when the row has
+one, otherwise by `name`. Upserts go out in unordered bulk_write batches so
+one bad row never stops the rest, and every rejected row is reported with
+its line number. Export streams the collection back out from a cursor in
+either format, so the output can be fed straight back into an import.
+bulk_edit() applies many per-item or filter-based price/stock changes the
+same way, in bulk_write batches instead of one update_one per item.
+
+    python -m app.catalog_bulk import items.csv
+    python -m app.catalog_bulk export items.ndjson
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+from decimal import Decimal, InvalidOperation
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import app.database
+from app.pricing import BP_PER_UNIT, factor_to_bp
+from app.records.repositories import ItemRepository, ItemRow
+from app.records.usermodel import ItemCategory
+
+FORMATS = ("csv", "ndjson")
+COLUMNS = ("_id",) + ItemRow.FIELDS
+LIST_FIELDS = ("image_urls", "tags")
+LIST_SEPARATOR = "|"
+
+DEFAULT_BATCH_SIZE = 1000
+# an import of a million junk rows should not answer with a million errors
+MAX_REPORTED_ERRORS = 1000
+
+
+class RowError(ValueError):
+    """A row that can't become an item."""
+
+
+def guess_format(filename: Optional[str], default: str = "csv") -> str:
+    if filename and filename.lower().endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if filename and filename.lower().endswith(".csv"):
+        return "csv"
+    return default
+
+
+def read_rows(stream: Iterable[str], fmt: str) -> Iterator[Tuple[int, object]]:
+    """Yield (line number, raw row) pairs without reading the whole input.
+
+    A line that isn't valid JSON is yielded as a RowError instead of a row
+    so the caller can report it alongside the validation errors.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "ndjson":
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, RowError(f"invalid JSON: {e}")
+                continue
+            yield line_no, row
+    else:
+        raise ValueError(f"unknown format {fmt!r}, expected one of {FORMATS}")
+
+
+def _int_field(raw: dict, name: str, default=None) -> int:
+    value = raw.get(name)
+    if value in (None, ""):
+        if default is None:
+            raise RowError(f"{name} is required")
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{name} must be an integer, got {value!r}")
+    if number < 0:
+        raise RowError(f"{name} must not be negative")
+    return number
+
+
+def _price_cents(raw: dict) -> int:
+    if raw.get("price_cents") not in (None, ""):
+        return _int_field(raw, "price_cents")
+    # convenience for hand-written files: "price" in dollars, e.g. 4.49
+    if raw.get("price") not in (None, ""):
+        try:
+            cents = Decimal(str(raw["price"])) * 100
+        except InvalidOperation:
+            raise RowError(f"price must be a number, got {raw['price']!r}")
+        if cents < 0 or cents != cents.to_integral_value():
+            raise RowError("price must be a non-negative amount in whole cents")
+        return int(cents)
+    raise RowError("price_cents is required")
+
+
+def _list_field(raw: dict, name: str) -> List[str]:
+    value = raw.get(name)
+    if value in (None, ""):
+        return []
+    if isinstance(value, str):
+        value = value.split(LIST_SEPARATOR)
+    if not isinstance(value, list):
+        raise RowError(f"{name} must be a list")
+    return [str(v).strip() for v in value if str(v).strip()]
+
+
+def _name(raw: dict) -> str:
+    name = str(raw.get("name") or "").strip()
+    if not name:
+        raise RowError("name is required")
+    return name
+
+
+def _category(raw: dict) -> str:
+    try:
+        return ItemCategory(
+            str(raw.get("category") or ItemCategory.OTHER).strip().lower()
+        ).value
+    except ValueError:
+        raise RowError(f"unknown category {raw.get('category')!r}")
+
+
+# ItemModel fields (minus _id) and how to clean each one from a raw row
+FIELD_CLEANERS = {
+    "name": _name,
+    "description": lambda raw: str(raw.get("description") or ""),
+    "price_cents": _price_cents,
+    "category": _category,
+    "stock": lambda raw: _int_field(raw, "stock", default=0),
+    "image_urls": lambda raw: _list_field(raw, "image_urls"),
+    "tags": lambda raw: _list_field(raw, "tags"),
+}
+
+
+def validate_row(raw) -> dict:
+    """Turn a raw CSV/NDJSON row into an ItemModel document (or raise RowError)."""
+    if isinstance(raw, RowError):
+        raise raw
+    if not isinstance(raw, dict):
+        raise RowError("row must be an object")
+
+    doc = {name: clean(raw) for name, clean in FIELD_CLEANERS.items()}
+    item_id = raw.get("_id")
+    if item_id not in (None, ""):
+        doc["_id"] = _object_id(item_id)
+    return doc
+
+
+def _object_id(value) -> ObjectId:
+    if isinstance(value, dict):  # {"$oid": ...} from a json_util export
+        value = value.get("$oid")
+    try:
+        return ObjectId(str(value))
+    except InvalidId:
+        raise RowError(f"invalid _id {value!r}")
+
+
+def upsert_key(doc: dict) -> tuple:
+    """What a row upserts on: its _id, or else its name."""
+    if "_id" in doc:
+        return ("_id", doc["_id"])
+    return ("name", doc["name"])
+
+
+def upsert_op(doc: dict) -> UpdateOne:
+    fields = {k: v for k, v in doc.items() if k != "_id"}
+    field, value = upsert_key(doc)
+    return UpdateOne({field: value}, {"$set": fields}, upsert=True)
+
+
+class ImportReport:
+    """What an import did; `errors` is [(line number, message)]."""
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.errors: List[Tuple[int, str]] = []
+
+    def error(self, line_no: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_no, message))
+
+    def to_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+            "errors": [{"line": line, "error": msg} for line, msg in self.errors],
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def _flush(items, batch: List[Tuple[int, UpdateOne]], report: ImportReport) -> None:
+    if not batch:
+        return
+    try:
+        result = items.bulk_write([op for _, op in batch], ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for err in details.get("writeErrors", []):
+            report.error(batch[err["index"]][0], err.get("errmsg", "write failed"))
+    upserted = details.get("nUpserted", 0)
+    matched = details.get("nMatched", 0)
+    modified = details.get("nModified", 0)
+    report.inserted += upserted
+    report.updated += modified
+    report.unchanged += matched - modified
+
+
+def import_items(
+    rows: Iterable[Tuple[int, object]],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    database=None,
+) -> ImportReport:
+    """Validate and upsert rows from read_rows(); returns an ImportReport."""
+    database = database if database is not None else app.database.get_db()
+    items = database["items"]
+    report = ImportReport()
+    batch: List[Tuple[int, UpdateOne]] = []
+    # upsert keys in `batch`: an unordered bulk would insert two rows with
+    # the same name twice (names aren't unique), so a repeat waits for the
+    # next batch and then updates the item the first one created
+    keys = set()
+    try:
+        for line_no, raw in rows:
+            report.rows += 1
+            try:
+                doc = validate_row(raw)
+            except RowError as e:
+                report.error(line_no, str(e))
+                continue
+            key = upsert_key(doc)
+            if key in keys or len(batch) >= batch_size:
+                _flush(items, batch, report)
+                batch, keys = [], set()
+            batch.append((line_no, upsert_op(doc)))
+            keys.add(key)
+        _flush(items, batch, report)
+    finally:
+        # cached cart lines and catalog pages may now be stale; the TTL
+        # covers other processes
+        app.database.item_cache.clear()
+        app.database.bump_catalog_generation()
+    return report
+
+
+# -- bulk edit ---------------------------------------------------------------
+
+# filters a filter-based edit may use, and the item field each one matches
+EDIT_FILTERS = {"category": "category", "tag": "tags", "item_ids": "_id"}
+MAX_PRICE_FACTOR = 10
+
+
+def clean_update_fields(fields) -> dict:
+    """Validate a partial ItemModel update; only FIELD_CLEANERS keys may change."""
+    if not isinstance(fields, dict) or not fields:
+        raise RowError("update_fields must be a non-empty object")
+    unknown = sorted(set(fields) - set(FIELD_CLEANERS))
+    if unknown:
+        raise RowError(f"fields can't be edited: {', '.join(unknown)}")
+    return {name: FIELD_CLEANERS[name](fields) for name in fields}
+
+
+def edit_op(entry) -> Tuple[ObjectId, UpdateOne]:
+    """{item_id, update_fields} -> UpdateOne on that item."""
+    if not isinstance(entry, dict) or "item_id" not in entry:
+        raise RowError("item_id is required")
+    item_id = _object_id(entry["item_id"])
+    fields = clean_update_fields(entry.get("update_fields"))
+    return item_id, UpdateOne({"_id": item_id}, {"$set": fields})
+
+
+def _percent_of_expr(amount, basis_points: int) -> dict:
+    # pricing.percent_of as an aggregation expression; Mongo's $round would
+    # round half to even, so this is (amount * bp + 5000) // 10000 instead
+    scaled = {"$add": [{"$multiply": [amount, basis_points]}, BP_PER_UNIT // 2]}
+    return {"$toInt": {"$floor": {"$divide": [scaled, BP_PER_UNIT]}}}
+
+
+def filter_op(entry) -> UpdateMany:
+    """A filter-based edit, e.g.
+
+        {"filter": {"category": "pantry"}, "price_factor": 0.9}
+        {"filter": {"tag": "coffee"}, "stock_delta": -5, "set": {"description": "..."}}
+
+    price_factor multiplies price_cents on the server, in integer basis
+    points and rounded half up to the cent like app.pricing.percent_of (so
+    0.9 turns 1995 into 1796); stock_delta adds to stock without letting it
+    drop below zero.
+    """
+    if not isinstance(entry, dict):
+        raise RowError("filter edit must be an object")
+    raw_filter = entry.get("filter")
+    if not isinstance(raw_filter, dict) or not raw_filter:
+        raise RowError("filter is required (category, tag and/or item_ids)")
+    unknown = sorted(set(raw_filter) - set(EDIT_FILTERS))
+    if unknown:
+        raise RowError(f"unknown filter keys: {', '.join(unknown)}")
+
+    match = {}
+    if "category" in raw_filter:
+        match["category"] = _category(raw_filter)
+    if "tag" in raw_filter:
+        match["tags"] = str(raw_filter["tag"]).strip()
+    if "item_ids" in raw_filter:
+        ids = raw_filter["item_ids"]
+        if not isinstance(ids, list) or not ids:
+            raise RowError("item_ids must be a non-empty list")
+        match["_id"] = {"$in": [_object_id(i) for i in ids]}
+
+    stage = {}
+    if entry.get("set"):
+        for name, value in clean_update_fields(entry["set"]).items():
+            # $literal so strings starting with "$" aren't read as field paths
+            stage[name] = {"$literal": value}
+    if entry.get("price_factor") is not None:
+        try:
+            factor = float(entry["price_factor"])
+        except (TypeError, ValueError):
+            raise RowError("price_factor must be a number")
+        if not 0 < factor <= MAX_PRICE_FACTOR:
+            raise RowError(f"price_factor must be in (0, {MAX_PRICE_FACTOR}]")
+        factor_bp = factor_to_bp(factor)
+        if factor_bp == 0:
+            raise RowError("price_factor is below one basis point")
+        stage["price_cents"] = _percent_of_expr("$price_cents", factor_bp)
+    if entry.get("stock_delta") is not None:
+        try:
+            delta = int(entry["stock_delta"])
+        except (TypeError, ValueError):
+            raise RowError("stock_delta must be an integer")
+        stage["stock"] = {"$max": [0, {"$add": [{"$ifNull": ["$stock", 0]}, delta]}]}
+    if not stage:
+        raise RowError("nothing to change: give set, price_factor or stock_delta")
+    # pipeline-style update so the new price/stock is computed from the old one
+    return UpdateMany(match, [{"$set": stage}])
+
+
+class EditReport:
+    """Counts plus only the entries that need attention (failed / not found)."""
+
+    def __init__(self):
+        self.requested = 0
+        self.matched = 0
+        self.modified = 0
+        self.skipped = 0
+        self.failed: List[dict] = []
+        self.not_found: List[str] = []
+
+    def to_dict(self) -> dict:
+        return {
+            "requested": self.requested,
+            "matched": self.matched,
+            "modified": self.modified,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "not_found": self.not_found,
+        }
+
+
+def _run_edits(
+    items, batch: List[Tuple[dict, object]], ordered: bool, report: EditReport
+) -> bool:
+    """Send one batch; returns False if an ordered run has to stop."""
+    if not batch:
+        return True
+    ops = [op for _, op in batch]
+    try:
+        details = items.bulk_write(ops, ordered=ordered).bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for err in details.get("writeErrors", []):
+            report.failed.append(
+                dict(batch[err["index"]][0], error=err.get("errmsg", "write failed"))
+            )
+        if ordered and details.get("writeErrors"):
+            # everything after the failing op in an ordered run never ran
+            report.skipped += len(batch) - details["writeErrors"][0]["index"] - 1
+            return False
+    report.matched += details.get("nMatched", 0)
+    report.modified += details.get("nModified", 0)
+
+    # bulk results are totals only; one _id lookup tells which items are missing
+    wanted = [ref["item_id"] for ref, _ in batch if "item_id" in ref]
+    if wanted:
+        found = {
+            str(doc["_id"])
+            for doc in items.find(
+                {"_id": {"$in": [ObjectId(i) for i in wanted]}}, {"_id": 1}
+            )
+        }
+        report.not_found.extend(i for i in wanted if i not in found)
+    return True
+
+
+def bulk_edit(
+    edits: Iterable = (),
+    filters: Iterable = (),
+    ordered: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    database=None,
+) -> EditReport:
+    """Apply many per-item and filter-based edits as bulk_write batches.
+
+    With ordered=True the edits run in the given order (filter edits after
+    the per-item ones) and stop at the first failure, like a single ordered
+    bulk_write; otherwise every valid edit is attempted.
+    """
+    database = database if database is not None else app.database.get_db()
+    items = database["items"]
+    report = EditReport()
+    entries = [("edit", i, e) for i, e in enumerate(edits)]
+    entries += [("filter", i, e) for i, e in enumerate(filters)]
+    batch: List[Tuple[dict, object]] = []
+    try:
+        for kind, index, entry in entries:
+            report.requested += 1
+            ref = {"kind": kind, "index": index}
+            try:
+                if kind == "edit":
+                    item_id, op = edit_op(entry)
+                    ref["item_id"] = str(item_id)
+                else:
+                    op = filter_op(entry)
+            except RowError as e:
+                report.failed.append(dict(ref, error=str(e)))
+                if ordered:
+                    report.skipped += len(entries) - report.requested
+                    break
+                continue
+            batch.append((ref, op))
+            if len(batch) >= batch_size:
+                ok = _run_edits(items, batch, ordered, report)
+                batch = []
+                if not ok:
+                    report.skipped += len(entries) - report.requested
+                    break
+        # an ordered run that stopped on a bad entry still applies what came before it
+        _run_edits(items, batch, ordered, report)
+    finally:
+        app.database.item_cache.clear()
+        app.database.bump_catalog_generation()
+    return report
+
+
+def export_items(
+    fmt: str, batch_size: int = DEFAULT_BATCH_SIZE, database=None
+) -> Iterator[str]:
+    """Yield the catalog as CSV or NDJSON text chunks, straight from a cursor."""
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format {fmt!r}, expected one of {FORMATS}")
+    database = database if database is not None else app.database.get_db()
+    rows = ItemRepository(database).iter(
+        ItemRow, sort=[("_id", 1)], batch_size=batch_size
+    )
+
+    if fmt == "ndjson":
+        for row in rows:
+            yield json.dumps(row.to_dict(), default=str) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    writer.writeheader()
+    for count, row in enumerate(rows, start=1):
+        doc = row.to_dict()
+        doc["_id"] = str(doc["_id"])
+        for name in LIST_FIELDS:
+            doc[name] = LIST_SEPARATOR.join(doc[name])
+        writer.writerow(doc)
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.catalog_bulk")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument(
+        "path", nargs="?", help="file to read/write (default stdin/stdout)"
+    )
+    parser.add_argument(
+        "--format", choices=FORMATS, help="default: from the file extension, else csv"
+    )
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    if app.database.get_db() is None:
+        print("pymongo not installed")
+        return 1
+    fmt = args.format or guess_format(args.path)
+
+    if args.command == "export":
+        out = (
+            open(args.path, "w", newline="", encoding="utf-8")
+            if args.path
+            else sys.stdout
+        )
+        try:
+            for chunk in export_items(fmt, args.batch_size):
+                out.write(chunk)
+        finally:
+            if args.path:
+                out.close()
+        return 0
+
+    source = open(args.path, newline="", encoding="utf-8") if args.path else sys.stdin
+    try:
+        report = import_items(read_rows(source, fmt), args.batch_size)
+    finally:
+        if args.path:
+            source.close()
+    for line_no, message in report.errors:
+        print(f"line {line_no}: {message}", file=sys.stderr)
+    print(
+        f"{report.rows} rows: {report.inserted} inserted, {report.updated} updated, "
+        f"{report.unchanged} unchanged, {report.failed} failed"
+    )
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
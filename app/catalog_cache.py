@@ -0,0 +1,76 @@
+"""Rendered catalog pages, cached per catalog generation and served with ETags.
+
+A page is cached under (generation, viewer, q, sort, page token, page size).
+The generation comes from app.database.catalog_generation() and moves on
+every item write, so edited pages are simply never looked up again and age
+out of the LRU. "viewer" is the only per-user thing base.html renders (guest,
+shopper or admin nav), so one entry serves every shopper.
+
+Every cached response carries a strong ETag (hash of the body). Browsers
+and a fronting proxy revalidate with If-None-Match and get 304 Not Modified
+until the catalog changes. Pages for guests are `public`; pages for a
+logged-in user are `private` so a shared proxy never mixes up the nav bar.
+Requests with pending flash messages skip the cache entirely, because the
+message is part of the page and must only be shown once.
+"""
+
+import hashlib
+import os
+from typing import Callable, Optional, Tuple
+
+from flask import make_response, request, session
+from flask_login import current_user
+
+import app.database
+from app.cache import TTLCache
+
+page_cache = TTLCache(
+    "catalog_pages",
+    max_size=int(os.environ.get("CATALOG_CACHE_SIZE", "512")),
+    # stock only changes the availability sort order, so checkouts don't bump
+    # the generation; the TTL bounds how stale that order can get
+    ttl=float(os.environ.get("CATALOG_CACHE_TTL_SECONDS", "60")),
+)
+
+# browsers revalidate every time; 304s keep that cheap
+PUBLIC_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+PRIVATE_CACHE_CONTROL = "private, max-age=0, must-revalidate"
+
+
+def viewer() -> str:
+    """Which variant of the nav bar this request sees."""
+    if not current_user.is_authenticated:
+        return "guest"
+    get_permissions = getattr(current_user, "get_permissions", None)
+    if get_permissions is not None and get_permissions() == "admin":
+        return "admin"
+    return "user"
+
+
+def strong_etag(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def cached_page(key: Tuple, render: Callable[[], str]):
+    """Serve `render()` for `key` from the page cache, with ETag/304 handling."""
+    if session.get("_flashes"):
+        response = make_response(render())
+        response.headers["Cache-Control"] = "no-store"
+        return response
+
+    who = viewer()
+    full_key = (app.database.catalog_generation(), who) + tuple(key)
+    entry: Optional[Tuple[bytes, str]] = page_cache.get(full_key)
+    if entry is None:
+        body = render().encode("utf-8")
+        entry = (body, strong_etag(body))
+        page_cache.put(full_key, entry)
+
+    body, etag = entry
+    response = make_response(body)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = (
+        PUBLIC_CACHE_CONTROL if who == "guest" else PRIVATE_CACHE_CONTROL
+    )
+    response.vary.add("Cookie")
+    return response.make_conditional(request)
@@ -1,17 +1,32 @@
-from app.records.keys import db_key_get_or_create
-from app.records.keymodel import Key
+"""Cookie/token signing for the app.
 
-from ecdsa import SigningKey, VerifyingKey, NIST384p
+The backend is chosen with COOKIE_SIGNER_ALGORITHM (hmac-sha256, ed25519 or
+ecdsa-p384, see app.signers). Keys live in the `keys` collection and are only
+loaded the first time something is signed or verified.
+"""
 
-cookie_key: Key = db_key_get_or_create("cookie_key")
+import os
 
-private = SigningKey.from_string(cookie_key["private"].encode(), curve=NIST384p)
-public = VerifyingKey.from_string(cookie_key["public"].encode(), curve=NIST384p)
+from app.records.keys import db_key_get_or_create, db_key_rotate
+from app.signers import DEFAULT_ALGORITHM, Signer
+
+COOKIE_KEY_NAME = "cookie_key"
+ALGORITHM = os.environ.get("COOKIE_SIGNER_ALGORITHM", DEFAULT_ALGORITHM)
+
+cookie_signer = Signer(
+    COOKIE_KEY_NAME, loader=lambda: db_key_get_or_create(COOKIE_KEY_NAME, ALGORITHM)
+)
 
 
 def cookie_sign(cookie: str) -> str:
-    return private.sign(cookie.encode()).decode()
+    return cookie_signer.sign(cookie)
 
 
 def cookie_verify(cookie: str, signature: str) -> bool:
-    return public.verify(signature=signature.encode(), data=cookie.encode())
+    return cookie_signer.verify(cookie, signature)
+
+
+def rotate_cookie_key(keep: int = 2) -> None:
+    """Start signing with a fresh key; the previous `keep - 1` still verify."""
+    db_key_rotate(COOKIE_KEY_NAME, ALGORITHM, keep=keep)
+    cookie_signer.reload()
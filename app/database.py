@@ -1,49 +1,336 @@
+import asyncio
 import os
+import threading
+import time
+
+from app import metrics
+from app.cache import TTLCache
+from app.records.repositories import ItemLine, ItemRepository
 
 try:
-    from pymongo import MongoClient
+    from pymongo import MongoClient, ReturnDocument, monitoring
     from bson import ObjectId
 except Exception:
     MongoClient = None  # pymongo not installed yet or not needed
+    ReturnDocument = None
+    monitoring = None
     ObjectId = None
 
+try:
+    from pymongo import AsyncMongoClient  # pymongo >= 4.9, used by app.asgi
+except Exception:
+    AsyncMongoClient = None
+
 MONGO_URI = (
     f"mongodb://{os.environ.get('CONFIG_MONGODB_USERNAME','devroot')}:"
     f"{os.environ.get('CONFIG_MONGODB_PASSWORD','devroot')}@"
     f"{os.environ.get('CONFIG_MONGODB_IP','127.0.0.1')}:"
     f"{os.environ.get('CONFIG_MONGODB_PORT','27017')}"
 )
+DATABASE_NAME = os.environ.get("CONFIG_MONGODB_DATABASE", "project")
+
+# Connection pool settings, all overridable from the environment
+POOL_OPTIONS = {
+    "maxPoolSize": int(os.environ.get("CONFIG_MONGODB_MAX_POOL_SIZE", "50")),
+    "minPoolSize": int(os.environ.get("CONFIG_MONGODB_MIN_POOL_SIZE", "0")),
+    "maxIdleTimeMS": int(os.environ.get("CONFIG_MONGODB_MAX_IDLE_MS", "60000")),
+    "waitQueueTimeoutMS": int(os.environ.get("CONFIG_MONGODB_WAIT_QUEUE_MS", "2000")),
+    "maxConnecting": int(os.environ.get("CONFIG_MONGODB_MAX_CONNECTING", "2")),
+    "serverSelectionTimeoutMS": int(
+        os.environ.get("CONFIG_MONGODB_SELECTION_TIMEOUT_MS", "2000")
+    ),
+}
+
 db = None  # stays None until we init (or if Mongo isn't running)
 
+# Cart-sized item records (app.records.repositories.ItemLine) keyed by
+# ObjectId. Only the admin endpoints change items, and they call
+# invalidate_item(); other processes pick changes up within the TTL, so
+# checkout reads with fresh=True and never charges a cached price.
+item_cache = TTLCache(
+    "items",
+    max_size=int(os.environ.get("ITEM_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("ITEM_CACHE_TTL_SECONDS", "300")),
+)
 
-def init_db() -> bool:
-    """Try to connect to Mongo. Returns True if connected."""
-    global db
+# Catalog generation: a counter in `counters` bumped by every item write, so
+# cached catalog pages (app.catalog_cache) know when they are stale. Each
+# process re-reads it at most every CATALOG_GENERATION_TTL_SECONDS.
+CATALOG_GENERATION_TTL = float(os.environ.get("CATALOG_GENERATION_TTL_SECONDS", "2"))
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+# the asyncio client is bound to the event loop that first used it
+_async_client = None
+_async_client_loop = None
+
+
+if monitoring is not None:
+
+    class PoolStats(monitoring.ConnectionPoolListener):
+        """Counts connection pool events so we can see how the pool behaves."""
+
+        def __init__(self):
+            self._lock = threading.Lock()
+            self.reset()
+
+        def reset(self):
+            with self._lock:
+                self.created = 0
+                self.closed = 0
+                self.checked_out = 0
+                self.checkout_failed = 0
+                self.pool_cleared = 0
+                self.in_use = 0
+
+        def _bump(self, **deltas):
+            with self._lock:
+                for name, delta in deltas.items():
+                    setattr(self, name, getattr(self, name) + delta)
+
+        def pool_created(self, event):
+            pass
+
+        def pool_ready(self, event):
+            pass
+
+        def pool_cleared(self, event):
+            self._bump(pool_cleared=1)
+
+        def pool_closed(self, event):
+            pass
+
+        def connection_created(self, event):
+            self._bump(created=1)
+
+        def connection_ready(self, event):
+            pass
+
+        def connection_closed(self, event):
+            self._bump(closed=1)
+
+        def connection_check_out_started(self, event):
+            pass
+
+        def connection_check_out_failed(self, event):
+            self._bump(checkout_failed=1)
+
+        def connection_checked_out(self, event):
+            self._bump(checked_out=1, in_use=1)
+
+        def connection_checked_in(self, event):
+            self._bump(in_use=-1)
+
+        def snapshot(self) -> dict:
+            with self._lock:
+                return {
+                    "connections_created": self.created,
+                    "connections_closed": self.closed,
+                    "connections_open": self.created - self.closed,
+                    "connections_in_use": self.in_use,
+                    "checkouts": self.checked_out,
+                    "checkout_failures": self.checkout_failed,
+                    "pool_clears": self.pool_cleared,
+                }
+
+    pool_listener = PoolStats()
+
+    class CommandTimings(monitoring.CommandListener):
+        """Feeds per-command, per-collection latency and errors to app.metrics."""
+
+        def __init__(self):
+            # (connection, request id) -> (command, collection) until it finishes
+            self._pending: dict = {}
+            # listeners are called from every thread that runs a command
+            self._lock = threading.Lock()
+
+        def started(self, event):
+            command = event.command
+            target = command.get(event.command_name)
+            if not isinstance(target, str):
+                # getMore names the cursor, the collection is a separate field
+                target = command.get("collection", "")
+            if not isinstance(target, str):
+                target = ""
+            with self._lock:
+                self._pending[(event.connection_id, event.request_id)] = (
+                    event.command_name,
+                    target,
+                )
+
+        def _finish(self, event):
+            with self._lock:
+                return self._pending.pop(
+                    (event.connection_id, event.request_id), (event.command_name, "")
+                )
+
+        def succeeded(self, event):
+            command, collection = self._finish(event)
+            metrics.MONGO_COMMAND_SECONDS.observe(
+                event.duration_micros / 1e6, command, collection
+            )
+
+        def failed(self, event):
+            command, collection = self._finish(event)
+            metrics.MONGO_COMMAND_SECONDS.observe(
+                event.duration_micros / 1e6, command, collection
+            )
+            metrics.MONGO_COMMAND_ERRORS.inc(command, collection)
+
+    command_listener = CommandTimings()
+else:
+    pool_listener = None
+    command_listener = None
+
+
+def _event_listeners() -> list:
+    return [l for l in (pool_listener, command_listener) if l is not None]
+
+
+def get_client():
+    """Return the process-wide MongoClient, creating it on first use.
+
+    pymongo clients are not fork-safe, so if we notice the pid changed
+    (gunicorn/uwsgi forking after import) we throw the inherited client away
+    and build a fresh pool for this process.
+    """
+    global _client, _client_pid, db
     if MongoClient is None:
-        print("pymongo not installed")
+        return None
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            if pool_listener is not None:
+                pool_listener.reset()
+            _client = MongoClient(
+                MONGO_URI,
+                event_listeners=_event_listeners(),
+                connect=False,
+                **POOL_OPTIONS,
+            )
+            _client_pid = pid
+            db = _client[DATABASE_NAME]
+    return _client
+
+
+def get_db():
+    """Return the pooled database handle, or None if pymongo is missing.
+
+    This is cheap: after the first call it is just a pid check.
+    """
+    if get_client() is None:
+        return None
+    return db
+
+
+def close_db() -> None:
+    """Close the pool for this process (tests, CLI scripts, shutdown)."""
+    global _client, _client_pid, db
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
         db = None
-        return False
+
+
+# close() tasks for replaced async clients, kept so they aren't collected early
+_closing = set()
+
+
+async def _close_quietly(client) -> None:
     try:
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
-        # Optional ping: client.admin.command("ping")
-        db = client[os.environ.get("CONFIG_MONGODB_DATABASE", "project")]
+        await client.close()
+    except Exception as e:
+        print(e)
+
+
+def _discard_async_client(client, loop) -> None:
+    """Close a client left behind by another event loop, without waiting."""
+    if loop is not None and loop.is_running() and not loop.is_closed():
+        # its sockets belong to that loop, so close it there
+        asyncio.run_coroutine_threadsafe(_close_quietly(client), loop)
+        return
+    task = asyncio.get_running_loop().create_task(_close_quietly(client))
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
 
-        print(f"{client.HOST}:{db.client.PORT}")
-        print(client.list_database_names())
-        print(db.list_collection_names())
+
+def get_async_db():
+    """Database handle on the AsyncMongoClient for the running event loop.
+
+    Same URI and pool settings as get_client(). Call it from a coroutine;
+    returns None if this pymongo has no async client.
+    """
+    global _async_client, _async_client_loop
+    if AsyncMongoClient is None:
+        return None
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        if _async_client is not None:
+            _discard_async_client(_async_client, _async_client_loop)
+        # only command timings: PoolStats counts the sync pool
+        _async_client = AsyncMongoClient(
+            MONGO_URI,
+            event_listeners=[command_listener] if command_listener else [],
+            connect=False,
+            **POOL_OPTIONS,
+        )
+        _async_client_loop = loop
+    return _async_client[DATABASE_NAME]
+
+
+async def close_async_db() -> None:
+    global _async_client, _async_client_loop
+    if _async_client is not None:
+        await _async_client.close()
+    _async_client = None
+    _async_client_loop = None
+
+
+def pool_stats() -> dict:
+    """Connection pool counters plus the configured limits, for monitoring."""
+    stats = pool_listener.snapshot() if pool_listener is not None else {}
+    stats["pid"] = os.getpid()
+    stats["connected"] = _client is not None and _client_pid == os.getpid()
+    stats["options"] = dict(POOL_OPTIONS)
+    return stats
+
+
+def init_db() -> bool:
+    """Make sure the pooled client exists. Returns True if it is usable.
+
+    Kept for older callers; it no longer opens a new connection each time.
+    Use ping_db() when you actually need to know the server is up.
+    """
+    return get_db() is not None
+
+
+def ping_db() -> bool:
+    """Round trip to the server. Only for startup/health checks, not per request."""
+    database = get_db()
+    if database is None:
+        print("pymongo not installed")
+        return False
+    try:
+        database.client.admin.command("ping")
         return True
     except Exception as e:
-        db = None
         print(e)
         return False
 
 
 def get_items(limit: int = 100):
     """Return list of items from the database (as dictionaries)."""
-    if db is None:
+    database = get_db()
+    if database is None:
         return [] # return nothing if db isn't initialized
     try:
-        cursor = db["items"].find().limit(limit)
+        cursor = database["items"].find().limit(limit)
         items = []
         for doc in cursor:
             doc["_id"] = str(doc["_id"])  # Convert ObjectId to string for JSON/templates
@@ -54,6 +341,155 @@ def get_items(limit: int = 100):
         return []
 
 
+def _as_object_id(item_id):
+    if isinstance(item_id, ObjectId):
+        return item_id
+    try:
+        return ObjectId(item_id)
+    except Exception:
+        return None
+
+
+def cache_items(docs) -> None:
+    """Prime the item cache with documents already read for another reason.
+
+    The documents need at least the ItemLine fields.
+    """
+    for doc in docs:
+        if isinstance(doc.get("_id"), ObjectId):
+            item_cache.put(doc["_id"], ItemLine.from_doc(doc))
+
+
+def get_items_by_ids(item_ids, fresh: bool = False) -> dict:
+    """Read-through lookup of several items. Returns {ObjectId: ItemLine}.
+
+    Invalid ids and missing items are simply absent from the result. With
+    fresh=True every item is read from Mongo (and re-cached).
+    """
+    ids = {oid for oid in map(_as_object_id, item_ids) if oid is not None}
+    found = {} if fresh else item_cache.get_many(ids)
+    missing = [oid for oid in ids if oid not in found]
+    if missing:
+        database = get_db()
+        if database is not None:
+            fetched = ItemRepository(database).get_many(ItemLine, missing)
+            for oid, line in fetched.items():
+                item_cache.put(oid, line)
+            found.update(fetched)
+    return found
+
+
+async def get_items_by_ids_async(item_ids, fresh: bool = False) -> dict:
+    """get_items_by_ids() on the async client, sharing the same item cache."""
+    ids = {oid for oid in map(_as_object_id, item_ids) if oid is not None}
+    found = {} if fresh else item_cache.get_many(ids)
+    missing = [oid for oid in ids if oid not in found]
+    if missing:
+        database = get_async_db()
+        if database is not None:
+            cursor = database["items"].find({"_id": {"$in": missing}}, ItemLine.projection())
+            for doc in await cursor.to_list():
+                line = ItemLine.from_doc(doc)
+                item_cache.put(line.id, line)
+                found[line.id] = line
+    return found
+
+
+def get_item(item_id):
+    """Read-through lookup of one item, or None if it doesn't exist."""
+    oid = _as_object_id(item_id)
+    if oid is None:
+        return None
+    return get_items_by_ids([oid]).get(oid)
+
+
+def invalidate_item(item_id) -> None:
+    oid = _as_object_id(item_id)
+    if oid is not None:
+        item_cache.invalidate(oid)
+
+
+class Generation:
+    """A counter in `counters` that writers bump and readers poll.
+
+    Readers re-read it at most every `ttl` seconds, so a cache keyed or
+    stamped with the generation notices writes made by other processes
+    within the TTL, for one small read per TTL per process.
+    """
+
+    def __init__(self, counter_id: str, ttl: float):
+        self.counter_id = counter_id
+        self.ttl = ttl
+        self._value = (0, float("-inf"))  # (value, monotonic time it was read)
+
+    def get(self) -> int:
+        value, read_at = self._value
+        now = time.monotonic()
+        if now - read_at < self.ttl:
+            return value
+        database = get_db()
+        if database is None:
+            return value
+        try:
+            doc = database["counters"].find_one({"_id": self.counter_id})
+        except Exception as e:
+            print(e)
+            return value
+        self._value = (doc["value"] if doc else 0, now)
+        return self._value[0]
+
+    async def get_async(self) -> int:
+        """get() on the async client, for code running on an event loop."""
+        value, read_at = self._value
+        now = time.monotonic()
+        if now - read_at < self.ttl:
+            return value
+        database = get_async_db()
+        if database is None:
+            return value
+        try:
+            doc = await database["counters"].find_one({"_id": self.counter_id})
+        except Exception as e:
+            print(e)
+            return value
+        self._value = (doc["value"] if doc else 0, now)
+        return self._value[0]
+
+    def bump(self) -> None:
+        database = get_db()
+        if database is None:
+            return
+        try:
+            doc = database["counters"].find_one_and_update(
+                {"_id": self.counter_id},
+                {"$inc": {"value": 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except Exception as e:
+            print(e)
+            return
+        self._value = (doc["value"], time.monotonic())
+
+
+catalog_counter = Generation("catalog", CATALOG_GENERATION_TTL)
+
+
+def catalog_generation() -> int:
+    """Current catalog generation (changes whenever any item changes)."""
+    return catalog_counter.get()
+
+
+async def catalog_generation_async() -> int:
+    """catalog_generation() for coroutines: the occasional re-read uses the async client."""
+    return await catalog_counter.get_async()
+
+
+def bump_catalog_generation() -> None:
+    """Call after any write to items; other processes see it within the TTL."""
+    catalog_counter.bump()
+
+
 # this function creates a new mongoDB item
 # it follows the ItemModel structure from usermodel.py
 def create_item(name, description, price_cents, category, stock, image_urls, tags):
@@ -67,7 +503,8 @@ def create_item(name, description, price_cents, category, stock, image_urls, tag
     # stock: int
     # image_urls: List[str]
     # tags: List[str]
-    if db is None:
+    database = get_db()
+    if database is None:
         print("Database not initialized")
         return None
     try:
@@ -80,26 +517,47 @@ def create_item(name, description, price_cents, category, stock, image_urls, tag
             "image_urls": image_urls,
             "tags": tags
         }
-        result = db["items"].insert_one(item)
+        result = database["items"].insert_one(item)
+        bump_catalog_generation()
         return result.inserted_id
     except Exception as e:
         print(e)
 
 def update_item(item_id, update_fields):
     """Update an existing item in the database. Returns True if successful, False otherwise."""
-    if db is None:
+    database = get_db()
+    if database is None:
         print("Database not initialized")
         return False
     try:
-        result = db["items"].update_one(
+        result = database["items"].update_one(
             {"_id": ObjectId(item_id)},
             {"$set": update_fields}
         )
+        invalidate_item(item_id)
+        if result.modified_count:
+            bump_catalog_generation()
         return result.modified_count > 0
     except Exception as e:
         print(e)
         return False
 
+def delete_item(item_id):
+    """Delete an item. Returns True if something was deleted."""
+    database = get_db()
+    if database is None:
+        print("Database not initialized")
+        return False
+    try:
+        result = database["items"].delete_one({"_id": ObjectId(item_id)})
+        invalidate_item(item_id)
+        if result.deleted_count:
+            bump_catalog_generation()
+        return result.deleted_count > 0
+    except Exception as e:
+        print(e)
+        return False
+
 """
 from bson import ObjectId
 import pymongo
@@ -0,0 +1,186 @@
+"""Discount codes: an in-memory rule table and a single-pass evaluator.
+
+Every active code in `discount_codes` is loaded once per process and
+compiled into a DiscountRule. Its scope (categories, tags, item ids) becomes
+one predicate over ItemLine, and its minimum spend and start/expiry window
+become plain comparisons. Entering a code or pricing a cart is then a dict
+lookup plus one pass over the cart lines, with no database round trip.
+
+The table reloads when the `discounts` counter in `counters` changes.
+Anything that edits discount codes calls bump_discount_version(), and each
+process checks the counter at most every DISCOUNT_VERSION_TTL_SECONDS.
+
+A discount document looks like:
+
+    {"code": "COFFEE20", "percent_off": 20, "is_active": true,
+     "description": "20% off all coffee items.",
+     "scope": {"tags": ["coffee"]},           # optional, default: whole cart
+     "min_subtotal_cents": 2000,              # optional
+     "starts_at": ISODate(...), "expires_at": ISODate(...)}  # optional
+
+All money math is in integer cents via app.pricing; percentages are applied
+in basis points and rounded half up.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import app.database
+from app.pricing import percent_of, percent_to_bp
+from app.records.repositories import DiscountCode, DiscountCodeRepository, ItemLine
+
+VERSION_TTL = float(os.environ.get("DISCOUNT_VERSION_TTL_SECONDS", "5"))
+COUNTER_ID = "discounts"
+
+
+def _compile_scope(scope: dict) -> Callable[[ItemLine], bool]:
+    """One predicate for "does this item qualify", built from the scope."""
+    categories = frozenset(str(c).lower() for c in scope.get("categories") or ())
+    tags = frozenset(str(t).lower() for t in scope.get("tags") or ())
+    item_ids = frozenset(str(i) for i in scope.get("item_ids") or ())
+    if not (categories or tags or item_ids):
+        return lambda item: True
+
+    checks = []
+    if categories:
+        checks.append(lambda item: (item.category or "").lower() in categories)
+    if tags:
+        checks.append(lambda item: any(t.lower() in tags for t in item.tags or ()))
+    if item_ids:
+        checks.append(lambda item: str(item.id) in item_ids)
+    if len(checks) == 1:
+        return checks[0]
+    return lambda item: any(check(item) for check in checks)
+
+
+class DiscountRule:
+    """A compiled discount code."""
+
+    __slots__ = (
+        "code",
+        "percent_off",
+        "basis_points",
+        "description",
+        "applies_to",
+        "min_subtotal_cents",
+        "starts_at",
+        "expires_at",
+    )
+
+    def __init__(self, record: DiscountCode):
+        self.code = record.code
+        self.percent_off = record.percent_off
+        self.basis_points = percent_to_bp(record.percent_off)
+        self.description = record.description
+        self.applies_to = _compile_scope(record.scope)
+        self.min_subtotal_cents = record.min_subtotal_cents
+        self.starts_at = record.starts_at
+        self.expires_at = record.expires_at
+
+    def is_live(self, now: Optional[datetime] = None) -> bool:
+        now = now or datetime.utcnow()
+        if self.starts_at is not None and now < self.starts_at:
+            return False
+        if self.expires_at is not None and now >= self.expires_at:
+            return False
+        return True
+
+    def evaluate(
+        self, subtotal_cents: int, eligible_cents: int, now: Optional[datetime] = None
+    ) -> Tuple[int, Optional[str]]:
+        """(discount in cents, why it doesn't apply or None)."""
+        now = now or datetime.utcnow()
+        if self.starts_at is not None and now < self.starts_at:
+            return 0, f"Code {self.code} isn't active yet."
+        if not self.is_live(now):
+            return 0, f"Code {self.code} has expired."
+        if subtotal_cents < self.min_subtotal_cents:
+            needed = self.min_subtotal_cents / 100
+            return 0, f"Code {self.code} needs a subtotal of at least ${needed:.2f}."
+        if eligible_cents <= 0:
+            return 0, f"Code {self.code} doesn't apply to anything in your cart."
+        return percent_of(eligible_cents, self.basis_points), None
+
+
+def apply_rule(
+    rule: Optional[DiscountRule], lines: Iterable[Tuple[ItemLine, int]]
+) -> Tuple[int, int, int, Optional[str]]:
+    """One pass over (item, line total cents) pairs.
+
+    Returns (subtotal, eligible subtotal, discount, problem or None).
+    """
+    subtotal = eligible = 0
+    for item, line_total in lines:
+        subtotal += line_total
+        if rule is not None and rule.applies_to(item):
+            eligible += line_total
+    if rule is None:
+        return subtotal, 0, 0, None
+    discount, problem = rule.evaluate(subtotal, eligible)
+    return subtotal, eligible, discount, problem
+
+
+class DiscountTable:
+    """All active codes, compiled, keyed by upper-case code."""
+
+    def __init__(self, ttl: float = VERSION_TTL):
+        self.ttl = ttl
+        self.version: Optional[int] = None
+        self._rules: Dict[str, DiscountRule] = {}
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def refresh_due(self) -> bool:
+        return time.monotonic() - self._checked_at >= self.ttl
+
+    def refresh(self, force: bool = False) -> None:
+        """Reload the codes if the stored version moved (or force)."""
+        database = app.database.get_db()
+        if database is None:
+            return
+        with self._lock:
+            # whoever held the lock may have just refreshed; don't repeat it
+            if not force and not self.refresh_due():
+                return
+            try:
+                doc = database["counters"].find_one({"_id": COUNTER_ID})
+                version = doc["value"] if doc else 0
+                if force or version != self.version or self.version is None:
+                    records = DiscountCodeRepository(database).all_active()
+                    self._rules = {
+                        (r.code or "").upper(): DiscountRule(r)
+                        for r in records
+                        if r.code
+                    }
+                    self.version = version
+            except Exception as e:
+                print(e)
+            self._checked_at = time.monotonic()
+
+    def get(self, code: Optional[str], refresh: bool = True) -> Optional[DiscountRule]:
+        """Compiled rule for an active code (refresh=False never touches Mongo)."""
+        if refresh and self.refresh_due():
+            self.refresh()
+        if not code:
+            return None
+        return self._rules.get(code.strip().upper())
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+
+discount_table = DiscountTable()
+
+
+def bump_discount_version() -> None:
+    """Call after editing discount_codes; every process reloads within the TTL."""
+    database = app.database.get_db()
+    if database is None:
+        return
+    database["counters"].update_one(
+        {"_id": COUNTER_ID}, {"$inc": {"value": 1}}, upsert=True
+    )
+    discount_table.refresh(force=True)
@@ -0,0 +1,326 @@
+"""Request, Mongo and cache metrics in Prometheus text format.
+
+GET /metrics returns, for this worker process:
+
+    http_requests_total / http_request_duration_seconds   {method, route, status}
+    mongodb_command_duration_seconds                      {command, collection}
+    mongodb_command_errors_total                          {command, collection}
+    mongodb_pool_*                                        connection pool gauges
+    cache_*                                               every TTLCache in CACHES
+
+Request timings come from Flask request hooks (init_metrics; recorded on
+teardown, so unhandled exceptions count as 500s) and from app.asgi for the routes it serves itself. Mongo timings come from
+the CommandListener that app.database registers on its clients. Recording
+costs one lock and a short bucket search per observation. Pool and cache
+numbers are only read when /metrics is scraped.
+
+Counters live in process memory, so with several workers each one is
+scraped (or summed) separately, as with the other monitoring endpoints.
+The endpoint is off (403) until METRICS_TOKEN is set, and then requires
+`Authorization: Bearer <token>`.
+"""
+
+import bisect
+import hmac
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from app.cache import cache_stats
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; requests and Mongo commands are mostly in the 1ms-1s range
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+# route label for requests that matched no route (keeps label values bounded)
+UNMATCHED_ROUTE = "<unmatched>"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram; observe() is one bisect and a few adds."""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [
+                (labels, list(counts), total)
+                for labels, (counts, total) in self._series.items()
+            ]
+        bounds = self.buckets + (float("inf"),)
+        for labels, counts, total in series:
+            running = 0
+            for bound, count in zip(bounds, counts):
+                running += count
+                le = 'le="' + _number(float(bound)) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {running}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {running}"
+
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled.", ("method", "route", "status")
+)
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests.",
+    ("method", "route", "status"),
+)
+MONGO_COMMAND_SECONDS = Histogram(
+    "mongodb_command_duration_seconds",
+    "Time MongoDB commands took, as reported by the driver.",
+    ("command", "collection"),
+)
+MONGO_COMMAND_ERRORS = Counter(
+    "mongodb_command_errors_total",
+    "MongoDB commands that failed.",
+    ("command", "collection"),
+)
+
+METRICS = [REQUESTS, REQUEST_SECONDS, MONGO_COMMAND_SECONDS, MONGO_COMMAND_ERRORS]
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+    status = str(status)
+    REQUESTS.inc(method, route, status)
+    REQUEST_SECONDS.observe(seconds, method, route, status)
+
+
+def _gauges(
+    name: str, help: str, kind: str, samples: Iterable[Tuple[str, float]]
+) -> List[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{labels} {_number(value)}" for labels, value in samples)
+    return lines
+
+
+def _pool_lines() -> List[str]:
+    # imported here because app.database imports this module
+    import app.database
+
+    stats = app.database.pool_stats()
+    lines = []
+    for key, name, kind, help in (
+        (
+            "connections_open",
+            "mongodb_pool_connections_open",
+            "gauge",
+            "Open pooled connections.",
+        ),
+        (
+            "connections_in_use",
+            "mongodb_pool_connections_in_use",
+            "gauge",
+            "Connections checked out right now.",
+        ),
+        (
+            "checkouts",
+            "mongodb_pool_checkouts_total",
+            "counter",
+            "Connection checkouts.",
+        ),
+        (
+            "checkout_failures",
+            "mongodb_pool_checkout_failures_total",
+            "counter",
+            "Failed connection checkouts.",
+        ),
+        (
+            "pool_clears",
+            "mongodb_pool_clears_total",
+            "counter",
+            "Times the pool was cleared.",
+        ),
+    ):
+        if key in stats:
+            lines.extend(_gauges(name, help, kind, [("", stats[key])]))
+    lines.extend(
+        _gauges(
+            "mongodb_pool_max_size",
+            "Configured maxPoolSize.",
+            "gauge",
+            [("", stats["options"].get("maxPoolSize", 0))],
+        )
+    )
+    return lines
+
+
+def _cache_lines() -> List[str]:
+    stats = cache_stats()
+    lines = []
+    for field, name, kind, help in (
+        (
+            "hits",
+            "cache_hits_total",
+            "counter",
+            "Cache lookups that found a live entry.",
+        ),
+        ("misses", "cache_misses_total", "counter", "Cache lookups that missed."),
+        (
+            "hit_ratio",
+            "cache_hit_ratio",
+            "gauge",
+            "hits / (hits + misses) since start.",
+        ),
+        ("size", "cache_entries", "gauge", "Entries currently cached."),
+        (
+            "evictions",
+            "cache_evictions_total",
+            "counter",
+            "Entries pushed out by the size limit.",
+        ),
+        (
+            "invalidations",
+            "cache_invalidations_total",
+            "counter",
+            "Entries dropped by writes.",
+        ),
+    ):
+        samples = [
+            (_labels(("cache",), (cache,)), s[field])
+            for cache, s in sorted(stats.items())
+        ]
+        lines.extend(_gauges(name, help, kind, samples))
+    return lines
+
+
+# called on every scrape; each returns exposition lines
+COLLECTORS: List[Callable[[], List[str]]] = [_pool_lines, _cache_lines]
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for collect in COLLECTORS:
+        try:
+            lines.extend(collect())
+        except Exception as e:
+            # a broken collector must not take the whole scrape down
+            print(f"metrics collector {collect.__name__} failed: {e}")
+    return "\n".join(lines) + "\n"
+
+
+def authorized(authorization: str) -> bool:
+    if not METRICS_TOKEN:
+        # no token configured: don't expose routes and internals to anyone
+        return False
+    return hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}")
+
+
+def init_metrics(flask_app) -> None:
+    """Time every Flask request and serve GET /metrics."""
+    # flask stays out of the module so app.database can import it anywhere
+    from flask import Response, g, request
+
+    @flask_app.before_request
+    def _start_timer():
+        g._metrics_started = time.perf_counter()
+
+    @flask_app.after_request
+    def _note_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    # teardown runs even when a view raised and after_request was skipped
+    @flask_app.teardown_request
+    def _record_request(exc):
+        started = g.pop("_metrics_started", None)
+        status = g.pop("_metrics_status", None)
+        if started is not None:
+            rule = request.url_rule
+            observe_request(
+                request.method,
+                rule.rule if rule is not None else UNMATCHED_ROUTE,
+                500 if exc is not None or status is None else status,
+                time.perf_counter() - started,
+            )
+
+    def metrics():
+        if not authorized(request.headers.get("Authorization", "")):
+            return Response("Access denied\n", 403, content_type="text/plain")
+        return Response(render(), 200, content_type=CONTENT_TYPE)
+
+    flask_app.add_url_rule("/metrics", "metrics", metrics, methods=["GET"])
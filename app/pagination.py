@@ -0,0 +1,145 @@
+"""Helpers for seek (keyset) pagination.
+
+Instead of $skip we remember the sort key of the last row on a page and ask
+for rows strictly after it, so every page costs the same index walk no
+matter how deep it is. The position travels to the browser as an opaque,
+url-safe token.
+"""
+
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from bson import ObjectId, json_util
+
+# A sort spec is a list of (field, direction) pairs. The last one must be
+# unique (normally _id) so every row has a distinct position.
+SortSpec = Sequence[Tuple[str, int]]
+
+_SCALARS = (str, int, float, bool, ObjectId, datetime, type(None))
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Turn a row's sort key values into an opaque url-safe token."""
+    raw = json_util.dumps(list(values)).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: Optional[str], size: int) -> Optional[List[Any]]:
+    """Decode a token made by encode_cursor. Returns None if it is unusable.
+
+    Only plain scalar values are accepted so a hand-crafted token can't smuggle
+    query operators into the seek filter.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    if not all(isinstance(v, _SCALARS) for v in values):
+        return None
+    return values
+
+
+def row_key(row: dict, sort: SortSpec) -> List[Any]:
+    """Sort key values of a row, in sort spec order."""
+    return [row.get(field) for field, _ in sort]
+
+
+def reverse_sort(sort: SortSpec) -> List[Tuple[str, int]]:
+    """Same fields, opposite directions (used to walk backwards)."""
+    return [(field, -direction) for field, direction in sort]
+
+
+def seek_filter(sort: SortSpec, values: Sequence[Any]) -> dict:
+    """Match rows that come strictly after `values` in `sort` order.
+
+    For [(a, 1), (_id, 1)] this is a > va OR (a == va AND _id > vid).
+    """
+    branches = []
+    for i, (field, direction) in enumerate(sort):
+        branch = {f: values[j] for j, (f, _) in enumerate(sort[:i])}
+        branch[field] = {("$gt" if direction > 0 else "$lt"): values[i]}
+        branches.append(branch)
+    return branches[0] if len(branches) == 1 else {"$or": branches}
+
+
+def split_page(rows: List[dict], page_size: int, sort: SortSpec):
+    """Trim a page fetched with limit page_size + 1.
+
+    Returns (rows, next_token); next_token is None on the last page.
+    """
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor(row_key(rows[-1], sort))
+
+
+class Page:
+    """One page of a keyset-paginated listing."""
+
+    def __init__(self, rows: List[dict], next_token=None, prev_token=None):
+        self.rows = rows
+        self.next_token = next_token
+        self.prev_token = prev_token
+
+
+def fetch_page(
+    collection,
+    match: dict,
+    sort: SortSpec,
+    page_size: int,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    projection: Optional[dict] = None,
+) -> Page:
+    """Fetch the page after `after` (or before `before`) in `sort` order.
+
+    Walking backwards runs the same query with every direction flipped and
+    reverses the rows, so both directions use the same index. A projection
+    only has to include the fields the caller reads; sort fields are added.
+    """
+    backwards = False
+    values = decode_cursor(after, len(sort))
+    if values is None:
+        values = decode_cursor(before, len(sort))
+        backwards = values is not None
+
+    walk = reverse_sort(sort) if backwards else list(sort)
+    conditions = [match] if match else []
+    if values is not None:
+        conditions.append(seek_filter(walk, values))
+    pipeline: list = []
+    if conditions:
+        pipeline.append(
+            {"$match": conditions[0] if len(conditions) == 1 else {"$and": conditions}}
+        )
+    pipeline.append({"$sort": dict(walk)})
+    pipeline.append({"$limit": page_size + 1})
+    if projection:
+        project = dict(projection)
+        project.update({field: 1 for field, _ in sort})
+        pipeline.append({"$project": project})
+
+    rows = list(collection.aggregate(pipeline))
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return Page(rows)
+
+    first = encode_cursor(row_key(rows[0], sort))
+    last = encode_cursor(row_key(rows[-1], sort))
+    if backwards:
+        # we came from a later page, so there is always a next one
+        return Page(rows, next_token=last, prev_token=first if more else None)
+    return Page(
+        rows,
+        next_token=last if more else None,
+        prev_token=first if values is not None else None,
+    )
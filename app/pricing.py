@@ -0,0 +1,209 @@
+"""Pricing engine: integer cents, basis points, deterministic rounding.
+
+Everything here is pure and works on integers only. Prices and totals are
+cents, and rates (discount percentages, tax) are basis points, where 825 bp
+is 8.25%. A percentage of an amount is rounded half up to the cent, always
+the same way on every machine. There are no floats, so a cart, its order
+and a report re-run over order history all agree to the cent.
+
+Single carts go through quote(). Many carts or orders at once go through
+price_batch(), which takes flat arrays of lines and uses NumPy when it is
+installed (optional, `pip install numpy`). The plain-Python fallback gives
+identical results.
+
+    lines = [(price_cents, quantity), ...]
+    q = quote(subtotal_of(lines), discount_cents=0)
+    q.subtotal_cents, q.discount_cents, q.tax_cents, q.total_cents
+"""
+
+import os
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # batch pricing falls back to plain Python
+
+# Texas sales tax, 8.25%
+TAX_RATE_BP = int(os.environ.get("TAX_RATE_BASIS_POINTS", "825"))
+
+BP_PER_UNIT = 10_000
+
+
+def percent_of(amount_cents: int, basis_points: int) -> int:
+    """amount * basis_points / 10000, rounded half up, in integers."""
+    return (amount_cents * basis_points + BP_PER_UNIT // 2) // BP_PER_UNIT
+
+
+def percent_to_bp(percent) -> int:
+    """20 -> 2000, 8.25 -> 825, 12.345 -> 1235 (half up to a whole basis point).
+
+    Floats go through repr(), the shortest decimal that round-trips, so 8.25
+    is exactly 8.25 and not 8.2499999...
+    """
+    if isinstance(percent, float):
+        percent = repr(percent)
+    bp = Decimal(str(percent)) * 100
+    return int(bp.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def factor_to_bp(factor) -> int:
+    """A price multiplier in basis points: 0.9 -> 9000, 1.125 -> 11250.
+
+    Rounded half up to a whole basis point, like percent_to_bp(). Scaling
+    with percent_of(price, factor_to_bp(f)) rounds like the rest of pricing.
+    """
+    if isinstance(factor, float):
+        factor = repr(factor)
+    return percent_to_bp(Decimal(str(factor)) * 100)
+
+
+def line_total(price_cents: int, quantity: int) -> int:
+    return int(price_cents) * int(quantity)
+
+
+def subtotal_of(lines: Iterable[Tuple[int, int]]) -> int:
+    return sum(line_total(price, qty) for price, qty in lines)
+
+
+class Quote:
+    """Totals for one cart or order."""
+
+    __slots__ = ("subtotal_cents", "discount_cents", "tax_cents", "total_cents")
+
+    def __init__(self, subtotal_cents, discount_cents, tax_cents, total_cents):
+        self.subtotal_cents = subtotal_cents
+        self.discount_cents = discount_cents
+        self.tax_cents = tax_cents
+        self.total_cents = total_cents
+
+    def as_tuple(self) -> Tuple[int, int, int, int]:
+        return (
+            self.subtotal_cents,
+            self.discount_cents,
+            self.tax_cents,
+            self.total_cents,
+        )
+
+    def __repr__(self) -> str:
+        return f"Quote{self.as_tuple()!r}"
+
+
+def quote(
+    subtotal_cents: int, discount_cents: int = 0, tax_bp: int = TAX_RATE_BP
+) -> Quote:
+    """Discount comes off first, tax is charged on what's left."""
+    discount_cents = max(0, min(discount_cents, subtotal_cents))
+    taxable = subtotal_cents - discount_cents
+    tax = percent_of(taxable, tax_bp)
+    return Quote(subtotal_cents, discount_cents, tax, taxable + tax)
+
+
+def price_batch(
+    cart_index: Sequence[int],
+    prices: Sequence[int],
+    quantities: Sequence[int],
+    n_carts: Optional[int] = None,
+    eligible: Optional[Sequence[bool]] = None,
+    discount_bp: Optional[Sequence[int]] = None,
+    tax_bp: Union[int, Sequence[int]] = TAX_RATE_BP,
+):
+    """Price many carts (or orders) from flat per-line arrays in one call.
+
+    cart_index[i] says which cart line i belongs to (0..n_carts-1). eligible
+    marks the lines a cart's discount covers (default: all), and
+    discount_bp is the discount rate per cart (default: none). tax_bp is
+    one rate for all carts or one per cart. Returns
+    (subtotal, discount, tax, total) arrays with one entry per cart: int64
+    NumPy arrays when NumPy is installed, lists otherwise.
+    """
+    if n_carts is None:
+        n_carts = (max(cart_index) + 1) if len(cart_index) else 0
+    if np is not None:
+        return _price_batch_numpy(
+            cart_index, prices, quantities, n_carts, eligible, discount_bp, tax_bp
+        )
+    return _price_batch_python(
+        cart_index, prices, quantities, n_carts, eligible, discount_bp, tax_bp
+    )
+
+
+def _price_batch_numpy(
+    cart_index, prices, quantities, n_carts, eligible, discount_bp, tax_bp
+):
+    idx = np.asarray(cart_index, dtype=np.int64)
+    totals = np.asarray(prices, dtype=np.int64) * np.asarray(quantities, dtype=np.int64)
+
+    # np.add.at keeps int64 (bincount would go through float64)
+    subtotal = np.zeros(n_carts, dtype=np.int64)
+    np.add.at(subtotal, idx, totals)
+
+    discount = np.zeros(n_carts, dtype=np.int64)
+    if discount_bp is not None:
+        covered = (
+            totals
+            if eligible is None
+            else np.where(np.asarray(eligible, dtype=bool), totals, 0)
+        )
+        eligible_sum = np.zeros(n_carts, dtype=np.int64)
+        np.add.at(eligible_sum, idx, covered)
+        rates = np.asarray(discount_bp, dtype=np.int64)
+        discount = (eligible_sum * rates + BP_PER_UNIT // 2) // BP_PER_UNIT
+        discount = np.minimum(np.maximum(discount, 0), subtotal)
+
+    taxable = subtotal - discount
+    rates = np.asarray(tax_bp, dtype=np.int64)
+    tax = (taxable * rates + BP_PER_UNIT // 2) // BP_PER_UNIT
+    return subtotal, discount, tax, taxable + tax
+
+
+def _price_batch_python(
+    cart_index, prices, quantities, n_carts, eligible, discount_bp, tax_bp
+):
+    subtotal: List[int] = [0] * n_carts
+    eligible_sum: List[int] = [0] * n_carts
+    for i, cart in enumerate(cart_index):
+        total = int(prices[i]) * int(quantities[i])
+        subtotal[cart] += total
+        if eligible is None or eligible[i]:
+            eligible_sum[cart] += total
+
+    discount = [0] * n_carts
+    if discount_bp is not None:
+        discount = [
+            max(0, min(percent_of(eligible_sum[c], int(discount_bp[c])), subtotal[c]))
+            for c in range(n_carts)
+        ]
+    rates = (
+        [int(r) for r in tax_bp] if isinstance(tax_bp, Sequence) else [tax_bp] * n_carts
+    )
+    tax = [percent_of(subtotal[c] - discount[c], rates[c]) for c in range(n_carts)]
+    total = [subtotal[c] - discount[c] + tax[c] for c in range(n_carts)]
+    return subtotal, discount, tax, total
+
+
+def order_lines(orders: Iterable[dict]):
+    """Flatten order documents into price_batch() inputs.
+
+    Returns (cart_index, prices, quantities, eligible, discount_bp, tax_bp)
+    built from each order's items, discount_percent and tax_rate_bp, in the
+    order given. A line's `discount_eligible` flag (stored by checkout) says
+    whether the order's discount covered it. Lines of orders placed before
+    the flag existed count as eligible.
+    """
+    cart_index: List[int] = []
+    prices: List[int] = []
+    quantities: List[int] = []
+    eligible: List[bool] = []
+    discount_bp: List[int] = []
+    tax_bp: List[int] = []
+    for n, order in enumerate(orders):
+        for line in order.get("items", []):
+            cart_index.append(n)
+            prices.append(int(line.get("price_cents", 0)))
+            quantities.append(int(line.get("quantity", 0)))
+            eligible.append(bool(line.get("discount_eligible", True)))
+        discount_bp.append(percent_to_bp(order.get("discount_percent") or 0))
+        tax_bp.append(int(order.get("tax_rate_bp", TAX_RATE_BP)))
+    return cart_index, prices, quantities, eligible, discount_bp, tax_bp
@@ -0,0 +1,230 @@
+"""Carts stored on the user document.
+
+A cart is the `cart` array of CartItem entries on the user plus a
+`cart_version` counter and the applied discount (`cart_discount`). The
+*_ops() helpers return aggregation pipeline stages, and db_cart_apply() runs
+all the stages of one edit as a single pipeline update that also bumps the
+version by one (and, with expected_version, only matches that version). So
+two tabs editing the same cart never overwrite or lose each other's changes,
+an edit is applied entirely or not at all, and the version lets a client
+detect that someone else changed the cart first.
+"""
+
+from typing import List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+import app.database
+from app.records.users import get_users
+
+CART_PROJECTION = {"cart": 1, "cart_version": 1, "cart_discount": 1}
+
+
+class CartConflict(Exception):
+    """The cart changed since the version the client last saw."""
+
+
+class CartState:
+    """Snapshot of a user's cart as read from Mongo."""
+
+    def __init__(self, doc: Optional[dict]):
+        doc = doc or {}
+        # {item id string: quantity}, same shape the session cart used to have
+        self.lines = {
+            str(line["item_id"]): int(line["quantity"])
+            for line in doc.get("cart", [])
+            if int(line.get("quantity", 0)) > 0
+        }
+        self.version = int(doc.get("cart_version", 0))
+        self.discount = doc.get("cart_discount")
+
+    @property
+    def item_count(self) -> int:
+        return sum(self.lines.values())
+
+
+def _line_stage(item_id: ObjectId, quantity: int, increment: bool) -> dict:
+    """Pipeline stage that changes one line, appending it if it isn't there."""
+    cart = {"$ifNull": ["$cart", []]}
+    new_quantity = {"$add": ["$$line.quantity", quantity]} if increment else quantity
+    return {
+        "$set": {
+            "cart": {
+                "$cond": [
+                    {"$in": [item_id, {"$ifNull": ["$cart.item_id", []]}]},
+                    {
+                        "$map": {
+                            "input": cart,
+                            "as": "line",
+                            "in": {
+                                "$cond": [
+                                    {"$eq": ["$$line.item_id", item_id]},
+                                    {
+                                        "$mergeObjects": [
+                                            "$$line",
+                                            {"quantity": new_quantity},
+                                        ]
+                                    },
+                                    "$$line",
+                                ]
+                            },
+                        }
+                    },
+                    {
+                        "$concatArrays": [
+                            cart,
+                            [{"item_id": item_id, "quantity": quantity}],
+                        ]
+                    },
+                ]
+            }
+        }
+    }
+
+
+# drops emptied lines; ends every op so the next one sees a clean cart
+_PRUNE = {
+    "$set": {
+        "cart": {
+            "$filter": {
+                "input": "$cart",
+                "as": "line",
+                "cond": {"$gt": ["$$line.quantity", 0]},
+            }
+        }
+    }
+}
+
+# the last stage of every edit: one edit is one version
+_BUMP_VERSION = {
+    "$set": {"cart_version": {"$add": [{"$ifNull": ["$cart_version", 0]}, 1]}}
+}
+
+
+def add_ops(item_id: ObjectId, quantity: int) -> List[dict]:
+    """Add `quantity` of an item (negative takes some away)."""
+    return [_line_stage(item_id, quantity, increment=True), _PRUNE]
+
+
+def set_ops(item_id: ObjectId, quantity: int) -> List[dict]:
+    """Set the quantity of an item; zero or less removes the line."""
+    if quantity <= 0:
+        return remove_ops(item_id)
+    return [_line_stage(item_id, quantity, increment=False), _PRUNE]
+
+
+def remove_ops(item_id: ObjectId) -> List[dict]:
+    return [
+        {
+            "$set": {
+                "cart": {
+                    "$filter": {
+                        "input": {"$ifNull": ["$cart", []]},
+                        "as": "line",
+                        "cond": {"$ne": ["$$line.item_id", item_id]},
+                    }
+                }
+            }
+        }
+    ]
+
+
+def clear_ops(ordered: List[dict]) -> List[dict]:
+    """Take the ordered lines out of the cart and drop the discount (after checkout).
+
+    `ordered` is the order's items ({product_id, quantity}). Only those
+    quantities are removed, so anything added while the order was being
+    placed stays in the cart.
+    """
+    stages = [
+        _line_stage(
+            ObjectId(line["product_id"]), -int(line["quantity"]), increment=True
+        )
+        for line in ordered
+    ]
+    return stages + [_PRUNE, {"$unset": "cart_discount"}]
+
+
+def discount_ops(discount: Optional[dict]) -> List[dict]:
+    """Attach a discount ({"code", "percent_off"}) or remove it with None."""
+    if discount is None:
+        return [{"$unset": "cart_discount"}]
+    return [{"$set": {"cart_discount": {"$literal": discount}}}]
+
+
+def _cart_filter(user_id: ObjectId, expected_version: Optional[int]) -> dict:
+    query = {"_id": user_id}
+    if expected_version is not None:
+        query["cart_version"] = (
+            expected_version if expected_version else {"$in": [0, None]}
+        )
+    return query
+
+
+def _applied(doc: Optional[dict], expected_version: Optional[int]) -> CartState:
+    if doc is None and expected_version is not None:
+        # changed since the client's version (or no such user): nothing applied
+        raise CartConflict()
+    return CartState(doc)
+
+
+def db_cart_get(user_id: ObjectId) -> CartState:
+    """The user's cart; empty if there is no such user or no database."""
+    u = get_users()
+    if u is None:
+        return CartState(None)
+    return CartState(u.find_one({"_id": user_id}, CART_PROJECTION))
+
+
+def db_cart_apply(
+    user_id: ObjectId, ops: List[dict], expected_version: Optional[int] = None
+) -> CartState:
+    """Apply cart operations as one update and return the cart afterwards.
+
+    With expected_version the update only matches that version, so if
+    another request changed the cart first this raises CartConflict and
+    nothing is applied. Empty ops with expected_version just claim it.
+    Without a database the cart is empty and nothing is stored.
+    """
+    u = get_users()
+    if u is None:
+        return CartState(None)
+    doc = u.find_one_and_update(
+        _cart_filter(user_id, expected_version),
+        list(ops) + [_BUMP_VERSION],
+        projection=CART_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    return _applied(doc, expected_version)
+
+
+# -- asyncio versions (AsyncMongoClient), used by app.asgi ------------------
+
+
+def _async_users():
+    database = app.database.get_async_db()
+    return database["users"] if database is not None else None
+
+
+async def db_cart_get_async(user_id: ObjectId) -> CartState:
+    u = _async_users()
+    if u is None:
+        return CartState(None)
+    return CartState(await u.find_one({"_id": user_id}, CART_PROJECTION))
+
+
+async def db_cart_apply_async(
+    user_id: ObjectId, ops: List[dict], expected_version: Optional[int] = None
+) -> CartState:
+    """Same as db_cart_apply, on the async client."""
+    u = _async_users()
+    if u is None:
+        return CartState(None)
+    doc = await u.find_one_and_update(
+        _cart_filter(user_id, expected_version),
+        list(ops) + [_BUMP_VERSION],
+        projection=CART_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    return _applied(doc, expected_version)
@@ -1,7 +1,14 @@
+from datetime import datetime
 from typing import TypedDict
 
 
 class Key(TypedDict):
+    """Signing key. Several keys may share a name while it is being rotated."""
+
     name: str
-    private: str
-    public: str
+    kid: str  # key id, prefixed to every signature made with this key
+    algorithm: str  # see app.signers.BACKENDS
+    private: str  # base64url
+    public: str  # base64url, empty for hmac
+    created_at: datetime
+    active: bool
@@ -1,24 +1,49 @@
-from ecdsa import SigningKey, VerifyingKey, NIST384p
+from typing import List, Optional
 
-from app.database import db
+import pymongo
+
+import app.database
 from app.records.keymodel import Key
+from app.signers import DEFAULT_ALGORITHM, generate_key
 
 
-def db_key_create(name: str) -> Key | None:
-    if db.keys.find_one({"name": name}) is not None:
-        return None
-    sk: SigningKey = SigningKey.generate(curve=NIST384p)
-    vk: VerifyingKey = sk.verifying_key
-    vk.precompute()
-    key = Key(
-        name=name, private=sk.to_string().decode(), public=vk.to_string().decode()
+def db_key_list(name: str) -> List[Key]:
+    """Active keys for a name, newest first."""
+    db = app.database.get_db()
+    return list(
+        db.keys.find({"name": name, "active": True}).sort(
+            "created_at", pymongo.DESCENDING
+        )
     )
+
+
+def db_key_create(name: str, algorithm: str = DEFAULT_ALGORITHM) -> Key:
+    db = app.database.get_db()
+    key = generate_key(name, algorithm)
     db.keys.insert_one(key)
+    return key
+
+
+def db_key_get_or_create(name: str, algorithm: str = DEFAULT_ALGORITHM) -> List[Key]:
+    """Active keys for a name, creating the first one if there are none."""
+    keys = db_key_list(name)
+    if not keys:
+        db_key_create(name, algorithm)
+        # re-read so two processes racing here agree on the same newest key
+        keys = db_key_list(name)
+    return keys
 
 
-def db_key_get_or_create(name: str) -> Key:
-    key = db.keys.find_one({"name": name})
-    if key is None:
-        key = db_key_create(name=name)
-    assert key is not None
+def db_key_rotate(
+    name: str, algorithm: str = DEFAULT_ALGORITHM, keep: int = 2
+) -> Optional[Key]:
+    """Make a new signing key and retire all but the `keep` newest ones."""
+    db = app.database.get_db()
+    key = db_key_create(name, algorithm)
+    keys = db_key_list(name)
+    retired = [old["kid"] for old in keys[keep:]]
+    if retired:
+        db.keys.update_many(
+            {"name": name, "kid": {"$in": retired}}, {"$set": {"active": False}}
+        )
     return key
@@ -0,0 +1,256 @@
+"""Order statistics kept as rollups instead of scanned on demand.
+
+`order_stats` holds one document per (UTC day, status):
+
+    {"_id": "2026-10-18|pending", "day": "2026-10-18", "status": "pending",
+     "orders": 12, "revenue_cents": 48210, "subtotal_cents": 46100,
+     "discount_cents": 1500, "tax_cents": 3610, "items": 31}
+
+db_order_place() adds every new order to its bucket with an `$inc` upsert
+once the order is committed. Not inside the order's transaction: every
+checkout of the day hits the same bucket, and write conflicts there would
+serialize checkout. Each order is counted at most once, because its
+`stats_counted` flag is claimed before the increment. db_order_set_status()
+moves an order from its old bucket to the new one. The admin dashboard
+reads only these documents (one per day and status), never `orders`.
+
+Orders that were placed before the rollups existed are counted by a
+batched rebuild:
+
+    python -m app.records.order_stats backfill [--batch-size 5000]
+
+The rebuild writes into a staging collection and swaps it in with one
+rename, so the dashboard never shows half a rebuild. An order placed or
+re-statused while it runs can be missed, so run it while checkout is quiet.
+"""
+
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import PyMongoError
+
+import app.database
+from app.schema import INDEXES
+
+STATS_COLLECTION = "order_stats"
+STAGING_COLLECTION = "order_stats_rebuild"
+ORDER_STATUSES = ("pending", "paid", "fulfilled")
+DEFAULT_BATCH_SIZE = 5000
+
+# order field -> rollup counter it is summed into
+SUMMED_FIELDS = {
+    "total_cents": "revenue_cents",
+    "subtotal_cents": "subtotal_cents",
+    "discount_cents": "discount_cents",
+    "tax_cents": "tax_cents",
+    "item_count": "items",
+}
+COUNTERS = ("orders",) + tuple(SUMMED_FIELDS.values())
+
+# what a rollup needs from an order document
+ROLLUP_PROJECTION = dict.fromkeys(("created_at", "status") + tuple(SUMMED_FIELDS), 1)
+
+
+def day_of(order: dict) -> str:
+    """UTC day an order counts towards ("YYYY-MM-DD")."""
+    created_at = order.get("created_at")
+    if created_at is None:
+        created_at = order["_id"].generation_time
+    return created_at.strftime("%Y-%m-%d")
+
+
+def bucket_of(order: dict) -> Tuple[str, str]:
+    return day_of(order), order.get("status") or "pending"
+
+
+def _increments(order: dict, sign: int = 1) -> Dict[str, int]:
+    incs = {"orders": sign}
+    for field, counter in SUMMED_FIELDS.items():
+        incs[counter] = sign * int(order.get(field) or 0)
+    return incs
+
+
+def _upsert(bucket: Tuple[str, str], incs: Dict[str, int]) -> UpdateOne:
+    day, status = bucket
+    return UpdateOne(
+        {"_id": f"{day}|{status}"},
+        {"$inc": incs, "$setOnInsert": {"day": day, "status": status}},
+        upsert=True,
+    )
+
+
+def record_order(database, order: dict) -> bool:
+    """Count a placed (committed) order into its day/status bucket, once.
+
+    Safe to retry for the same order id. Returns False if the order was
+    already counted. If the process dies between the claim and the `$inc`,
+    the order is left out until the next backfill.
+    """
+    claimed = database["orders"].update_one(
+        {"_id": order["_id"], "stats_counted": {"$ne": True}},
+        {"$set": {"stats_counted": True}},
+    )
+    if not claimed.modified_count:
+        return False
+    database[STATS_COLLECTION].bulk_write(
+        [_upsert(bucket_of(order), _increments(order))]
+    )
+    return True
+
+
+def db_order_set_status(order_id: ObjectId, status: str) -> Tuple[Optional[dict], bool]:
+    """Set an order's status and move it between rollup buckets.
+
+    Returns (order, changed). order is None if there is no such order (or
+    no database), and changed is False if it already had that status.
+    """
+    database = app.database.get_db()
+    if database is None:
+        return None, False
+    orders = database["orders"]
+    # matching on the old status means only one of two racing updates moves
+    # the order, so it is never counted out of a bucket twice
+    before = orders.find_one_and_update(
+        {"_id": order_id, "status": {"$ne": status}},
+        {"$set": {"status": status}},
+        projection=ROLLUP_PROJECTION,
+        return_document=ReturnDocument.BEFORE,
+    )
+    if before is None:
+        return orders.find_one({"_id": order_id}, ROLLUP_PROJECTION), False
+    after = dict(before, status=status)
+    database[STATS_COLLECTION].bulk_write(
+        [
+            _upsert(bucket_of(before), _increments(before, -1)),
+            _upsert(bucket_of(after), _increments(after)),
+        ]
+    )
+    return after, True
+
+
+def average_cents(total_cents: int, count: int) -> int:
+    """Mean in whole cents, rounded half up (0 for no orders)."""
+    if count <= 0:
+        return 0
+    return (total_cents + count // 2) // count
+
+
+def _summary(counters: dict) -> dict:
+    summary = {name: int(counters.get(name, 0)) for name in COUNTERS}
+    summary["avg_basket_cents"] = average_cents(
+        summary["revenue_cents"], summary["orders"]
+    )
+    return summary
+
+
+def _add(into: dict, row: dict) -> None:
+    for name in COUNTERS:
+        into[name] = into.get(name, 0) + int(row.get(name, 0))
+
+
+def stats_between(
+    database, first: date, last: date, status: Optional[str] = None
+) -> dict:
+    """Revenue, order count and average basket per day and per status.
+
+    Reads only the rollups (at most one document per day and status).
+    """
+    query = {"day": {"$gte": first.isoformat(), "$lte": last.isoformat()}}
+    if status:
+        query["status"] = status
+
+    days: Dict[str, dict] = {}
+    by_status: Dict[str, dict] = {}
+    totals: dict = {}
+    for row in database[STATS_COLLECTION].find(query).sort([("day", 1), ("status", 1)]):
+        day = days.setdefault(row["day"], {"counters": {}, "by_status": {}})
+        _add(day["counters"], row)
+        day["by_status"][row["status"]] = _summary(row)
+        _add(by_status.setdefault(row["status"], {}), row)
+        _add(totals, row)
+
+    return {
+        "from": first.isoformat(),
+        "to": last.isoformat(),
+        "days": [
+            dict(_summary(entry["counters"]), day=day, by_status=entry["by_status"])
+            for day, entry in days.items()
+        ],
+        "by_status": {name: _summary(c) for name, c in sorted(by_status.items())},
+        "totals": _summary(totals),
+    }
+
+
+def recent_stats(database, days: int, status: Optional[str] = None) -> dict:
+    """stats_between() for the last `days` UTC days, today included."""
+    last = datetime.utcnow().date()
+    return stats_between(database, last - timedelta(days=days - 1), last, status)
+
+
+def backfill(database, batch_size: int = DEFAULT_BATCH_SIZE, out=print) -> int:
+    """Rebuild every rollup from `orders`, batch_size orders at a time.
+
+    Each batch is summed in memory and written as one unordered bulk of
+    `$inc` upserts (one per bucket touched), walking orders by _id.
+    Returns the number of orders counted.
+    """
+    staging = database[STAGING_COLLECTION]
+    staging.drop()
+    staging.create_indexes(INDEXES[STATS_COLLECTION])
+
+    orders = database["orders"]
+    counted = 0
+    last_id = None
+    while True:
+        query = {} if last_id is None else {"_id": {"$gt": last_id}}
+        batch = list(
+            orders.find(query, ROLLUP_PROJECTION).sort("_id", 1).limit(batch_size)
+        )
+        if not batch:
+            break
+        buckets: Dict[Tuple[str, str], Dict[str, int]] = {}
+        for order in batch:
+            incs = buckets.setdefault(bucket_of(order), {})
+            for name, value in _increments(order).items():
+                incs[name] = incs.get(name, 0) + value
+        staging.bulk_write(
+            [_upsert(bucket, incs) for bucket, incs in buckets.items()], ordered=False
+        )
+        counted += len(batch)
+        last_id = batch[-1]["_id"]
+        out(f"{counted} orders counted")
+
+    if counted:
+        staging.rename(STATS_COLLECTION, dropTarget=True)
+    else:
+        staging.drop()
+        database[STATS_COLLECTION].delete_many({})
+    return counted
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.records.order_stats")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild = commands.add_parser("backfill", help="rebuild order_stats from orders")
+    rebuild.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    database = app.database.get_db()
+    if database is None:
+        print("pymongo not installed")
+        return 1
+    try:
+        counted = backfill(database, max(1, args.batch_size))
+    except PyMongoError as e:
+        print(f"backfill failed: {e}")
+        return 1
+    print(f"rebuilt {STATS_COLLECTION} from {counted} orders")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,152 @@
+"""Placing orders with stock reservation.
+
+Stock is taken with conditional decrements ({stock: {$gte: qty}} + $inc) so
+two shoppers can never both buy the last unit. With a replica set all lines
+are reserved in one bulk write inside a transaction together with the order
+insert; on a standalone server (our docker-compose setup) each line is
+reserved on its own and the ones already taken are given back if a later
+line fails.
+
+Every placed order is then counted into its day/status rollup
+(app.records.order_stats), after the transaction commits.
+"""
+
+from typing import List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+
+import app.database
+from app.records.order_stats import record_order
+
+
+class InsufficientStock(Exception):
+    """Some lines could not be reserved; `shortages` says which and by how much."""
+
+    def __init__(self, shortages: List[dict]):
+        super().__init__("insufficient stock")
+        self.shortages = shortages
+
+
+# None until we've tried once; standalone servers reject transactions
+_transactions_supported: Optional[bool] = None
+
+
+def _reserve_filter(line: dict) -> dict:
+    return {
+        "_id": ObjectId(line["product_id"]),
+        "stock": {"$gte": line["quantity"]},
+    }
+
+
+def _shortages(items, lines: List[dict]) -> List[dict]:
+    """Lines whose requested quantity is more than what is left.
+
+    Only call this once nothing of the order is reserved any more, or the
+    lines that did reserve would count their own decrement as missing.
+    """
+    ids = [ObjectId(line["product_id"]) for line in lines]
+    stock = {
+        str(doc["_id"]): doc.get("stock", 0)
+        for doc in items.find({"_id": {"$in": ids}}, {"stock": 1})
+    }
+    return [
+        {
+            "product_id": line["product_id"],
+            "name": line.get("name", ""),
+            "requested": line["quantity"],
+            "available": max(stock.get(line["product_id"], 0), 0),
+        }
+        for line in lines
+        if stock.get(line["product_id"], 0) < line["quantity"]
+    ]
+
+
+def _place_in_transaction(database, order_doc: dict, lines: List[dict]) -> ObjectId:
+    items = database["items"]
+    ops = [
+        UpdateOne(_reserve_filter(line), {"$inc": {"stock": -line["quantity"]}})
+        for line in lines
+    ]
+
+    def reserve_and_insert(session):
+        result = items.bulk_write(ops, ordered=False, session=session)
+        if result.modified_count != len(ops):
+            # raising aborts the transaction, nothing was taken
+            raise InsufficientStock([])
+        return database["orders"].insert_one(order_doc, session=session).inserted_id
+
+    with database.client.start_session() as session:
+        # with_transaction retries write conflicts on a hot item for us
+        try:
+            return session.with_transaction(reserve_and_insert)
+        except InsufficientStock:
+            # read after the abort and outside the session, where the lines
+            # that did reserve have their stock back
+            raise InsufficientStock(_shortages(items, lines)) from None
+
+
+def _release(items, lines: List[dict]) -> None:
+    for line in lines:
+        items.update_one(
+            {"_id": ObjectId(line["product_id"])},
+            {"$inc": {"stock": line["quantity"]}},
+        )
+
+
+def _place_with_compensation(database, order_doc: dict, lines: List[dict]) -> ObjectId:
+    items = database["items"]
+    reserved = []
+    for line in lines:
+        result = items.update_one(
+            _reserve_filter(line), {"$inc": {"stock": -line["quantity"]}}
+        )
+        if result.modified_count == 0:
+            _release(items, reserved)
+            raise InsufficientStock(_shortages(items, lines))
+        reserved.append(line)
+    try:
+        inserted = database["orders"].insert_one(order_doc)
+    except Exception:
+        _release(items, reserved)
+        raise
+    return inserted.inserted_id
+
+
+def _count_order(database, order_doc: dict) -> None:
+    try:
+        record_order(database, order_doc)
+    except PyMongoError as e:
+        # the order stands; `order_stats backfill` recounts it
+        print(f"order stats not updated for {order_doc['_id']}: {e}")
+
+
+def db_order_place(order_doc: dict, record_stats: bool = True) -> Optional[ObjectId]:
+    """Reserve stock for every line of order_doc["items"] and insert the order.
+
+    Raises InsufficientStock (with nothing reserved) if any line can't be
+    filled. Returns the new order id, or None if the database is unavailable.
+    record_stats=False leaves the order out of the order_stats rollups
+    (benchmarks that delete their orders afterwards).
+    """
+    global _transactions_supported
+    database = app.database.get_db()
+    if database is None:
+        return None
+    lines = order_doc["items"]
+    if _transactions_supported is not False:
+        try:
+            order_id = _place_in_transaction(database, order_doc, lines)
+            _transactions_supported = True
+        except OperationFailure as e:
+            # 20 = IllegalOperation: transactions need a replica set/mongos
+            if e.code != 20 or _transactions_supported:
+                raise
+            _transactions_supported = False
+    if _transactions_supported is False:
+        # cached ItemLines carry no stock, so nothing to invalidate here
+        order_id = _place_with_compensation(database, order_doc, lines)
+    if record_stats:
+        _count_order(database, order_doc)
+    return order_id
@@ -0,0 +1,108 @@
+"""Argon2 password hashing on a bounded worker pool.
+
+Argon2 is deliberately slow and memory hungry. Running it on the request
+thread means a burst of logins occupies every worker, so instead hashes run
+on a small dedicated pool (argon2-cffi releases the GIL while hashing) and
+requests just wait for the result. When the pool is backed up we fail fast
+with HashingBusy rather than queueing without limit.
+
+Tuning (environment):
+    ARGON2_WORKERS           concurrent hashes per process (default 2)
+    ARGON2_MAX_PENDING       hashes queued or running before HashingBusy (default 32)
+    ARGON2_WAIT_SECONDS      how long a request waits for its hash (default 10)
+    ARGON2_TIME_COST         argon2 iterations (library default)
+    ARGON2_MEMORY_COST       argon2 memory in KiB (library default)
+    ARGON2_PARALLELISM       argon2 lanes (library default)
+
+Changing the cost parameters is safe: stored hashes are upgraded the next
+time their owner logs in (see needs_rehash).
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Optional
+
+import argon2
+from argon2 import PasswordHasher
+
+WORKERS = int(os.environ.get("ARGON2_WORKERS", "2"))
+MAX_PENDING = int(os.environ.get("ARGON2_MAX_PENDING", "32"))
+WAIT_SECONDS = float(os.environ.get("ARGON2_WAIT_SECONDS", "10"))
+
+
+def _cost(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+_defaults = PasswordHasher()
+hasher = PasswordHasher(
+    time_cost=_cost("ARGON2_TIME_COST", _defaults.time_cost),
+    memory_cost=_cost("ARGON2_MEMORY_COST", _defaults.memory_cost),
+    parallelism=_cost("ARGON2_PARALLELISM", _defaults.parallelism),
+)
+
+
+class HashingBusy(Exception):
+    """Too many hashes are already queued; ask the client to retry later."""
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+
+
+def _pool() -> ThreadPoolExecutor:
+    # worker threads don't survive a fork, so each process builds its own pool
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(
+                    max_workers=WORKERS, thread_name_prefix="argon2"
+                )
+                _executor_pid = pid
+    return _executor
+
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = _pool().submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    # the slot is held until the hash is done (or cancelled before it
+    # started), not until we stop waiting: a running hash can't be stopped
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=WAIT_SECONDS)
+    except TimeoutError:
+        future.cancel()
+        raise HashingBusy()
+
+
+def _verify(pw_hash: str, password: str) -> bool:
+    try:
+        return hasher.verify(pw_hash, password)
+    except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHashError):
+        return False
+
+
+def hash_password(password: str) -> str:
+    return _run(hasher.hash, password)
+
+
+def verify_password(pw_hash: str, password: str) -> bool:
+    return _run(_verify, pw_hash, password)
+
+
+def needs_rehash(pw_hash: str) -> bool:
+    """True if pw_hash was made with different cost parameters (cheap)."""
+    try:
+        return hasher.check_needs_rehash(pw_hash)
+    except argon2.exceptions.InvalidHashError:
+        return False
@@ -0,0 +1,339 @@
+"""Repositories: the only place that knows which fields each view loads.
+
+Every view asks for a record type, and each record type declares the exact
+projection it needs and stores the result in a compact __slots__ object.
+That keeps wire bytes and per-request allocations down (no descriptions or
+full image lists for a cart line) and gives every caller the same attribute
+names, e.g. `item.image_url` instead of `doc.get("image_urls", [])[0]`.
+"""
+
+import abc
+from typing import Dict, Iterable, List, Optional
+
+from bson import ObjectId
+
+from app.pagination import Page, SortSpec, fetch_page
+
+PLACEHOLDER_IMAGE = "https://placehold.co/60x60/EFEFEF/333333?text=Item"
+
+
+class Record(abc.ABC):
+    """Read-only view of a document, built from a projection."""
+
+    __slots__ = ()
+    # document fields this record loads; subclasses add to projection() if
+    # they need more than plain inclusion
+    FIELDS: tuple = ()
+
+    @classmethod
+    def projection(cls) -> dict:
+        return {field: 1 for field in cls.FIELDS}
+
+    @classmethod
+    @abc.abstractmethod
+    def from_doc(cls, doc: dict) -> "Record":
+        """Build the record from a document loaded with projection()."""
+
+    def to_dict(self) -> dict:
+        """JSON-friendly dict (ObjectIds as strings)."""
+        out = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            out[name] = str(value) if isinstance(value, ObjectId) else value
+        return out
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+def _first_image(doc: dict) -> Optional[str]:
+    urls = doc.get("image_urls") or []
+    return urls[0] if urls else None
+
+
+class ItemLine(Record):
+    """What the cart, pricing and checkout need to know about an item."""
+
+    __slots__ = ("id", "name", "price_cents", "image_url", "category", "tags")
+    FIELDS = ("name", "price_cents", "category", "tags")
+
+    def __init__(self, id, name, price_cents, image_url, category, tags):
+        self.id = id
+        self.name = name
+        self.price_cents = price_cents
+        self.image_url = image_url
+        self.category = category
+        self.tags = tags
+
+    @classmethod
+    def projection(cls) -> dict:
+        proj = super().projection()
+        proj["image_urls"] = {"$slice": 1}
+        return proj
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "ItemLine":
+        return cls(
+            doc["_id"],
+            doc.get("name", ""),
+            doc.get("price_cents", 0),
+            _first_image(doc) or PLACEHOLDER_IMAGE,
+            doc.get("category"),
+            tuple(doc.get("tags") or ()),
+        )
+
+
+class ItemCard(Record):
+    """A product card on the catalog page."""
+
+    __slots__ = (
+        "id",
+        "name",
+        "description",
+        "price_cents",
+        "stock",
+        "image_url",
+        "category",
+        "tags",
+    )
+    FIELDS = ("name", "description", "price_cents", "stock", "category", "tags")
+
+    def __init__(
+        self, id, name, description, price_cents, stock, image_url, category, tags
+    ):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.price_cents = price_cents
+        self.stock = stock
+        self.image_url = image_url
+        self.category = category
+        self.tags = tags
+
+    @classmethod
+    def projection(cls) -> dict:
+        proj = super().projection()
+        proj["image_urls"] = {"$slice": 1}
+        return proj
+
+    @classmethod
+    def project_stage(cls) -> dict:
+        """Aggregation $project equivalent of projection()."""
+        proj = super().projection()
+        proj["image_urls"] = {"$slice": ["$image_urls", 1]}
+        return proj
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "ItemCard":
+        return cls(
+            doc["_id"],
+            doc.get("name", ""),
+            doc.get("description", ""),
+            doc.get("price_cents", 0),
+            doc.get("stock", 0),
+            _first_image(doc),
+            doc.get("category"),
+            tuple(doc.get("tags") or ()),
+        )
+
+
+class ItemRow(Record):
+    """Everything about an item, for the admin editor."""
+
+    __slots__ = (
+        "id",
+        "name",
+        "description",
+        "price_cents",
+        "category",
+        "stock",
+        "image_urls",
+        "tags",
+    )
+    FIELDS = __slots__[1:]
+
+    def __init__(self, doc: dict):
+        self.id = doc["_id"]
+        self.name = doc.get("name", "")
+        self.description = doc.get("description", "")
+        self.price_cents = doc.get("price_cents", 0)
+        self.category = doc.get("category")
+        self.stock = doc.get("stock", 0)
+        self.image_urls = doc.get("image_urls") or []
+        self.tags = doc.get("tags") or []
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "ItemRow":
+        return cls(doc)
+
+    def to_dict(self) -> dict:
+        # the admin UI works with the raw document field names
+        out = super().to_dict()
+        out["_id"] = out.pop("id")
+        return out
+
+
+class UserRow(Record):
+    """A line in the admin users table."""
+
+    __slots__ = ("id", "name", "permissions")
+    FIELDS = ("name", "permissions")
+
+    def __init__(self, id, name, permissions):
+        self.id = id
+        self.name = name
+        self.permissions = permissions
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "UserRow":
+        return cls(doc["_id"], doc.get("name", ""), doc.get("permissions"))
+
+
+class OrderRow(Record):
+    """A line in the admin orders table (item names only, not full lines)."""
+
+    __slots__ = ("id", "owner", "item_names", "total_cents", "created_at", "status")
+    FIELDS = ("owner", "items.name", "total_cents", "created_at", "status")
+
+    def __init__(self, id, owner, item_names, total_cents, created_at, status):
+        self.id = id
+        self.owner = owner
+        self.item_names = item_names
+        self.total_cents = total_cents
+        self.created_at = created_at
+        self.status = status
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "OrderRow":
+        return cls(
+            doc["_id"],
+            doc.get("owner"),
+            [line.get("name", "") for line in doc.get("items", [])],
+            doc.get("total_cents", 0),
+            doc.get("created_at"),
+            doc.get("status"),
+        )
+
+
+class DiscountCode(Record):
+    """A discount code and its rules; app.discounts compiles these."""
+
+    __slots__ = (
+        "code",
+        "percent_off",
+        "description",
+        "scope",
+        "min_subtotal_cents",
+        "starts_at",
+        "expires_at",
+    )
+    FIELDS = __slots__
+
+    def __init__(
+        self,
+        code,
+        percent_off,
+        description,
+        scope=None,
+        min_subtotal_cents=0,
+        starts_at=None,
+        expires_at=None,
+    ):
+        self.code = code
+        self.percent_off = percent_off
+        self.description = description
+        # {"categories": [...], "tags": [...], "item_ids": [...]}; empty = whole cart
+        self.scope = scope or {}
+        self.min_subtotal_cents = min_subtotal_cents
+        self.starts_at = starts_at
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "DiscountCode":
+        return cls(
+            doc.get("code"),
+            float(doc.get("percent_off", 0)),
+            doc.get("description", ""),
+            doc.get("scope") or {},
+            int(doc.get("min_subtotal_cents") or 0),
+            doc.get("starts_at"),
+            doc.get("expires_at"),
+        )
+
+
+class Repository:
+    collection_name = ""
+
+    def __init__(self, db):
+        self.collection = db[self.collection_name]
+
+    def find(
+        self, view, filter: Optional[dict] = None, sort=None, limit: int = 0
+    ) -> List[Record]:
+        cursor = self.collection.find(filter or {}, view.projection())
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return [view.from_doc(doc) for doc in cursor]
+
+    def find_one(self, view, filter: dict) -> Optional[Record]:
+        doc = self.collection.find_one(filter, view.projection())
+        return view.from_doc(doc) if doc is not None else None
+
+    def iter(self, view, filter: Optional[dict] = None, sort=None, batch_size: int = 0):
+        """Stream records straight from the cursor."""
+        cursor = self.collection.find(filter or {}, view.projection())
+        if sort:
+            cursor = cursor.sort(sort)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        for doc in cursor:
+            yield view.from_doc(doc)
+
+    def page(
+        self,
+        view,
+        match: dict,
+        sort: SortSpec,
+        page_size: int,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+    ) -> Page:
+        """One keyset page (app.pagination.fetch_page) of records."""
+        page = fetch_page(
+            self.collection,
+            match,
+            sort,
+            page_size,
+            after=after,
+            before=before,
+            projection=view.projection(),
+        )
+        page.rows = [view.from_doc(doc) for doc in page.rows]
+        return page
+
+
+class ItemRepository(Repository):
+    collection_name = "items"
+
+    def get_many(self, view, ids: Iterable[ObjectId]) -> Dict[ObjectId, Record]:
+        return {rec.id: rec for rec in self.find(view, {"_id": {"$in": list(ids)}})}
+
+
+class UserRepository(Repository):
+    collection_name = "users"
+
+
+class OrderRepository(Repository):
+    collection_name = "orders"
+
+
+class DiscountCodeRepository(Repository):
+    collection_name = "discount_codes"
+
+    def active(self, code: str) -> Optional[DiscountCode]:
+        return self.find_one(DiscountCode, {"code": code, "is_active": True})
+
+    def all_active(self) -> List[DiscountCode]:
+        return self.find(DiscountCode, {"is_active": True})
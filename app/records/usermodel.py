@@ -26,6 +26,8 @@ class UserModel(TypedDict):
 
     _id: ObjectId
     name: str
+    # name_key(name), for case-insensitive prefix search (app.records.users)
+    name_lower: str
     password_hash: str
     permissions: UserType
     activated: bool
@@ -1,37 +1,127 @@
-import argon2
+import os
+import time
 from bson.objectid import ObjectId
 from uuid import uuid4
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
 from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
 from flask_login import UserMixin
-from argon2 import PasswordHasher
 
 # from _ import _ creates a copy of the object, so init_db doesn't work like that
 import app.database
 
+from app.cache import TTLCache
+from app.records.passwords import hash_password, needs_rehash, verify_password
 from app.records.usermodel import UserModel, UserType, CartItem
 
-ph = PasswordHasher()
-
 users: Collection[UserModel]
 
+# What a logged in request needs to build a User. The password hash and the
+# cart are fetched separately when actually used.
+SESSION_PROJECTION = {"password_hash": 0, "cart": 0}
+
+# Every profile write (name, password, permissions, auth token, delete)
+# bumps the user document's `version` through user_changed(). Both caches
+# hold (checked at, document): an entry is trusted for
+# USER_VERSION_CHECK_SECONDS, then one {"version": 1} read tells whether it
+# is still current. Other processes see a write within that window, and
+# only the changed user's entries are re-read.
+USER_VERSION_CHECK_SECONDS = float(os.environ.get("USER_VERSION_CHECK_SECONDS", "2"))
+VERSION_PROJECTION = {"version": 1}
+
+# auth_token -> user document, so API calls with a token skip the lookup.
+token_cache = TTLCache(
+    "auth_tokens",
+    max_size=int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("AUTH_TOKEN_CACHE_TTL_SECONDS", "30")),
+)
+
+# user _id -> user document for Flask-Login's user_loader
+user_cache = TTLCache(
+    "session_users",
+    max_size=int(os.environ.get("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("USER_CACHE_TTL_SECONDS", "30")),
+)
+
+
+def forget_user(user_id: ObjectId) -> None:
+    """Drop this process's cached entries for a user."""
+    user_cache.invalidate(user_id)
+    token_cache.invalidate_where(lambda entry: entry[1]["_id"] == user_id)
+
+
+def user_changed(user_id: ObjectId) -> None:
+    """After a profile write: bump the user's version and forget it here.
+
+    Other processes notice the new version on their next check.
+    """
+    u = get_users()
+    if u is not None:
+        u.update_one({"_id": user_id}, {"$inc": {"version": 1}})
+    forget_user(user_id)
+
+
+def version_of(model: Optional[dict]) -> int:
+    return int(model.get("version", 0)) if model else 0
+
+
+def cached_model(cache: TTLCache, key) -> Tuple[Optional[UserModel], bool]:
+    """(cached document or None, whether its version is due for a check)."""
+    entry = cache.get(key)
+    if entry is None:
+        return None, False
+    checked_at, model = entry
+    return model, time.monotonic() - checked_at >= USER_VERSION_CHECK_SECONDS
+
+
+def cache_model(cache: TTLCache, key, model: UserModel) -> None:
+    cache.put(key, (time.monotonic(), model))
+
+
+def still_current(model: UserModel, stored: Optional[dict]) -> bool:
+    """Whether a cached document matches the stored user's version."""
+    return stored is not None and version_of(stored) == version_of(model)
+
+
+def _cached_lookup(cache: TTLCache, key, query: dict) -> Optional[UserModel]:
+    model, check = cached_model(cache, key)
+    if model is not None and not check:
+        return model
+    u = get_users()
+    if u is None:
+        return None
+    if model is not None:
+        if still_current(model, u.find_one({"_id": model["_id"]}, VERSION_PROJECTION)):
+            cache_model(cache, key, model)
+            return model
+        cache.invalidate(key)
+    model = u.find_one(query, SESSION_PROJECTION)
+    if model is not None:
+        cache_model(cache, key, model)
+    return model
+
+
+def name_key(name: str) -> str:
+    """What users.name_lower holds: the name, lower-cased.
+
+    Admin search matches prefixes of this on the (name_lower, _id) index.
+    Always set it together with name.
+    """
+    return name.lower()
+
 
 def _get_db():
     "Return usable db or None if Mongo isn't initialized"
-    # If you have an init_db() helper and db is None, try to initialize once.
-    if app.database.db is None and app.database.init_db:
-        try:
-            app.database.init_db()
-        except Exception:
-            pass
-    return app.database.db
+    # the pooled client is created lazily, so this is cheap to call per request
+    return app.database.get_db()
 
 
 def get_users() -> Optional[Collection[UserModel]]:
-    if _get_db() is None:
+    database = _get_db()
+    if database is None:
         return None
-    users = app.database.db["users"]
+    users = database["users"]
     return users
 
 
@@ -41,13 +131,13 @@ def db_user_create(name: str, password: str) -> Optional[ObjectId]:
     if u is None:
         return None
 
-    if u.find_one({"name": name}) is not None:
-        print(f"user {name} exists")
-        return None
+    # may raise HashingBusy, which the app turns into a 503
+    pw_hash = hash_password(password)
+    # users.name has a unique index (app.schema), so no find-then-insert race
     try:
-        pw_hash = ph.hash(password)
         user = UserModel(
             name=name,
+            name_lower=name_key(name),
             password_hash=pw_hash,
             permissions=UserType.USER,
             activated=True,
@@ -55,6 +145,9 @@ def db_user_create(name: str, password: str) -> Optional[ObjectId]:
         )
         resp = u.insert_one(user)
         return resp.inserted_id
+    except DuplicateKeyError:
+        print(f"user {name} exists")
+        return None
     except Exception as e:
         print(e)
         return None
@@ -105,13 +198,33 @@ class User(UserMixin):
         return self.model["permissions"]
 
     def get_cart(self) -> List[CartItem]:
-        return self.model["cart"]
+        if "cart" in self.model:
+            return self.model["cart"]
+        # session users are loaded without the cart (SESSION_PROJECTION)
+        u = get_users()
+        if u is None:
+            return []
+        doc = u.find_one({"_id": self.model["_id"]}, {"cart": 1})
+        return doc.get("cart", []) if doc else []
+
+    def _password_hash(self) -> Optional[str]:
+        if "password_hash" in self.model:
+            return self.model["password_hash"]
+        u = get_users()
+        if u is None:
+            return None
+        doc = u.find_one({"_id": self.model["_id"]}, {"password_hash": 1})
+        return doc.get("password_hash") if doc else None
 
     def update_cart(self, new_cart: List[CartItem]) -> bool:
         u = get_users()
         if u is None:
             return False
-        u.update_one({"_id": self.model["_id"]}, {"$set": {"cart": new_cart}})
+        # prefer the per-line helpers in app.records.carts; this replaces everything
+        u.update_one(
+            {"_id": self.model["_id"]},
+            {"$set": {"cart": new_cart}, "$inc": {"cart_version": 1}},
+        )
         return True
 
     def new_auth_token(self) -> Optional[str]:
@@ -120,13 +233,15 @@ class User(UserMixin):
             return None
         token = "auth_" + str(uuid4())
         u.update_one({"_id": self.model["_id"]}, {"$set": {"auth_token": token}})
+        # the old token stops working right away here, elsewhere on the next check
+        user_changed(self.model["_id"])
         return token
 
     def check_password(self, password: str) -> bool:
-        try:
-            return ph.verify(self.model["password_hash"], password)
-        except argon2.exceptions.VerificationError:
+        pw_hash = self._password_hash()
+        if pw_hash is None:
             return False
+        return verify_password(pw_hash, password)
 
     def update_password(self, password: str) -> None:
         u = get_users()
@@ -135,21 +250,30 @@ class User(UserMixin):
 
         u.update_one(
             {"_id": self.model["_id"]},
-            {"$set": {"password_hash": ph.hash(password)}},
+            {"$set": {"password_hash": hash_password(password)}},
         )
+        user_changed(self.model["_id"])
 
     def update_username(self, username: str) -> None:
         u = get_users()
         if u is None:
             return None
 
-        u.update_one({"_id": self.model["_id"]}, {"$set": {"name": username}})
+        u.update_one(
+            {"_id": self.model["_id"]},
+            {"$set": {"name": username, "name_lower": name_key(username)}},
+        )
+        user_changed(self.model["_id"])
 
     def update_permissions(self, permission: UserType):
         u = get_users()
         if u is None:
             return None
-        u.update_one({"_id": self.model["_id"]}, {"$set": {"permissions": permission}})
+        u.update_one(
+            {"_id": self.model["_id"]},
+            {"$set": {"permissions": permission}},
+        )
+        user_changed(self.model["_id"])
 
     def delete_user(self) -> None:
         u = get_users()
@@ -157,6 +281,7 @@ class User(UserMixin):
             return None
 
         u.delete_one({"_id": self.model["_id"]})
+        user_changed(self.model["_id"])
 
 
 def db_user_verify_login(name: str, password: str) -> Optional[User]:
@@ -164,18 +289,38 @@ def db_user_verify_login(name: str, password: str) -> Optional[User]:
     if u is None:
         return None
 
-    user = u.find_one({"name": name})
-    if user is not None:
-        try:
-            if ph.verify(user["password_hash"], password):
-                ret = User(user)
-                ret.new_auth_token()  # optional
-                return ret
-        except argon2.exceptions.VerificationError:
-            return None
+    user = u.find_one({"name": name}, {"cart": 0})
+    if user is not None and verify_password(user["password_hash"], password):
+        if needs_rehash(user["password_hash"]):
+            # stored with older cost parameters, upgrade while we have the password
+            u.update_one(
+                {"_id": user["_id"], "password_hash": user["password_hash"]},
+                {"$set": {"password_hash": hash_password(password)}},
+            )
+        ret = User(user)
+        ret.new_auth_token()  # optional
+        return ret
     return None
 
 
+def find_user_by_token(token: str) -> Optional[User]:
+    """Resolve an API auth token, served from token_cache when possible."""
+    if not token:
+        return None
+    model = _cached_lookup(token_cache, token, {"auth_token": token})
+    return User(model) if model is not None else None
+
+
+def find_session_user(user_id: ObjectId) -> Optional[User]:
+    """User for Flask-Login's user_loader, served from user_cache when possible.
+
+    The document is loaded without password_hash and cart; User fetches those
+    on demand. Writes through User.update_* / delete_user call user_changed().
+    """
+    model = _cached_lookup(user_cache, user_id, {"_id": user_id})
+    return User(model) if model is not None else None
+
+
 def find_user(id: ObjectId) -> Optional[User]:
     u = get_users()
     if u is None:
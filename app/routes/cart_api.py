@@ -1,159 +1,158 @@
-from flask import Blueprint, jsonify, request, session, url_for
+from flask import Blueprint, jsonify, make_response, request, url_for
 from flask_login import login_required, current_user
-from datetime import datetime
-import time
 import app.database
-from bson import ObjectId
+
+from app.cart_service import (
+    CART_CACHE_CONTROL,
+    CartInputError,
+    batch_item_ids,
+    batch_ops,
+    cart_etag,
+    cart_item_ids,
+    changed_lines,
+    check_discount,
+    etag_matches,
+    expected_version,
+    order_document,
+    parse_batch,
+    parse_product_id,
+    parse_quantity,
+    price_cart,
+    pricing_generations,
+    shortage_message,
+)
+from app.records.carts import (
+    CartConflict,
+    CartState,
+    add_ops,
+    clear_ops,
+    db_cart_apply,
+    db_cart_get,
+    discount_ops,
+    remove_ops,
+    set_ops,
+)
+from app.records.orders import InsufficientStock, db_order_place
+from app.discounts import discount_table
+from app.records.users import User
 
 cart_api_bp = Blueprint("cart_api", __name__, url_prefix="/api/cart")
 
 
-def _get_cart_data():
-    # internal helper function to calculate cart totals
-
-    cart_items = session.get("cart", {})
-
-    line_items = []
-    subtotal_cents = 0
-    item_count = 0
-
-    if not cart_items:
-        # Return empty cart structure
-        return {
-            "items": [],
-            "item_count": 0,
-            "subtotal_cents": 0,
-            "tax_cents": 0,
-            "total_cents": 0,
-        }
-
-    product_ids = list(cart_items.keys())
-
-    # Convert string product_ids to ObjectId for lookup
-    object_ids = []
-    for pid in product_ids:
-        try:
-            object_ids.append(ObjectId(pid))
-        except:
-            pass  # Skip invalid IDs
-
-    if not object_ids:
-        return {
-            "items": [],
-            "item_count": 0,
-            "subtotal_cents": 0,
-            "tax_cents": 0,
-            "total_cents": 0,
-        }
-
-    # Fetch items from Mongo by their _id
-    products = list(app.database.db["items"].find({"_id": {"$in": object_ids}}))
-
-    # Map by id for quick lookup
-    product_map = {str(p["_id"]): p for p in products}
-
-    for product_id, quantity in cart_items.items():
-        product = product_map.get(product_id)
-        if not product:
-            # Product was deleted or missing then skip it
-            continue
-
-        # price_cents is already stored in cents in ItemModel
-        price_cents = product.get("price_cents", 0)
-
-        # image_urls is a list of image URLs from ItemModel
-        image_urls = product.get("image_urls", [])
-        # fallback placeholder for the love of the game
-        image_url = (
-            image_urls[0]
-            if image_urls
-            else "https://placehold.co/60x60/EFEFEF/333333?text=Item"
-        )
+def _cart_owner():
+    """ObjectId of the logged in user's document, None for the demo user."""
+    if isinstance(current_user, User):
+        return current_user.model["_id"]
+    return None
 
-        line_total_cents = price_cents * quantity
-        subtotal_cents += line_total_cents
-        item_count += quantity
 
-        line_items.append(
-            {
-                "product_id": product_id,
-                "name": product.get("name", ""),
-                "price_cents": price_cents,
-                "image_url": image_url,
-                "quantity": quantity,
-                "total_price_cents": line_total_cents,
-            }
-        )
+def _no_cart():
+    return jsonify({"message": "Carts need a registered account."}), 403
+
+
+def _bad_request(e: CartInputError):
+    return jsonify({"message": str(e)}), 400
 
-    # --- Discount handling --- # FIXXXXX
-    applied_code = session.get("discount_code")
-    discount_percent = float(session.get("discount_percent", 0))
 
-    discount_cents = 0
-    if discount_percent > 0 and subtotal_cents > 0:
-        discount_cents = round(subtotal_cents * (discount_percent / 100.0))
+def _conflict(owner):
+    cart_data = _get_cart_data(db_cart_get(owner))
+    return (
+        jsonify(
+            {"message": "Your cart was changed somewhere else.", "cart": cart_data}
+        ),
+        409,
+    )
 
-    # Subtotal after discount
-    subtotal_after_discount = subtotal_cents - discount_cents
 
-    # Tax (8.25%) applied after discount
-    tax_cents = round(subtotal_after_discount * 0.0825)
-    total_cents = subtotal_after_discount + tax_cents
+def _get_cart_data(cart: CartState = None, fresh: bool = False):
+    # internal helper function to calculate cart totals (see app.cart_service)
+    if cart is None:
+        owner = _cart_owner()
+        cart = (db_cart_get(owner) if owner else None) or CartState(None)
+    # Fetch items by their _id (served from the item cache unless fresh)
+    products = app.database.get_items_by_ids(cart_item_ids(cart), fresh=fresh)
+    return price_cart(cart, products)
 
-    return {
-        "items": line_items,
-        "item_count": item_count,
-        "subtotal_cents": subtotal_cents,
-        "discount_cents": discount_cents,
-        "tax_cents": tax_cents,
-        "total_cents": total_cents,
-        "discount_code": applied_code,
-        "discount_percent": discount_percent,
-    }
+
+def _revalidate(etag: str):
+    return make_response(
+        "", 304, {"ETag": f'"{etag}"', "Cache-Control": CART_CACHE_CONTROL}
+    )
 
 
 @cart_api_bp.route("", methods=["GET"])
 @login_required
 def get_cart():
-    # Get the current user's cart from the session.
-    return jsonify(_get_cart_data())
+    # Get the current user's cart from their user document.
+    owner = _cart_owner()
+    if owner is None:
+        return _no_cart()
+    cart = db_cart_get(owner)
+    # the ETag only needs the cart version, so an unchanged cart costs one
+    # small read and no item lookups or pricing
+    etag = cart_etag(owner, cart.version, *pricing_generations())
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return _revalidate(etag)
+    response = jsonify(_get_cart_data(cart))
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = CART_CACHE_CONTROL
+    return response
+
+
+@cart_api_bp.route("/count", methods=["GET"])
+def get_cart_count():
+    """Number of units in the cart, for the navbar badge.
+
+    Answered from the cart lines alone (no item lookups). Guests and the demo
+    user simply have an empty cart here instead of a login redirect.
+    """
+    owner = _cart_owner() if current_user.is_authenticated else None
+    if owner is None:
+        return jsonify({"item_count": 0, "cart_version": 0})
+    cart = db_cart_get(owner)
+    etag = f"count-{cart_etag(owner, cart.version)}"
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return _revalidate(etag)
+    response = jsonify({"item_count": cart.item_count, "cart_version": cart.version})
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = CART_CACHE_CONTROL
+    return response
 
 
 @cart_api_bp.route("/add", methods=["POST"])
 @login_required
 def add_to_cart():
-    data = request.get_json() or {}
-    product_id = data.get("product_id")
-    quantity = int(data.get("quantity", 1))
-
-    if not product_id:
-        return jsonify({"message": "Missing product_id."}), 400
+    owner = _cart_owner()
+    if owner is None:
+        return _no_cart()
 
-    # Verify the product exists in Mongo
-    # Convert product_id string to ObjectId for lookup
+    data = request.get_json() or {}
     try:
-        obj_id = ObjectId(product_id)
-    except:
-        return jsonify({"message": "Invalid product_id."}), 400
+        obj_id = parse_product_id(data)
+        quantity = parse_quantity(data)
+    except CartInputError as e:
+        return _bad_request(e)
+    if quantity < 1:
+        return jsonify({"message": "Quantity must be at least 1."}), 400
 
-    product = app.database.db["items"].find_one({"_id": obj_id})
+    # Verify the product exists in Mongo
+    product = app.database.get_item(obj_id)
     if not product:
         return jsonify({"message": "Invalid product."}), 400
 
-    # Thought this would be cool
-    time.sleep(0.3)
-
-    # get cart from session, modify it, and save back
-    cart = session.get("cart", {})
-    cart[product_id] = cart.get(product_id, 0) + quantity
-    session["cart"] = cart
+    # atomic $inc on the cart line, no read-modify-write of the whole cart
+    try:
+        cart = db_cart_apply(owner, add_ops(obj_id, quantity), expected_version(data))
+    except CartConflict:
+        return _conflict(owner)
 
-    cart_data = _get_cart_data()
+    cart_data = _get_cart_data(cart)
     return (
         jsonify(
             {
-                "message": f"Added {product.get('name', 'item')} to cart!",
+                "message": f"Added {product.name or 'item'} to cart!",
                 "cart_item_count": cart_data["item_count"],
+                "cart_version": cart_data["cart_version"],
             }
         ),
         200,
@@ -161,56 +160,100 @@ def add_to_cart():
 
 
 @cart_api_bp.route("/update", methods=["POST"])
+@login_required
 def update_cart_item():
-    # Update an item's quantity in the session cart
-    data = request.get_json() or {}
-    product_id = data.get("product_id")
-    quantity = int(data.get("quantity", 1))
+    # Update an item's quantity in the user's cart
+    owner = _cart_owner()
+    if owner is None:
+        return _no_cart()
 
-    if not product_id:
-        return jsonify({"message": "Missing product_id."}), 400
-
-    # Verify product still exists
+    data = request.get_json() or {}
     try:
-        obj_id = ObjectId(product_id)
-    except:
-        return jsonify({"message": "Invalid product_id."}), 400
+        obj_id = parse_product_id(data)
+        quantity = parse_quantity(data)
+    except CartInputError as e:
+        return _bad_request(e)
 
-    product = app.database.db["items"].find_one({"_id": obj_id})
+    # Verify product still exists
+    product = app.database.get_item(obj_id)
     if not product:
         return jsonify({"message": "Invalid product."}), 400
 
-    cart = session.get("cart", {})
-    if quantity > 0:
-        cart[product_id] = quantity
-    else:
-        cart.pop(product_id, None)
-
-    session["cart"] = cart
+    try:
+        cart = db_cart_apply(owner, set_ops(obj_id, quantity), expected_version(data))
+    except CartConflict:
+        return _conflict(owner)
 
-    return jsonify(_get_cart_data()), 200
+    return jsonify(_get_cart_data(cart)), 200
 
 
 @cart_api_bp.route("/remove", methods=["POST"])
+@login_required
 def remove_cart_item():
+    owner = _cart_owner()
+    if owner is None:
+        return _no_cart()
+
+    data = request.get_json() or {}
+    try:
+        obj_id = parse_product_id(data)
+    except CartInputError as e:
+        return _bad_request(e)
+
+    try:
+        cart = db_cart_apply(owner, remove_ops(obj_id), expected_version(data))
+    except CartConflict:
+        return _conflict(owner)
+
+    return jsonify(_get_cart_data(cart)), 200
+
+
+@cart_api_bp.route("/batch", methods=["POST"])
+@login_required
+def batch_update_cart():
+    """
+    Apply several cart changes in one request.
+    Body: {"ops": [{"op": "add"|"update"|"remove", "product_id": "...",
+                    "quantity": 1}, ...], "cart_version": 3}
+    All products are looked up together, the changes are applied in order,
+    and only the touched lines come back (quantity 0 = no longer in the cart)
+    together with the new totals.
+    """
+    owner = _cart_owner()
+    if owner is None:
+        return _no_cart()
+
     data = request.get_json() or {}
-    product_id = data.get("product_id")
+    try:
+        parsed = parse_batch(data)
+        # one lookup for every product the batch touches
+        products = app.database.get_items_by_ids(batch_item_ids(parsed))
+        ops = batch_ops(parsed, products)
+    except CartInputError as e:
+        return _bad_request(e)
 
-    cart = session.get("cart", {})
-    cart.pop(product_id, None)
-    session["cart"] = cart
+    try:
+        cart = db_cart_apply(owner, ops, expected_version(data))
+    except CartConflict:
+        return _conflict(owner)
 
-    return jsonify(_get_cart_data()), 200
+    return jsonify(changed_lines(_get_cart_data(cart), parsed)), 200
 
 
 @cart_api_bp.route("/apply-discount", methods=["POST"])  # FIXXXXXX
+@login_required
 def apply_discount():
     """
     Apply a discount code to the current cart.
     Body: {"code": "WELCOME10"}
-    Looks up code in Mongo `discount_codes`, stores in session,
-    and returns updated cart totals.
+    Looks the code up in the in-memory discount table (app.discounts),
+    checks it against the cart (scope, minimum spend, expiry), stores it on
+    the user's cart, and returns updated cart totals.
     """
+    owner = _cart_owner()
+    if owner is None:
+        return _no_cart()
+
     data = request.get_json() or {}
     code = (data.get("code") or "").strip().upper()
 
@@ -218,34 +261,34 @@ def apply_discount():
         return jsonify({"ok": False, "message": "Please enter a code."}), 400
 
     # Make sure there is something in the cart
-    cart = session.get("cart", {})
-    if not cart:
-        session.pop("discount_code", None)
-        session.pop("discount_percent", None)
+    cart = db_cart_get(owner)
+    if not cart.lines:
+        db_cart_apply(owner, discount_ops(None))
         return jsonify({"ok": False, "message": "Your cart is empty."}), 400
 
-    discount_doc = app.database.db["discount_codes"].find_one(
-        {"code": code, "is_active": True}
-    )
-    if not discount_doc:
+    # in-memory table of compiled codes, no query per attempt (app.discounts)
+    rule = discount_table.get(code)
+    # price the cart as if the code were on it to check scope / minimum spend
+    cart.discount = {"code": code}
+    problem = check_discount(code, _get_cart_data(cart), rule)
+    if problem:
         # Clear any previous discount if they type a bad one
-        session.pop("discount_code", None)
-        session.pop("discount_percent", None)
-        return jsonify({"ok": False, "message": "Invalid or expired code."}), 404
-
-    percent_off = float(discount_doc.get("percent_off", 0))
+        db_cart_apply(owner, discount_ops(None))
+        status = 404 if rule is None else 400
+        return jsonify({"ok": False, "message": problem}), status
 
-    # Save discount in session
-    session["discount_code"] = code
-    session["discount_percent"] = percent_off
+    # Save discount on the cart
+    cart = db_cart_apply(
+        owner, discount_ops({"code": rule.code, "percent_off": rule.percent_off})
+    )
 
-    cart_data = _get_cart_data()
+    cart_data = _get_cart_data(cart)
 
     return (
         jsonify(
             {
                 "ok": True,
-                "message": f"Code {code} applied: {percent_off:.0f}% off.",
+                "message": f"Code {rule.code} applied: {rule.percent_off:.0f}% off.",
                 "cart": cart_data,
             }
         ),
@@ -261,40 +304,50 @@ def checkout():
 
     - Requires there to be items in the cart.
     - Uses _get_cart_data() so discounts/tax/total are consistent.
-    - Clears the cart + discount from the session after placing the order.
+    - Clears the cart + discount from the user's document after placing the order.
     """
-    cart = session.get("cart", {})
-    if not cart:
+    owner = _cart_owner()
+    if owner is None:
+        return _no_cart()
+
+    cart = db_cart_get(owner)
+    if not cart.lines:
         return jsonify({"ok": False, "message": "Your cart is empty."}), 400
 
-    cart_data = _get_cart_data()
+    # current prices and stock, not the item cache's
+    cart_data = _get_cart_data(cart, fresh=True)
     if cart_data is None or cart_data["item_count"] == 0:
         return jsonify({"ok": False, "message": "Your cart is empty."}), 400
 
-    # Build the order document
-    order_doc = {
-        "owner": current_user.get_id(),
-        "items": cart_data[
-            "items"
-        ],  # list of {product_id, name, price_cents, quantity, total_price_cents, image_url}
-        "item_count": cart_data["item_count"],
-        "subtotal_cents": cart_data["subtotal_cents"],
-        "discount_cents": cart_data.get("discount_cents", 0),
-        "tax_cents": cart_data["tax_cents"],
-        "total_cents": cart_data["total_cents"],
-        "discount_code": cart_data.get("discount_code"),
-        "discount_percent": cart_data.get("discount_percent", 0),
-        "created_at": datetime.utcnow(),
-        "status": "pending",  # could be 'pending', 'paid', etc later
-    }
-
-    result = app.database.db["orders"].insert_one(order_doc)
-    order_id = str(result.inserted_id)
-
-    # Clear cart + discounts from session
-    session.pop("cart", None)
-    session.pop("discount_code", None)
-    session.pop("discount_percent", None)
+    # claim the version that was priced: a change since then, or a second
+    # submit of the same cart, gets a 409 instead of a second order
+    try:
+        db_cart_apply(owner, [], expected_version=cart.version)
+    except CartConflict:
+        return _conflict(owner)
+
+    order_doc = order_document(current_user.get_id(), cart_data)
+
+    # reserves stock for every line (never below zero) and inserts the order
+    try:
+        result = db_order_place(order_doc)
+    except InsufficientStock as e:
+        return (
+            jsonify(
+                {
+                    "ok": False,
+                    "message": shortage_message(e.shortages),
+                    "insufficient": e.shortages,
+                }
+            ),
+            409,
+        )
+    if result is None:
+        return jsonify({"ok": False, "message": "Internal error"}), 500
+    order_id = str(result)
+
+    # Take the ordered lines + discount out of the cart
+    db_cart_apply(owner, clear_ops(order_doc["items"]))
 
     return (
         jsonify(
@@ -1,21 +1,31 @@
-from flask import Blueprint, request, jsonify, render_template
+import io
+import json
+import os
+
+from flask import Blueprint, Response, request, jsonify, render_template, stream_with_context
 import app.database
-from app.database import create_item, init_db, update_item
+from app import catalog_bulk
+from app.database import create_item, update_item
+from app.records.repositories import ItemRepository, ItemRow
 from app.records.usermodel import ItemCategory
+from app.search import admin_regex_filter
 from app.records.users import User, UserType
 from flask_login import current_user, login_required, login_user
 from bson import ObjectId
 
 items_bp = Blueprint("items", __name__, url_prefix="/admin/items")
 
-@items_bp.before_app_request
-def ensure_db():
-    init_db()
+# items per chunk when /list streams NDJSON (also the Mongo cursor batch size)
+STREAM_BATCH_SIZE = int(os.environ.get("ADMIN_ITEMS_BATCH_SIZE", "200"))
+MAX_STREAM_BATCH_SIZE = 5000
+
+# entries accepted by one /bulk-edit request (bigger syncs should use /import)
+MAX_BULK_EDITS = int(os.environ.get("ADMIN_BULK_EDIT_MAX", "50000"))
 
 @items_bp.route("/add", methods=["POST"])
 @login_required
 def add_item():
-    if not app.database.init_db():
+    if app.database.get_db() is None:
         return jsonify({"message": "Internal error"}), 500
     
     if not (isinstance(current_user, User) and current_user.get_permissions() == UserType.ADMIN):
@@ -42,7 +52,7 @@ def add_item():
 @login_required
 def admin_items_page():
     # ensure DB is ready (optional)
-    if not app.database.init_db():
+    if app.database.get_db() is None:
         return "Internal error", 500
     # check admin
     if not (isinstance(current_user, User) and current_user.get_permissions() == UserType.ADMIN):
@@ -54,28 +64,48 @@ def admin_items_page():
 @login_required
 def list_items():
     """Fetch all items as JSON for admin UI"""
-    if not app.database.init_db():
+    if app.database.get_db() is None:
         return jsonify({"message": "Internal error"}), 500
     
     if not (isinstance(current_user, User) and current_user.get_permissions() == UserType.ADMIN):
         return jsonify({"message": "Access denied"}), 403
     
+    q = request.args.get("q", "").strip()
     try:
-        items_col = app.database.db["items"]
-        items = []
-        for it in items_col.find().sort("name", 1):
-            it["_id"] = str(it["_id"])
-            items.append(it)
+        repo = ItemRepository(app.database.get_db())
+        # admins get the (unindexed) substring search, shoppers use app.search
+        query = admin_regex_filter(q) if q else {}
+        if request.args.get("format") == "ndjson":
+            batch_size = request.args.get("batch_size", STREAM_BATCH_SIZE, type=int)
+            batch_size = max(1, min(batch_size, MAX_STREAM_BATCH_SIZE))
+            rows = repo.iter(ItemRow, query, sort=[("name", 1)], batch_size=batch_size)
+            return Response(
+                stream_with_context(_ndjson_lines(rows, batch_size)),
+                mimetype="application/x-ndjson",
+            )
+        items = [row.to_dict() for row in repo.find(ItemRow, query, sort=[("name", 1)])]
         return jsonify({"items": items}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def _ndjson_lines(rows, batch_size):
+    """One JSON object per line, flushed every batch_size items."""
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(row.to_dict(), default=str))
+        if len(chunk) >= batch_size:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
 # edit items from a list
 @items_bp.route("/edit", methods=["POST"])
 @login_required
 def edit_item():
-    if not app.database.init_db():
+    if app.database.get_db() is None:
         return jsonify({"message": "Internal error"}), 500
     
     if not (isinstance(current_user, User) and current_user.get_permissions() == UserType.ADMIN):
@@ -93,22 +123,100 @@ def edit_item():
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+# edit many items at once: per-item entries and/or filter-based edits
+@items_bp.route("/bulk-edit", methods=["POST"])
+@login_required
+def bulk_edit_items():
+    if app.database.get_db() is None:
+        return jsonify({"message": "Internal error"}), 500
+
+    if not (isinstance(current_user, User) and current_user.get_permissions() == UserType.ADMIN):
+        return jsonify({"message": "Access denied"}), 403
+
+    payload = request.get_json() or {}
+    edits = payload.get("items", [])
+    filters = payload.get("filters", [])
+    if not isinstance(edits, list) or not isinstance(filters, list):
+        return jsonify({"error": "items and filters must be lists"}), 400
+    if not edits and not filters:
+        return jsonify({"error": "nothing to edit"}), 400
+    if len(edits) + len(filters) > MAX_BULK_EDITS:
+        return jsonify({"error": f"at most {MAX_BULK_EDITS} edits per request"}), 413
+    try:
+        report = catalog_bulk.bulk_edit(edits, filters, ordered=bool(payload.get("ordered", False)))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+    status = 200 if not report.failed else 207
+    return jsonify(report.to_dict()), status
+
 # delete item by id route
 @items_bp.route("/delete/<item_id>", methods=["POST"])
 @login_required
 def delete_item(item_id):
     """Delete an item by ID"""
-    if not app.database.init_db():
+    if app.database.get_db() is None:
         return jsonify({"message": "Internal error"}), 500
     
     if not (isinstance(current_user, User) and current_user.get_permissions() == UserType.ADMIN):
         return jsonify({"message": "Access denied"}), 403
     
     try:
-        obj_id = ObjectId(item_id)
-        result = app.database.db["items"].delete_one({"_id": obj_id})
-        if result.deleted_count == 0:
+        if not app.database.delete_item(ObjectId(item_id)):
             return jsonify({"error": "Item not found"}), 404
         return jsonify({"success": True}), 200
     except Exception as e:
-        return jsonify({"error": str(e)}), 400
\ No newline at end of file
+        return jsonify({"error": str(e)}), 400
+
+# bulk import: CSV or NDJSON upload, validated and upserted in batches
+@items_bp.route("/import", methods=["POST"])
+@login_required
+def import_items():
+    if app.database.get_db() is None:
+        return jsonify({"message": "Internal error"}), 500
+
+    if not (isinstance(current_user, User) and current_user.get_permissions() == UserType.ADMIN):
+        return jsonify({"message": "Access denied"}), 403
+
+    upload = request.files.get("file")
+    if upload is not None:
+        fmt = request.args.get("format") or catalog_bulk.guess_format(upload.filename)
+        raw = upload.stream
+    else:
+        # raw body, e.g. curl --data-binary @items.ndjson
+        default = "ndjson" if "ndjson" in (request.mimetype or "") else "csv"
+        fmt = request.args.get("format", default)
+        raw = request.stream
+    if fmt not in catalog_bulk.FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(catalog_bulk.FORMATS)}"}), 400
+
+    batch_size = request.args.get("batch_size", catalog_bulk.DEFAULT_BATCH_SIZE, type=int)
+    stream = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    try:
+        report = catalog_bulk.import_items(
+            catalog_bulk.read_rows(stream, fmt), max(1, batch_size)
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+    status = 200 if report.failed == 0 else 207
+    return jsonify(report.to_dict()), status
+
+
+# bulk export, streamed from the cursor
+@items_bp.route("/export", methods=["GET"])
+@login_required
+def export_items():
+    if app.database.get_db() is None:
+        return jsonify({"message": "Internal error"}), 500
+
+    if not (isinstance(current_user, User) and current_user.get_permissions() == UserType.ADMIN):
+        return jsonify({"message": "Access denied"}), 403
+
+    fmt = request.args.get("format", "csv")
+    if fmt not in catalog_bulk.FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(catalog_bulk.FORMATS)}"}), 400
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(
+        stream_with_context(catalog_bulk.export_items(fmt)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=items.{fmt}"},
+    )
@@ -0,0 +1,32 @@
+from flask import Blueprint, jsonify
+from flask_login import current_user, login_required
+
+import app.database
+from app.cache import cache_stats
+from app.records.users import User, UserType
+
+monitoring_bp = Blueprint("monitoring", __name__, url_prefix="/admin/monitoring")
+
+
+@monitoring_bp.route("/pool", methods=["GET"])
+@login_required
+def pool():
+    """Connection pool counters for this worker process."""
+    if not (
+        isinstance(current_user, User)
+        and current_user.get_permissions() == UserType.ADMIN
+    ):
+        return jsonify({"message": "Access denied"}), 403
+    return jsonify(app.database.pool_stats()), 200
+
+
+@monitoring_bp.route("/caches", methods=["GET"])
+@login_required
+def caches():
+    """Hit/miss counters for the in-process caches of this worker."""
+    if not (
+        isinstance(current_user, User)
+        and current_user.get_permissions() == UserType.ADMIN
+    ):
+        return jsonify({"message": "Access denied"}), 403
+    return jsonify(cache_stats()), 200
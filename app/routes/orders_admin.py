@@ -1,21 +1,62 @@
 from bson import ObjectId
+from bson.errors import InvalidId
 from flask import Blueprint, redirect, request, jsonify, render_template, url_for
 import app.database
 from flask_login import current_user, login_required
 
+from app.records.order_stats import ORDER_STATUSES, db_order_set_status, recent_stats
+from app.records.repositories import OrderRepository, OrderRow
 from app.records.users import User, UserType, get_users
 
 from typing import Optional
+import threading
+import time
 import pymongo
 
 order_bp = Blueprint("orders", __name__, url_prefix="/admin/orders")
 
+PAGE_SIZE = 25
+# how long a per-status order count may be reused before recounting
+COUNT_TTL_SECONDS = 60
+# dashboard window, in days
+STATS_DAYS = 30
+MAX_STATS_DAYS = 366
+
+# indexes for these live in app.schema (ORDER_SORT_FIELDS)
+SORT_FIELDS = {
+    "date": "created_at",
+    "owner": "owner",
+    "value": "total_cents",
+}
+
+_count_cache: dict = {}
+_count_lock = threading.Lock()
+
+
+def order_count(orders, status: str) -> int:
+    """Approximate number of orders for the status filter.
+
+    "any" uses the collection metadata; a status filter is counted for real
+    but the answer is reused for COUNT_TTL_SECONDS.
+    """
+    if status == "any":
+        return orders.estimated_document_count()
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(status)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+    count = orders.count_documents({"status": status})
+    with _count_lock:
+        _count_cache[status] = (now + COUNT_TTL_SECONDS, count)
+    return count
+
 
 @order_bp.route("/", methods=["GET"])
 @login_required
 def admin_orders_page():
     # ensure DB is ready (optional)
-    if not app.database.init_db():
+    if app.database.get_db() is None:
         return "Internal error", 500
     # check admin
     if not (
@@ -24,74 +65,96 @@ def admin_orders_page():
     ):
         return "Access denied", 403
 
-    page = request.args.get("page", 0, type=int)
     sort = request.args.get("sort", "date")
     status = request.args.get("status", "any")
     sort_direction = request.args.get("sort_direction", 0, type=int)
+    after = request.args.get("after")
+    before = request.args.get("before")
+
+    repo = OrderRepository(app.database.get_db())
 
-    orders = app.database.db["orders"]
-    orders.create_indexes(
-        [
-            pymongo.IndexModel([("created_at", pymongo.ASCENDING)]),
-            pymongo.IndexModel([("owner", pymongo.ASCENDING)]),
-            pymongo.IndexModel([("total_cents", pymongo.ASCENDING)]),
-        ]
+    sort_by = SORT_FIELDS.get(sort, "created_at")
+    direction = pymongo.DESCENDING if sort_direction == 0 else pymongo.ASCENDING
+    match = {} if status == "any" else {"status": status}
+
+    on_page = repo.page(
+        OrderRow,
+        match,
+        [(sort_by, direction), ("_id", direction)],
+        PAGE_SIZE,
+        after=after,
+        before=before,
     )
-    if status == "any":
-        total_orders = orders.count_documents({})
-    else:
-        total_orders = orders.count_documents({"status": status})
-    match sort:
-        case "date":
-            sort_by = "created_at"
-        case "owner":
-            sort_by = "owner"
-        case "value":
-            sort_by = "total_cents"
-        case _:
-            sort_by = "created_at"
-    if status == "any":
-        on_page = orders.aggregate(
-            [
-                {
-                    "$sort": {
-                        sort_by: (
-                            pymongo.DESCENDING
-                            if sort_direction == 0
-                            else pymongo.ASCENDING
-                        )
-                    }
-                },
-                {"$skip": page * 25},
-                {"$limit": 25},
-            ]
-        )
-    else:
-        on_page = orders.aggregate(
-            [
-                {"$match": {"$and": [{"status": status}]}},
-                {
-                    "$sort": {
-                        sort_by: (
-                            pymongo.DESCENDING
-                            if sort_direction == 0
-                            else pymongo.ASCENDING
-                        )
-                    }
-                },
-                {"$skip": page * 25},
-                {"$limit": 25},
-            ]
-        )
-    total_pages = (total_orders + 24) // 25
 
     return render_template(
         "admin/orders.html",
         title="Admin — Orders",
-        orders=on_page,
+        orders=on_page.rows,
         sort=sort,
         sort_direction=sort_direction,
         status=status,
-        page=page,
-        total_pages=total_pages,
+        next_token=on_page.next_token,
+        prev_token=on_page.prev_token,
+        paged=bool(after or before),
+        total_orders=order_count(repo.collection, status),
+    )
+
+
+def _is_admin() -> bool:
+    return (
+        isinstance(current_user, User)
+        and current_user.get_permissions() == UserType.ADMIN
+    )
+
+
+@order_bp.route("/stats", methods=["GET"])
+@login_required
+def admin_order_stats():
+    """Revenue, order count and average basket per day and status, from the rollups."""
+    database = app.database.get_db()
+    if database is None:
+        return jsonify({"message": "Internal error"}), 500
+    if not _is_admin():
+        return jsonify({"message": "Access denied"}), 403
+
+    days = request.args.get("days", STATS_DAYS, type=int)
+    days = max(1, min(days, MAX_STATS_DAYS))
+    status = request.args.get("status", "any")
+    if status != "any" and status not in ORDER_STATUSES:
+        return jsonify({"message": f"Unknown status {status!r}."}), 400
+    stats = recent_stats(database, days, None if status == "any" else status)
+    return jsonify(stats), 200
+
+
+@order_bp.route("/<order_id>/status", methods=["POST"])
+@login_required
+def set_order_status(order_id):
+    if app.database.get_db() is None:
+        return jsonify({"message": "Internal error"}), 500
+    if not _is_admin():
+        return jsonify({"message": "Access denied"}), 403
+
+    payload = request.get_json(silent=True) or {}
+    status = payload.get("status")
+    if status not in ORDER_STATUSES:
+        return (
+            jsonify({"message": f"status must be one of {', '.join(ORDER_STATUSES)}."}),
+            400,
+        )
+    try:
+        oid = ObjectId(order_id)
+    except (InvalidId, TypeError):
+        return jsonify({"message": "Invalid order id."}), 400
+
+    order, changed = db_order_set_status(oid, status)
+    if order is None:
+        return jsonify({"message": "Order not found."}), 404
+    with _count_lock:
+        # per-status counts on the listing page are stale now
+        _count_cache.clear()
+    return (
+        jsonify(
+            {"ok": True, "order_id": order_id, "status": status, "changed": changed}
+        ),
+        200,
     )
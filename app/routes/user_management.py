@@ -1,7 +1,7 @@
 from typing import Optional
 from urllib.parse import urlsplit
 from bson import ObjectId
-from flask import render_template, redirect, url_for, Flask, flash, request, jsonify, session, abort
+from flask import render_template, redirect, url_for, Flask, flash, request, jsonify, abort
 from flask_login import (
     current_user,
     login_user,
@@ -14,7 +14,17 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField
 from wtforms.validators import DataRequired
 
-from app.records.users import db_user_verify_login, User, db_user_create, get_users
+from app.records.users import (
+    db_user_verify_login,
+    User,
+    db_user_create,
+    find_session_user,
+    find_user_by_token,
+)
+from app.records.passwords import HashingBusy
+from app.records.repositories import ItemCard
+from app.catalog import catalog_args, catalog_json, catalog_page, clamp_page_size
+from app.catalog_cache import cached_page
 
 
 # Forms
@@ -77,58 +87,64 @@ def init_user_management(app: Flask, login_manager: LoginManager):
 
 
 
+    @app.errorhandler(HashingBusy)
+    def hashing_busy(e):
+        # the password hashing pool is full; better to retry than to queue forever
+        if request.is_json:
+            message = "Too many sign-ins right now, please retry."
+            return jsonify({"message": message}), 503
+        return "Too many sign-ins right now, please retry.", 503
+
     @app.route("/")
     @app.route("/index")
     def catalog():
         """Main product catalog/shop page with search + sorting."""
-        q = request.args.get("q", "").strip()
-        sort = request.args.get("sort", "name")  
-
-    # Serch query
-        mongo_query = {}
-        if q:
-            mongo_query = {
-                "$or": [
-                    {"name": {"$regex": q, "$options": "i"}},
-                    {"description": {"$regex": q, "$options": "i"}},
-                ]
-            }
-
-    # Determining the sorting order
-        if sort == "price_asc":
-            sort_field = "price_cents"
-            sort_dir = 1       # low → high
-
-        elif sort == "price_desc":
-            sort_field = "price_cents"
-            sort_dir = -1      # high → low
-
-        elif sort == "availability":
-            sort_field = "stock"
-            sort_dir = -1      # most available first
-
-        else:
-            sort_field = "name"
-            sort_dir = 1       # A → Z         
-
-        from app import database as app_db
-        app_db.init_db()
-        if app_db.db is None:
-            items = []
-        else:
-            cursor = app_db.db["items"].find(mongo_query).sort(sort_field, sort_dir)
-            items = list(cursor)
-            # Convert ObjectId to string
-            for item in items:
-                item["_id"] = str(item["_id"])
-
-        return render_template(
-            "shop/index.html",
-            title="Shop",
-            items=items,
-            q=q,
-            sort=sort,  
+        default_page_size = app.config.get("CATALOG_PAGE_SIZE")
+        q, sort, after, page_size = catalog_args(request.args, default_page_size)
+        # links keep a non-default page size (None leaves it out of the URL)
+        per_page = None if page_size == clamp_page_size(default_page_size) else page_size
+
+        def render():
+            from app import database as app_db
+            database = app_db.get_db()
+            next_token = None
+            if database is None:
+                items = []
+            else:
+                rows, next_token = catalog_page(
+                    database["items"], q, sort, after, page_size
+                )
+                # the cart will ask for these next, so keep them in the item cache
+                app_db.cache_items(rows)
+                items = [ItemCard.from_doc(row) for row in rows]
+
+            return render_template(
+                "shop/index.html",
+                title="Shop",
+                items=items,
+                q=q,
+                sort=sort,
+                after=after,
+                next_token=next_token,
+                per_page=per_page,
+            )
+
+        # rendered once per catalog generation, revalidated with ETags
+        return cached_page((q, sort, after, page_size), render)
+
+    @app.route("/api/catalog")
+    def catalog_api():
+        """One catalog page as JSON; app.asgi serves the same thing async."""
+        q, sort, after, page_size = catalog_args(
+            request.args, app.config.get("CATALOG_PAGE_SIZE")
         )
+        from app import database as app_db
+        database = app_db.get_db()
+        if database is None:
+            return jsonify({"message": "Internal error"}), 500
+        rows, next_token = catalog_page(database["items"], q, sort, after, page_size)
+        app_db.cache_items(rows)
+        return jsonify(catalog_json(rows, next_token))
 
     @app.route("/cart")
     def cart():
@@ -192,7 +208,6 @@ def init_user_management(app: Flask, login_manager: LoginManager):
     @login_required
     def logout():
         logout_user()
-        session.pop("cart", None)
         flash("You have been logged out.")
         return redirect(url_for("login"))
 
@@ -263,8 +278,11 @@ def init_user_management(app: Flask, login_manager: LoginManager):
 
             # --- Add error handling for existing user ---
             try:
-                # This function does not check if user exists, so we wrap it
-                db_user_create(form.username.data, form.password.data)
+                # returns None when the name is taken (unique index on users.name)
+                if db_user_create(form.username.data, form.password.data) is None:
+                    raise ValueError("username taken")
+            except HashingBusy:
+                raise
             except Exception as e:
                 # This will catch if the user already exists (or other DB errors)
                 # --- JSON BRIDGE FOR ERRORS ---
@@ -293,33 +311,26 @@ def init_user_management(app: Flask, login_manager: LoginManager):
             return DummyUser()
 
         try:
-            import app.database
-            model = app.database.db.users.find_one({"_id": ObjectId(user_id)})
-            if model is None:
-                return None
-            return User(model)
+            return find_session_user(ObjectId(user_id))
         except:
             return None
 
     @login_manager.request_loader
     def load_user_from_request(req) -> Optional[User]:
-        u = get_users()
-        if u is None:
-            return None
         # Query param token
         auth_token = req.args.get("auth_token")
         if auth_token:
-            user = u.find_one({"auth_token": auth_token})
+            user = find_user_by_token(auth_token)
             if user:
-                return User(user)
+                return user
 
         # Bearer header token
         auth_header = req.headers.get("Authorization")
         if auth_header:
             token = auth_header.replace("Bearer ", "").strip()
-            user = u.find_one({"auth_token": token})
+            user = find_user_by_token(token)
             if user:
-                return User(user)
+                return user
 
         return None
 
@@ -331,10 +342,10 @@ def init_user_management(app: Flask, login_manager: LoginManager):
             abort(404)
 
         from app import database as app_db
-        app_db.init_db()
-        if app_db.db is None:
+        database = app_db.get_db()
+        if database is None:
             abort(500)
-        order = app_db.db["orders"].find_one({"_id": obj_id})
+        order = database["orders"].find_one({"_id": obj_id})
         if not order:
             abort(404)
 
@@ -1,11 +1,15 @@
 from bson import ObjectId
 from flask import Blueprint, redirect, request, jsonify, render_template, url_for
 import app.database
-from app.database import create_item, init_db
-from app.records.users import User, UserType, find_user, get_users
+from app.records.repositories import UserRepository, UserRow
+from app.records.users import User, UserType, find_user, name_key
+from app.search import prefix_filter
 from flask_login import current_user, login_required, login_user
 
-from typing import Optional
+from typing import Optional, Tuple
+import threading
+import time
+import pymongo
 
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, RadioField
@@ -14,6 +18,42 @@ from wtforms.validators import DataRequired
 
 user_bp = Blueprint("users", __name__, url_prefix="/admin/users")
 
+PAGE_SIZE = 25
+# how long a search's match count may be reused before recounting
+COUNT_TTL_SECONDS = 60
+# searches stop counting here and show "N+"
+SEARCH_COUNT_LIMIT = 1000
+
+# indexes for these live in app.schema ("users")
+SORT_FIELDS = {
+    "name": "name_lower",
+    "id": "_id",
+}
+
+_count_cache: dict = {}
+_count_lock = threading.Lock()
+
+
+def user_count(users, match: dict, prefix: str) -> Tuple[int, bool]:
+    """Approximate number of users for the listing, and whether it was capped.
+
+    Without a search this is the collection metadata. A search is counted
+    up to SEARCH_COUNT_LIMIT on the name_lower index, and the answer is
+    reused for COUNT_TTL_SECONDS.
+    """
+    if not match:
+        return users.estimated_document_count(), False
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(prefix)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+    count = users.count_documents(match, limit=SEARCH_COUNT_LIMIT)
+    result = (count, count >= SEARCH_COUNT_LIMIT)
+    with _count_lock:
+        _count_cache[prefix] = (now + COUNT_TTL_SECONDS, result)
+    return result
+
 
 class EditUserForm(FlaskForm):
     username = StringField("Username")
@@ -27,7 +67,7 @@ class EditUserForm(FlaskForm):
 @user_bp.route("/delete", methods=["POST"])
 @login_required
 def del_user():
-    if not app.database.init_db():
+    if app.database.get_db() is None:
         return jsonify({"message": "Internal error"}), 500
 
     if not (
@@ -49,7 +89,7 @@ def del_user():
 @user_bp.route("/edit/<user_id>", methods=["GET", "POST"])
 @login_required
 def edit_user(user_id):
-    if not app.database.init_db():
+    if app.database.get_db() is None:
         return jsonify({"message": "Internal error"}), 500
 
     if not (
@@ -98,7 +138,7 @@ def edit_user(user_id):
 @login_required
 def admin_users_page():
     # ensure DB is ready (optional)
-    if not app.database.init_db():
+    if app.database.get_db() is None:
         return "Internal error", 500
     # check admin
     if not (
@@ -107,19 +147,38 @@ def admin_users_page():
     ):
         return "Access denied", 403
 
-    page = request.args.get("page", 0, type=int)
-    u = get_users()
-    if u is None:
-        return "Internal Error", 500
+    sort = request.args.get("sort", "name")
+    sort_direction = request.args.get("sort_direction", 1, type=int)
+    q = request.args.get("q", "").strip()
+    after = request.args.get("after")
+    before = request.args.get("before")
+
+    repo = UserRepository(app.database.get_db())
+
+    prefix = name_key(q)
+    match = prefix_filter("name_lower", prefix)
+    if prefix:
+        # a prefix only narrows the name_lower index, so searches are by name
+        sort = "name"
+    sort_by = SORT_FIELDS.get(sort, "name_lower")
+    direction = pymongo.DESCENDING if sort_direction == 0 else pymongo.ASCENDING
+    spec = [(sort_by, direction)]
+    if sort_by != "_id":
+        spec.append(("_id", direction))
 
-    total_users = u.count_documents({})
-    on_page = u.aggregate([{"$skip": page * 25}, {"$limit": 25}])
-    total_pages = (total_users + 24) // 25
+    on_page = repo.page(UserRow, match, spec, PAGE_SIZE, after=after, before=before)
+    total_users, capped = user_count(repo.collection, match, prefix)
 
     return render_template(
         "admin/users.html",
         title="Admin — Users",
-        users=on_page,
-        page=page,
-        total_pages=total_pages,
+        users=on_page.rows,
+        q=q,
+        sort=sort,
+        sort_direction=sort_direction,
+        next_token=on_page.next_token,
+        prev_token=on_page.prev_token,
+        paged=bool(after or before),
+        total_users=total_users,
+        count_capped=capped,
     )
@@ -0,0 +1,253 @@
+"""Versioned schema bootstrap: every index the app relies on, in one place.
+
+Runs at startup, never inside a request: the ASGI server bootstraps in its
+lifespan startup, and for `flask run` (or any other WSGI server) run it by
+hand before starting:
+
+    python -m app.schema            # create missing indexes, run migrations
+    python -m app.schema check      # only report drift, change nothing
+    flask --app app init-schema [check]   # the same, as a Flask command
+
+Request handlers must not create indexes themselves; add them here instead.
+"""
+
+import sys
+from datetime import datetime, timezone
+
+import pymongo
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+import app.database
+from app.records.users import name_key
+from app.search import text_index_model
+
+SCHEMA_VERSION = 3
+META_COLLECTION = "schema_meta"
+
+ASC = pymongo.ASCENDING
+
+# Admin order listing sorts, each paged on (field, _id), with and without the
+# status filter in front. Mongo walks them backwards for descending sorts.
+ORDER_SORT_FIELDS = ("created_at", "owner", "total_cents")
+
+# users written per bulk by the name_lower backfill
+MIGRATION_BATCH_SIZE = 1000
+
+INDEXES = {
+    "users": [
+        # login + signup; unique so db_user_create can just insert
+        pymongo.IndexModel([("name", ASC)], unique=True),
+        # load_user_from_request token lookups
+        pymongo.IndexModel([("auth_token", ASC)], sparse=True),
+        # admin listing by name (keyset) and username prefix search
+        pymongo.IndexModel([("name_lower", ASC), ("_id", ASC)]),
+    ],
+    "discount_codes": [
+        pymongo.IndexModel([("code", ASC)], unique=True),
+    ],
+    "keys": [
+        # several keys per name while rotating (app.records.keys)
+        pymongo.IndexModel([("name", ASC), ("kid", ASC)], unique=True),
+        pymongo.IndexModel([("name", ASC), ("active", ASC), ("created_at", ASC)]),
+    ],
+    "items": [
+        text_index_model(),
+        # catalog sort modes, see app.catalog.SORT_MODES
+        pymongo.IndexModel([("name", ASC), ("_id", ASC)]),
+        pymongo.IndexModel([("price_cents", ASC), ("_id", ASC)]),
+        pymongo.IndexModel([("stock", ASC), ("_id", ASC)]),
+    ],
+    "orders": [
+        pymongo.IndexModel([(field, ASC), ("_id", ASC)]) for field in ORDER_SORT_FIELDS
+    ]
+    + [
+        pymongo.IndexModel([("status", ASC), (field, ASC), ("_id", ASC)])
+        for field in ORDER_SORT_FIELDS
+    ],
+    # dashboard date ranges over the rollups (app.records.order_stats)
+    "order_stats": [
+        pymongo.IndexModel([("day", ASC), ("status", ASC)]),
+    ],
+}
+
+
+def _drop_index_if_present(collection, name: str) -> None:
+    if name in collection.index_information():
+        collection.drop_index(name)
+
+
+def _v2_rotating_keys(db) -> None:
+    # version 1 allowed a single key per name, which blocks key rotation
+    _drop_index_if_present(db["keys"], "name_1")
+
+
+def _v3_user_name_lower(db) -> None:
+    # admin prefix search needs users.name_lower; fill it in for old users.
+    # Done in Python, not with $toLower, so non-ASCII names get exactly the
+    # key name_key() gives new ones.
+    users = db["users"]
+    batch = []
+    for doc in users.find({"name_lower": {"$exists": False}}, {"name": 1}):
+        batch.append(
+            pymongo.UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"name_lower": name_key(doc.get("name") or "")}},
+            )
+        )
+        if len(batch) >= MIGRATION_BATCH_SIZE:
+            users.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        users.bulk_write(batch, ordered=False)
+
+
+# version -> function(db) that brings data written by older code up to date.
+# Runs in order for every version above the one stored in schema_meta.
+MIGRATIONS = {
+    2: _v2_rotating_keys,
+    3: _v3_user_name_lower,
+}
+
+
+def _declared(model: pymongo.IndexModel) -> dict:
+    return model.document
+
+
+def _same_index(declared: dict, actual: dict) -> bool:
+    if declared.get("unique", False) != actual.get("unique", False):
+        return False
+    if declared.get("sparse", False) != actual.get("sparse", False):
+        return False
+    if "weights" in declared:
+        # text indexes are stored as _fts/_ftsx, compare the weights instead
+        return dict(declared["weights"]) == dict(actual.get("weights", {}))
+    return list(declared["key"].items()) == [tuple(k) for k in actual["key"]]
+
+
+def index_drift(db) -> dict:
+    """Compare declared indexes with the server.
+
+    Returns {collection: {"missing": [...], "changed": [...], "extra": [...]}}
+    for every collection that differs (index names as values).
+    """
+    drift = {}
+    for collection, models in INDEXES.items():
+        actual = db[collection].index_information()
+        missing, changed = [], []
+        declared_names = set()
+        for model in models:
+            doc = _declared(model)
+            declared_names.add(doc["name"])
+            if doc["name"] not in actual:
+                missing.append(doc["name"])
+            elif not _same_index(doc, actual[doc["name"]]):
+                changed.append(doc["name"])
+        extra = sorted(set(actual) - declared_names - {"_id_"})
+        if missing or changed or extra:
+            drift[collection] = {"missing": missing, "changed": changed, "extra": extra}
+    return drift
+
+
+def stored_version(db) -> int:
+    meta = db[META_COLLECTION].find_one({"_id": "schema"})
+    return int(meta["version"]) if meta else 0
+
+
+def bootstrap(db) -> dict:
+    """Create every declared index and run pending migrations.
+
+    Each index is created on its own so one failure (e.g. duplicate user
+    names blocking the unique index) doesn't stop the rest. Returns a report
+    with the created and failed index names.
+    """
+    report = {"created": [], "failed": {}, "migrated": []}
+    for collection, models in INDEXES.items():
+        for model in models:
+            name = _declared(model)["name"]
+            try:
+                db[collection].create_indexes([model])
+                report["created"].append(f"{collection}.{name}")
+            except ConnectionFailure:
+                # server gone: every other index would just wait out the timeout
+                raise
+            except PyMongoError as e:
+                report["failed"][f"{collection}.{name}"] = str(e)
+
+    current = stored_version(db)
+    for version in range(current + 1, SCHEMA_VERSION + 1):
+        migration = MIGRATIONS.get(version)
+        if migration is not None:
+            migration(db)
+            report["migrated"].append(version)
+    if current < SCHEMA_VERSION:
+        db[META_COLLECTION].update_one(
+            {"_id": "schema"},
+            {
+                "$set": {
+                    "version": SCHEMA_VERSION,
+                    "applied_at": datetime.now(timezone.utc),
+                }
+            },
+            upsert=True,
+        )
+    report["version"] = SCHEMA_VERSION
+    return report
+
+
+def bootstrap_schema() -> bool:
+    """Startup hook: bootstrap if Mongo is reachable. Returns True on success."""
+    db = app.database.get_db()
+    if db is None:
+        return False
+    # one server selection wait when Mongo is down, not one per index
+    if not app.database.ping_db():
+        print("schema bootstrap skipped: MongoDB is not reachable")
+        return False
+    try:
+        report = bootstrap(db)
+    except PyMongoError as e:
+        print(f"schema bootstrap skipped: {e}")
+        return False
+    for name, error in report["failed"].items():
+        print(f"schema: could not create index {name}: {error}")
+    return not report["failed"]
+
+
+def init_schema_cli(flask_app) -> None:
+    """Register `flask init-schema [check]`, the same as python -m app.schema."""
+    # click comes with flask; keep both out of the module like app.metrics
+    import click
+
+    @flask_app.cli.command("init-schema")
+    @click.argument("mode", required=False, type=click.Choice(["check"]))
+    def init_schema_command(mode):
+        """Create missing indexes and run migrations (or check drift)."""
+        sys.exit(main([mode] if mode else []))
+
+
+def main(argv) -> int:
+    db = app.database.get_db()
+    if db is None:
+        print("pymongo not installed")
+        return 1
+    if argv[:1] == ["check"]:
+        drift = index_drift(db)
+        print(f"schema version {stored_version(db)} (code expects {SCHEMA_VERSION})")
+        for collection, diff in drift.items():
+            for kind, names in diff.items():
+                for name in names:
+                    print(f"{collection}: {kind} {name}")
+        return 1 if drift or stored_version(db) != SCHEMA_VERSION else 0
+
+    report = bootstrap(db)
+    for name in report["created"]:
+        print(f"ok      {name}")
+    for name, error in report["failed"].items():
+        print(f"FAILED  {name}: {error}")
+    for version in report["migrated"]:
+        print(f"migrated to version {version}")
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
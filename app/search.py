@@ -0,0 +1,70 @@
+"""Catalog search backed by a MongoDB text index.
+
+The text index handles tokenizing, stemming and stop words for us (english),
+and gives every match a relevance score we can sort on. Unanchored regex
+matching is only kept for admin screens, where a full scan is acceptable.
+"""
+
+import re
+import sys
+
+try:
+    import pymongo
+except Exception:
+    pymongo = None
+
+TEXT_INDEX_NAME = "items_text"
+# name matches matter most, then tags, then the free-text description
+TEXT_INDEX_WEIGHTS = {"name": 10, "tags": 5, "description": 1}
+TEXT_INDEX_LANGUAGE = "english"
+
+SCORE_FIELD = "score"
+
+
+def text_index_model():
+    """IndexModel describing the catalog text index (created by app.schema)."""
+    return pymongo.IndexModel(
+        [(field, pymongo.TEXT) for field in TEXT_INDEX_WEIGHTS],
+        name=TEXT_INDEX_NAME,
+        weights=TEXT_INDEX_WEIGHTS,
+        default_language=TEXT_INDEX_LANGUAGE,
+    )
+
+
+def text_filter(q: str) -> dict:
+    """Filter matching items for a shopper's search terms."""
+    return {"$text": {"$search": q, "$language": TEXT_INDEX_LANGUAGE}}
+
+
+def prefix_filter(field: str, prefix: str) -> dict:
+    """Range match for values starting with `prefix`, e.g. "ab" -> ["ab", "ac").
+
+    Unlike a regex this is a plain index bound, so it is only as expensive
+    as the number of matches. An empty prefix matches everything.
+    """
+    if not prefix:
+        return {}
+    # a trailing U+10FFFF has no successor; bump the character before it
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return {field: {"$gte": prefix}}
+    last = ord(stem[-1]) + 1
+    if 0xD800 <= last <= 0xDFFF:
+        last = 0xE000  # surrogates can't be stored, skip past them
+    return {field: {"$gte": prefix, "$lt": stem[:-1] + chr(last)}}
+
+
+def admin_regex_filter(q: str) -> dict:
+    """Substring match over name/description/tags for admin tools only.
+
+    This cannot use an index and scans the whole collection, so it must not
+    be used on shopper-facing pages.
+    """
+    pattern = re.escape(q)
+    return {
+        "$or": [
+            {"name": {"$regex": pattern, "$options": "i"}},
+            {"description": {"$regex": pattern, "$options": "i"}},
+            {"tags": {"$regex": pattern, "$options": "i"}},
+        ]
+    }
@@ -0,0 +1,215 @@
+"""Signing backends and a key-rotating Signer.
+
+A signature looks like "<kid>.<base64url signature>", so the verifier knows
+which key made it. Several keys can be active at once: new signatures always
+use the newest one, older ones keep verifying until they are retired. That is
+how keys are rotated without logging everybody out.
+
+Backends:
+    hmac-sha256   stdlib, by far the fastest; sign and verify share a secret
+    ed25519       needs the optional `cryptography` package
+    ecdsa-p384    the original pure-Python ECDSA, slow but kept for old keys
+"""
+
+import base64
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from app.cache import TTLCache
+from app.records.keymodel import Key
+
+try:
+    from ecdsa import NIST384p, BadSignatureError, SigningKey
+except Exception:
+    SigningKey = None  # ecdsa not installed
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import (
+        Ed25519PrivateKey,
+        Ed25519PublicKey,
+    )
+except Exception:
+    Ed25519PrivateKey = None  # cryptography not installed
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _unb64(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class HmacSha256Backend:
+    name = "hmac-sha256"
+
+    def generate(self):
+        secret = secrets.token_bytes(32)
+        return secret, b""
+
+    def load(self, private: bytes, public: bytes):
+        def sign(data: bytes) -> bytes:
+            return hmac.new(private, data, hashlib.sha256).digest()
+
+        def verify(data: bytes, signature: bytes) -> bool:
+            return hmac.compare_digest(sign(data), signature)
+
+        return sign, verify
+
+
+class Ed25519Backend:
+    name = "ed25519"
+
+    def generate(self):
+        if Ed25519PrivateKey is None:
+            raise RuntimeError("ed25519 signing needs the 'cryptography' package")
+        key = Ed25519PrivateKey.generate()
+        return key.private_bytes_raw(), key.public_key().public_bytes_raw()
+
+    def load(self, private: bytes, public: bytes):
+        if Ed25519PrivateKey is None:
+            raise RuntimeError("ed25519 signing needs the 'cryptography' package")
+        sk = Ed25519PrivateKey.from_private_bytes(private)
+        vk = Ed25519PublicKey.from_public_bytes(public)
+
+        def verify(data: bytes, signature: bytes) -> bool:
+            try:
+                vk.verify(signature, data)
+                return True
+            except InvalidSignature:
+                return False
+
+        return sk.sign, verify
+
+
+class EcdsaP384Backend:
+    name = "ecdsa-p384"
+
+    def generate(self):
+        if SigningKey is None:
+            raise RuntimeError("ecdsa signing needs the 'ecdsa' package")
+        sk = SigningKey.generate(curve=NIST384p)
+        return sk.to_string(), sk.verifying_key.to_string()
+
+    def load(self, private: bytes, public: bytes):
+        if SigningKey is None:
+            raise RuntimeError("ecdsa signing needs the 'ecdsa' package")
+        sk = SigningKey.from_string(private, curve=NIST384p)
+        vk = sk.verifying_key
+
+        def sign(data: bytes) -> bytes:
+            return sk.sign_deterministic(data, hashfunc=hashlib.sha384)
+
+        def verify(data: bytes, signature: bytes) -> bool:
+            try:
+                return vk.verify(signature, data, hashfunc=hashlib.sha384)
+            except BadSignatureError:
+                return False
+
+        return sign, verify
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (HmacSha256Backend(), Ed25519Backend(), EcdsaP384Backend())
+}
+DEFAULT_ALGORITHM = "hmac-sha256"
+
+
+def generate_key(name: str, algorithm: str = DEFAULT_ALGORITHM) -> Key:
+    """New key document (not stored). Key material is base64url encoded."""
+    private, public = BACKENDS[algorithm].generate()
+    return Key(
+        name=name,
+        kid=secrets.token_hex(4),
+        algorithm=algorithm,
+        private=_b64(private),
+        public=_b64(public),
+        created_at=datetime.now(timezone.utc),
+        active=True,
+    )
+
+
+class _LoadedKey:
+    __slots__ = ("kid", "sign", "verify")
+
+    def __init__(self, key: Key):
+        self.kid = key["kid"]
+        self.sign, self.verify = BACKENDS[key["algorithm"]].load(
+            _unb64(key["private"]), _unb64(key["public"])
+        )
+
+
+class Signer:
+    """Signs and verifies strings with a set of rotating keys.
+
+    `loader` returns the active keys, newest first. It is called lazily on
+    first use and again every `refresh_seconds` so rotations made by other
+    processes are picked up. Verification results are cached, since the same
+    cookie or token is usually checked on every request of a session.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[], List[Key]],
+        refresh_seconds: float = 60.0,
+        cache_size: int = 10000,
+        cache_ttl: float = 300.0,
+    ):
+        self.name = name
+        self._loader = loader
+        self._refresh_seconds = refresh_seconds
+        self._keys: Dict[str, _LoadedKey] = {}
+        self._signing: Optional[_LoadedKey] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.verify_cache = TTLCache(
+            f"signer:{name}", max_size=cache_size, ttl=cache_ttl
+        )
+
+    def reload(self) -> None:
+        keys = self._loader()
+        if not keys:
+            raise RuntimeError(f"no active keys for signer {self.name!r}")
+        loaded = {key["kid"]: _LoadedKey(key) for key in keys}
+        with self._lock:
+            if set(loaded) != set(self._keys):
+                # a key was retired, its cached "valid" answers must go too
+                self.verify_cache.clear()
+            self._keys = loaded
+            self._signing = loaded[keys[0]["kid"]]
+            self._loaded_at = time.monotonic()
+
+    def _ensure_keys(self) -> None:
+        if self._signing is None or (
+            time.monotonic() - self._loaded_at > self._refresh_seconds
+        ):
+            self.reload()
+
+    def sign(self, data: str) -> str:
+        self._ensure_keys()
+        key = self._signing
+        return f"{key.kid}.{_b64(key.sign(data.encode()))}"
+
+    def verify(self, data: str, signature: str) -> bool:
+        cached = self.verify_cache.get((data, signature))
+        if cached is not None:
+            return cached
+        self._ensure_keys()
+        kid, _, encoded = signature.partition(".")
+        key = self._keys.get(kid)
+        if key is None:
+            return False
+        try:
+            valid = key.verify(data.encode(), _unb64(encoded))
+        except Exception:
+            valid = False
+        self.verify_cache.put((data, signature), valid)
+        return valid
@@ -16,24 +16,45 @@ document.addEventListener('DOMContentLoaded', () =>
     async function fetchAndDisplayItems()
     {
         listContainer.textContent = 'Loading items...';
+        items = [];
         try
         {
-            const resp = await fetch('/admin/items/list', {credentials : 'same-origin'});
-            const data = await resp.json();
+            // the list is streamed as NDJSON so rows show up as they arrive
+            const resp = await fetch('/admin/items/list?format=ndjson', {credentials : 'same-origin'});
             if(!resp.ok) // check for a bad response
             {
+                const data = await resp.json().catch(() => ({}));
                 listContainer.innerHTML = `<div class="alert alert-danger">${data.error || 'Failed to load items'}</div>`;
                 return;
             }
-            items = data.items || [];
+
+            let tbody = null; // table is built once, when the first row arrives
+            const reader = resp.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = '';
+            while(true)
+            {
+                const {done, value} = await reader.read();
+                if(value) buffered += decoder.decode(value, {stream: true});
+                if(done) buffered += decoder.decode();
+
+                // keep any partial line around until the rest of it arrives
+                const parts = buffered.split('\n');
+                buffered = done ? '' : parts.pop();
+                const batch = parts.filter(line => line.trim()).map(line => JSON.parse(line));
+                if(batch.length > 0)
+                {
+                    if(!tbody) tbody = buildTable();
+                    appendRows(tbody, batch);
+                    items.push(...batch);
+                }
+                if(done) break;
+            }
+
             if(items.length === 0) // check if there are no items
             {
                 listContainer.innerHTML = '<div class="alert alert-info">No items found.</div>';
-                return;
             }
-            // build the items list
-            listContainer.innerHTML = '';
-            renderItems(items);
         }
         catch(err)
         {
@@ -42,14 +63,29 @@ document.addEventListener('DOMContentLoaded', () =>
         }
     } // end of fetchAndDisplayItems
 
-    function renderItems(itemsList)
+    function buildTable()
     {
-        if(!itemsList || itemsList.length === 0)
-        {
-            listContainer.innerHTML = '<div class="alert alert-info">No items found.</div>';
-            return;
-        }
+        listContainer.innerHTML = `
+            <table class="table table-striped">
+                <thead>
+                    <tr>
+                        <th>ID</th>
+                        <th>Image</th>
+                        <th>Name</th>
+                        <th>Price ($)</th>
+                        <th>Category</th>
+                        <th>Stock</th>
+                        <th>Actions</th>
+                    </tr>
+                </thead>
+                <tbody></tbody>
+            </table>
+        `;
+        return listContainer.querySelector('tbody');
+    } // end of buildTable
 
+    function appendRows(tbody, itemsList)
+    {
         const tableRows = itemsList.map(item => 
         {
             const imgHtml = (item.image_urls && item.image_urls.length > 0)
@@ -81,76 +117,60 @@ document.addEventListener('DOMContentLoaded', () =>
             `;
         }).join('');
 
-        // now put the rows into the list container
-        listContainer.innerHTML = `
-            <table class="table table-striped">
-                <thead>
-                    <tr>
-                        <th>ID</th>
-                        <th>Image</th>
-                        <th>Name</th>
-                        <th>Price ($)</th>
-                        <th>Category</th>
-                        <th>Stock</th>
-                        <th>Actions</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    ${tableRows}
-                </tbody>
-            </table>
-        `;
-        
-        // add event listeners for edit and delete buttons
+        // append, so rows that already rendered stay put
+        tbody.insertAdjacentHTML('beforeend', tableRows);
+    } // end of appendRows
+
+    // one listener for every row's edit and delete buttons, including rows streamed in later
+    listContainer.addEventListener('click', async (ev) =>
+    {
+        const button = ev.target.closest('.admin-item-edit, .admin-item-delete');
+        if(!button) return;
+        const itemId = button.closest('tr').getAttribute('data-item-id');
+        const item = items.find(i => i._id === itemId);
+
         // edit:
-        listContainer.querySelectorAll('.admin-item-edit').forEach(button =>
+        if(button.classList.contains('admin-item-edit'))
         {
-            button.addEventListener('click', (ev) =>
+            if(item)
             {
-                const itemId = button.closest('tr').getAttribute('data-item-id');
-                const item = itemsList.find(i => i._id === itemId);
-                if(item)
-                {
-                    startEditMode(item);
-                }
-            });
-        });
+                startEditMode(item);
+            }
+            return;
+        }
 
         // delete:
-        listContainer.querySelectorAll('.admin-item-delete').forEach(button =>
+        const itemName = item?.name || 'this item';
+        if(confirm(`Are you sure you want to delete "${itemName}"? This action cannot be undone.`))
         {
-            button.addEventListener('click', async (ev) =>
+            try
             {
-                const itemId = button.closest('tr').getAttribute('data-item-id');
-                const itemName = itemsList.find(i => i._id === itemId)?.name || 'this item';
-                if(confirm(`Are you sure you want to delete "${itemName}"? This action cannot be undone.`))
+                const resp = await fetch(`/admin/items/delete/${itemId}`,
                 {
-                    try
-                    {
-                        const resp = await fetch(`/admin/items/delete/${itemId}`,
-                        {
-                            method: 'POST',
-                            credentials: 'same-origin'
-                        });
-                        const data = await resp.json();
-                        if(!resp.ok)
-                        {
-                            alert(data.error || 'Failed to delete item');
-                            return;
-                        }
-                        // remove item from local array and re-render
-                        items = items.filter(i => i._id !== itemId);
-                        fetchAndDisplayItems();
-                    }
-                    catch(err)
-                    {
-                        alert('Network error');
-                        console.error(err);
-                    }
+                    method: 'POST',
+                    credentials: 'same-origin'
+                });
+                const data = await resp.json();
+                if(!resp.ok)
+                {
+                    alert(data.error || 'Failed to delete item');
+                    return;
+                }
+                // drop the row locally instead of re-streaming the whole list
+                items = items.filter(i => i._id !== itemId);
+                button.closest('tr').remove();
+                if(items.length === 0)
+                {
+                    listContainer.innerHTML = '<div class="alert alert-info">No items found.</div>';
                 }
-            });
-        });
-    } // end of renderItems
+            }
+            catch(err)
+            {
+                alert('Network error');
+                console.error(err);
+            }
+        }
+    });
 
     function startEditMode(item)
     {
@@ -9,6 +9,15 @@
  * 5. Applying discount codes on the cart page.
  */
 
+// Last cart_version the cart page rendered. Sent back with edits so the
+// server can tell us (409) when another tab changed the cart first.
+let cartVersion = null;
+
+// Last GET /api/cart response and its ETag. Reloads send If-None-Match and
+// reuse this copy when the server answers 304 Not Modified.
+let cartEtag = null;
+let cartData = null;
+
 // Wait for the full page to load before running our code
 document.addEventListener("DOMContentLoaded", () => {
   // --- Global Toast Setup ---
@@ -171,19 +180,12 @@ async function handleAddToCartClick(button, toast) {
   button.disabled = true;
 
   try {
-    // This is the API call to our backend
-    const response = await fetch("/api/cart/add", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ product_id: productId, quantity: 1 }),
-    });
-
-    const data = await response.json();
-    if (!response.ok) throw new Error(data.message || "Could not add item.");
+    // Quick clicks are queued and sent together (see queueCartAdd)
+    const data = await queueCartAdd(productId);
 
     // Show notification and update badge
-    showNotification(toast, data.message || "Item added to cart!", "success");
-    updateCartCountBadge(data.cart_item_count);
+    showNotification(toast, "Item added to cart!", "success");
+    updateCartCountBadge(data.item_count);
   } catch (error) {
     console.error("Error adding to cart:", error);
     showNotification(toast, error.message, "danger");
@@ -194,6 +196,55 @@ async function handleAddToCartClick(button, toast) {
   }
 }
 
+/**
+ * 1b. Batches "Add to Cart" clicks
+ *
+ * Clicks that land within a short window are merged into one
+ * POST /api/cart/batch call, so adding several items costs one round trip.
+ */
+const ADD_BATCH_DELAY_MS = 150;
+let pendingAdds = [];
+let pendingAddsTimer = null;
+
+function queueCartAdd(productId) {
+  return new Promise((resolve, reject) => {
+    pendingAdds.push({ productId, resolve, reject });
+    if (!pendingAddsTimer) {
+      pendingAddsTimer = setTimeout(flushCartAdds, ADD_BATCH_DELAY_MS);
+    }
+  });
+}
+
+async function flushCartAdds() {
+  const batch = pendingAdds;
+  pendingAdds = [];
+  pendingAddsTimer = null;
+
+  // merge repeated clicks on the same product into one op
+  const quantities = {};
+  batch.forEach(({ productId }) => {
+    quantities[productId] = (quantities[productId] || 0) + 1;
+  });
+  const ops = Object.entries(quantities).map(([product_id, quantity]) => ({
+    op: "add",
+    product_id,
+    quantity,
+  }));
+
+  try {
+    const response = await fetch("/api/cart/batch", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ ops }),
+    });
+    const data = await response.json();
+    if (!response.ok) throw new Error(data.message || "Could not add item.");
+    batch.forEach(({ resolve }) => resolve(data));
+  } catch (error) {
+    batch.forEach(({ reject }) => reject(error));
+  }
+}
+
 /**
  * 2. Fetches cart data and builds the cart page table
  */
@@ -207,13 +258,21 @@ async function loadCartTable(cartTableBody) {
     </td></tr>`;
 
   try {
-    // Get the cart data from API
-    const response = await fetch("/api/cart");
-    const data = await response.json();
-
-    if (!response.ok) {
-      throw new Error("Could not load cart.");
+    // Get the cart data from API (304 = our copy is still current)
+    const headers = cartEtag && cartData ? { "If-None-Match": cartEtag } : {};
+    const response = await fetch("/api/cart", { headers, cache: "no-cache" });
+    let data;
+    if (response.status === 304) {
+      data = cartData;
+    } else {
+      data = await response.json();
+      if (!response.ok) {
+        throw new Error("Could not load cart.");
+      }
+      cartEtag = response.headers.get("ETag");
+      cartData = data;
     }
+    cartVersion = data.cart_version;
 
     if (!data.items || data.items.length === 0) {
       // Show empty cart message
@@ -283,8 +342,13 @@ async function updateCartItem(productId, quantity, cartTableBody) {
     const response = await fetch("/api/cart/update", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ product_id: productId, quantity: quantity }),
+      body: JSON.stringify({ product_id: productId, quantity: quantity, cart_version: cartVersion }),
     });
+    if (response.status === 409) {
+      // someone else changed the cart, show the current one instead
+      loadCartTable(cartTableBody);
+      return;
+    }
     if (!response.ok) throw new Error("Could not update item");
 
     const data = await response.json();
@@ -303,8 +367,12 @@ async function removeCartItem(productId, cartTableBody) {
     const response = await fetch("/api/cart/remove", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ product_id: productId }),
+      body: JSON.stringify({ product_id: productId, cart_version: cartVersion }),
     });
+    if (response.status === 409) {
+      loadCartTable(cartTableBody);
+      return;
+    }
     if (!response.ok) throw new Error("Could not remove item");
 
     const data = await response.json();
@@ -325,9 +393,9 @@ async function updateCartCountBadge(count) {
   let totalItems = count;
 
   if (totalItems === undefined) {
-    // If count wasn't provided, fetch it from the API
+    // If count wasn't provided, ask the cheap count endpoint (no pricing)
     try {
-      const response = await fetch("/api/cart");
+      const response = await fetch("/api/cart/count");
       if (!response.ok) return;
       const data = await response.json();
       totalItems = data.item_count || 0;
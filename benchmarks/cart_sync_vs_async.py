@@ -0,0 +1,188 @@
+"""Cart API throughput: the Flask (sync) views vs the ASGI (async) path.
+
+Both paths run in-process against the Mongo configured by CONFIG_MONGODB_*:
+
+    python -m benchmarks.cart_sync_vs_async --concurrency 256 --requests 5000
+
+The sync side uses Flask test clients on `--concurrency` threads (what a
+threaded WSGI server does); the async side calls app.asgi.application with
+`--concurrency` coroutines on one event loop. Every request is an add to
+cart followed by a cart read, for a pool of benchmark users that log in
+with auth tokens. Raise --concurrency to see where the thread-per-request
+path stops scaling.
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from uuid import uuid4
+
+import app.database
+from app import app as flask_app
+from app.asgi import application
+from app.records.users import get_users
+
+from benchmarks.login_storm import percentile
+
+BENCH_USER_PREFIX = "bench_cart_"
+
+
+def setup(users: int):
+    database = app.database.get_db()
+    item_id = (
+        database["items"]
+        .insert_one(
+            {
+                "name": "Benchmark cart item",
+                "description": "created by benchmarks/cart_sync_vs_async.py",
+                "price_cents": 250,
+                "category": "other",
+                "stock": 1_000_000,
+                "image_urls": [],
+                "tags": ["benchmark"],
+            }
+        )
+        .inserted_id
+    )
+    tokens = []
+    docs = []
+    for i in range(users):
+        token = uuid4().hex
+        tokens.append(token)
+        docs.append(
+            {
+                "name": f"{BENCH_USER_PREFIX}{i}_{token[:6]}",
+                "password_hash": "",
+                "permissions": "user",
+                "activated": True,
+                "auth_token": token,
+                "cart": [],
+            }
+        )
+    get_users().insert_many(docs)
+    return item_id, tokens
+
+
+def teardown(item_id) -> None:
+    database = app.database.get_db()
+    database["items"].delete_one({"_id": item_id})
+    get_users().delete_many({"name": {"$regex": f"^{BENCH_USER_PREFIX}"}})
+
+
+def run_sync(item_id, tokens, concurrency: int, requests: int):
+    latencies = []
+    statuses: dict = {}
+    lock = threading.Lock()
+    remaining = [requests]
+    body = {"product_id": str(item_id), "quantity": 1}
+
+    def worker(token: str):
+        client = flask_app.test_client(use_cookies=False)
+        headers = {"Authorization": f"Bearer {token}"}
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            status = client.post(
+                "/api/cart/add", json=body, headers=headers
+            ).status_code
+            client.get("/api/cart", headers=headers)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [
+        threading.Thread(target=worker, args=(tokens[i % len(tokens)],))
+        for i in range(concurrency)
+    ]
+    began = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - began, latencies, statuses
+
+
+async def asgi_call(method: str, path: str, token: str, body=None) -> int:
+    payload = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "headers": [
+            (b"authorization", f"Bearer {token}".encode()),
+            (b"content-type", b"application/json"),
+        ],
+    }
+    status = [0]
+
+    async def receive():
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status[0] = message["status"]
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+async def run_async(item_id, tokens, concurrency: int, requests: int):
+    latencies = []
+    statuses: dict = {}
+    remaining = [requests]
+    body = {"product_id": str(item_id), "quantity": 1}
+
+    async def worker(token: str):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            started = time.perf_counter()
+            status = await asgi_call("POST", "/api/cart/add", token, body)
+            await asgi_call("GET", "/api/cart", token)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    began = time.perf_counter()
+    await asyncio.gather(*(worker(tokens[i % len(tokens)]) for i in range(concurrency)))
+    elapsed = time.perf_counter() - began
+    await app.database.close_async_db()
+    return elapsed, latencies, statuses
+
+
+def report(label: str, elapsed: float, latencies: list, statuses: dict) -> None:
+    print(f"{label:<6} requests/second  {len(latencies) / elapsed:.1f}")
+    print(f"{label:<6} p50              {percentile(latencies, 0.50) * 1000:.1f}ms")
+    print(f"{label:<6} p99              {percentile(latencies, 0.99) * 1000:.1f}ms")
+    print(f"{label:<6} responses        {dict(sorted(statuses.items()))}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=32)
+    args = parser.parse_args()
+
+    item_id, tokens = setup(args.users)
+    try:
+        sync_result = run_sync(item_id, tokens, args.concurrency, args.requests)
+        async_result = asyncio.run(
+            run_async(item_id, tokens, args.concurrency, args.requests)
+        )
+    finally:
+        teardown(item_id)
+
+    print(f"concurrency {args.concurrency}, {args.requests} add+read pairs per path")
+    report("sync", *sync_result)
+    report("async", *async_result)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,118 @@
+"""Hammer one hot item with concurrent checkouts and check nothing oversells.
+
+Needs a running Mongo (same CONFIG_MONGODB_* variables as the app):
+
+    python -m benchmarks.checkout_concurrency --threads 32 --stock 500
+
+Every thread keeps placing 1-unit orders for the same item until it sells
+out. At the end the number of successful orders must equal the starting
+stock and the item's stock must be exactly zero.
+"""
+
+import argparse
+import threading
+import time
+from datetime import datetime
+
+import app.database
+from app.records.orders import InsufficientStock, db_order_place
+
+
+def run(threads: int, stock: int, quantity: int) -> int:
+    database = app.database.get_db()
+    items = database["items"]
+    orders = database["orders"]
+    item_id = items.insert_one(
+        {
+            "name": "Benchmark hot item",
+            "description": "created by benchmarks/checkout_concurrency.py",
+            "price_cents": 100,
+            "category": "other",
+            "stock": stock,
+            "image_urls": [],
+            "tags": ["benchmark"],
+        }
+    ).inserted_id
+
+    placed = []
+    rejected = [0]
+    errors = []
+    lock = threading.Lock()
+    start_gate = threading.Event()
+
+    def worker():
+        start_gate.wait()
+        while True:
+            order = {
+                "owner": "benchmark",
+                "items": [
+                    {
+                        "product_id": str(item_id),
+                        "name": "Benchmark hot item",
+                        "price_cents": 100,
+                        "quantity": quantity,
+                        "total_price_cents": 100 * quantity,
+                    }
+                ],
+                "created_at": datetime.utcnow(),
+                "status": "benchmark",
+            }
+            started = time.perf_counter()
+            try:
+                # kept out of order_stats: these orders are deleted below
+                order_id = db_order_place(order, record_stats=False)
+            except InsufficientStock:
+                with lock:
+                    rejected[0] += 1
+                return
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                return
+            with lock:
+                placed.append((order_id, time.perf_counter() - started))
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    began = time.perf_counter()
+    start_gate.set()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - began
+
+    final_stock = items.find_one({"_id": item_id})["stock"]
+    sold = len(placed) * quantity
+    latencies = sorted(latency for _, latency in placed) or [0.0]
+
+    print(f"threads            {threads}")
+    print(f"starting stock     {stock}")
+    print(f"orders placed      {len(placed)} ({sold} units)")
+    print(f"orders rejected    {rejected[0]}")
+    print(f"errors             {len(errors)}")
+    print(f"final stock        {final_stock}")
+    print(f"elapsed            {elapsed:.2f}s")
+    print(f"checkouts/second   {len(placed) / elapsed:.1f}")
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"p50 / p99 latency  {p50:.1f}ms / {p99:.1f}ms")
+
+    ok = final_stock >= 0 and sold + final_stock == stock and not errors
+    print("no oversell" if ok else "OVERSOLD OR LOST STOCK")
+
+    orders.delete_many({"_id": {"$in": [order_id for order_id, _ in placed]}})
+    items.delete_one({"_id": item_id})
+    return 0 if ok else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--stock", type=int, default=500)
+    parser.add_argument("--quantity", type=int, default=1, help="units per order")
+    args = parser.parse_args()
+    return run(args.threads, args.stock, args.quantity)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
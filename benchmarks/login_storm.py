@@ -0,0 +1,106 @@
+"""Login storm: how many logins/second we handle and what it does to the catalog.
+
+Runs the Flask app in-process (test clients on real threads) against the
+Mongo configured by CONFIG_MONGODB_*:
+
+    python -m benchmarks.login_storm --login-threads 16 --catalog-threads 4
+
+First the catalog is measured alone, then again while the login threads
+hammer /login. Compare the two p99 numbers; with the hashing pool they
+should stay close. Try different ARGON2_WORKERS values.
+"""
+
+import argparse
+import threading
+import time
+
+from app import app
+from app.records.users import db_user_create, get_users
+
+BENCH_USER_PREFIX = "bench_login_"
+PASSWORD = "bench-password"
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct))]
+
+
+def catalog_worker(stop: threading.Event, latencies: list, lock: threading.Lock):
+    client = app.test_client()
+    while not stop.is_set():
+        started = time.perf_counter()
+        client.get("/")
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+
+
+def login_worker(stop: threading.Event, name: str, counts: dict, lock: threading.Lock):
+    while not stop.is_set():
+        # no cookies, so every request is a fresh login
+        client = app.test_client(use_cookies=False)
+        resp = client.post("/login", json={"username": name, "password": PASSWORD})
+        with lock:
+            counts[resp.status_code] = counts.get(resp.status_code, 0) + 1
+
+
+def measure_catalog(threads: int, seconds: float, login_threads: int, users: list):
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies: list = []
+    counts: dict = {}
+    workers = [
+        threading.Thread(target=catalog_worker, args=(stop, latencies, lock))
+        for _ in range(threads)
+    ] + [
+        threading.Thread(
+            target=login_worker, args=(stop, users[i % len(users)], counts, lock)
+        )
+        for i in range(login_threads)
+    ]
+    for w in workers:
+        w.start()
+    time.sleep(seconds)
+    stop.set()
+    for w in workers:
+        w.join()
+    return latencies, counts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--login-threads", type=int, default=16)
+    parser.add_argument("--catalog-threads", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--users", type=int, default=8)
+    args = parser.parse_args()
+
+    app.config["WTF_CSRF_ENABLED"] = False
+    users = [f"{BENCH_USER_PREFIX}{i}" for i in range(args.users)]
+    for name in users:
+        db_user_create(name, PASSWORD)  # None if it already exists, that's fine
+
+    try:
+        quiet, _ = measure_catalog(args.catalog_threads, args.seconds, 0, users)
+        storm, counts = measure_catalog(
+            args.catalog_threads, args.seconds, args.login_threads, users
+        )
+    finally:
+        get_users().delete_many({"name": {"$in": users}})
+
+    logins = counts.get(200, 0)
+    print(f"login threads        {args.login_threads}")
+    print(f"logins/second        {logins / args.seconds:.1f}")
+    print(f"login responses      {dict(sorted(counts.items()))}")
+    print(f"catalog p50 quiet    {percentile(quiet, 0.50) * 1000:.1f}ms")
+    print(f"catalog p99 quiet    {percentile(quiet, 0.99) * 1000:.1f}ms")
+    print(f"catalog p50 storm    {percentile(storm, 0.50) * 1000:.1f}ms")
+    print(f"catalog p99 storm    {percentile(storm, 0.99) * 1000:.1f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
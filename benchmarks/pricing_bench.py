@@ -0,0 +1,171 @@
+"""Pricing engine: batch repricing throughput.
+
+Runs on synthetic data, so no database is needed:
+
+    python -m benchmarks.pricing_bench --lines 100000 --orders 50000
+
+One 100k-line cart is repriced and tax is re-run over a synthetic order
+history, through both the plain-Python path and the NumPy path (if NumPy is
+installed); the two must agree to the cent. Pass --from-db to re-run
+pricing over the real `orders` collection instead and report orders whose
+stored totals differ. The golden totals live in tests/test_pricing.py.
+"""
+
+import argparse
+import random
+import time
+
+from app import pricing
+from app.pricing import order_lines, price_batch
+
+
+def _paths():
+    paths = [pricing._price_batch_python]
+    if pricing.np is not None:
+        paths.append(pricing._price_batch_numpy)
+    return paths
+
+
+def synthetic_lines(lines: int, carts: int, seed: int):
+    rng = random.Random(seed)
+    cart_index = sorted(rng.randrange(carts) for _ in range(lines))
+    prices = [rng.randrange(99, 20_000) for _ in range(lines)]
+    quantities = [rng.randrange(1, 6) for _ in range(lines)]
+    eligible = [rng.random() < 0.3 for _ in range(lines)]
+    discount_bp = [rng.choice((0, 0, 500, 1000, 2000)) for _ in range(carts)]
+    return cart_index, prices, quantities, eligible, discount_bp
+
+
+def timed(path, repeat: int, *args):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = path(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def compare(label: str, lines: int, n_carts: int, args, repeat: int) -> None:
+    results = []
+    for path in _paths():
+        elapsed, result = timed(path, repeat, *args)
+        results.append([list(map(int, col)) for col in result])
+        name = "numpy" if path is not pricing._price_batch_python else "python"
+        print(
+            f"{label:<16}{name:<8}{elapsed * 1000:>10.1f}ms"
+            f"{lines / elapsed:>16,.0f} lines/s"
+        )
+    for other in results[1:]:
+        if other != results[0]:
+            raise SystemExit(f"{label}: numpy and python totals differ")
+    if pricing.np is None:
+        print(f"{label:<16}numpy   skipped: numpy is not installed")
+
+
+def reprice_history(batch_size: int) -> int:
+    import app.database
+
+    database = app.database.get_db()
+    projection = {
+        "items.price_cents": 1,
+        "items.quantity": 1,
+        "items.discount_eligible": 1,
+        "discount_cents": 1,
+        "tax_cents": 1,
+        "total_cents": 1,
+        "tax_rate_bp": 1,
+        "discount_percent": 1,
+    }
+    checked = mismatched = lines = 0
+    started = time.perf_counter()
+    batch = []
+    for order in database["orders"].find({}, projection).batch_size(batch_size):
+        batch.append(order)
+        if len(batch) >= batch_size:
+            bad, ln = _reprice_batch(batch)
+            checked, mismatched, lines = (
+                checked + len(batch),
+                mismatched + bad,
+                lines + ln,
+            )
+            batch = []
+    if batch:
+        bad, ln = _reprice_batch(batch)
+        checked, mismatched, lines = checked + len(batch), mismatched + bad, lines + ln
+    elapsed = time.perf_counter() - started
+    print(f"orders checked    {checked} ({lines} lines) in {elapsed:.2f}s")
+    print(f"orders mismatched {mismatched}")
+    return 0
+
+
+def _reprice_batch(orders) -> tuple:
+    """Reprice a batch of orders with one price_batch() call.
+
+    Returns (orders whose stored discount/tax/total differ, lines priced).
+    """
+    cart_index, prices, quantities, eligible, discount_bp, tax_bp = order_lines(orders)
+    _, discount, tax, total = price_batch(
+        cart_index, prices, quantities, len(orders), eligible, discount_bp, tax_bp
+    )
+    mismatched = sum(
+        1
+        for n, order in enumerate(orders)
+        if (int(discount[n]), int(tax[n]), int(total[n]))
+        != (
+            order.get("discount_cents", 0),
+            order.get("tax_cents"),
+            order.get("total_cents"),
+        )
+    )
+    return mismatched, len(cart_index)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=100_000)
+    parser.add_argument("--orders", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--from-db", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    if args.from_db:
+        return reprice_history(args.batch_size)
+
+    cart_index, prices, quantities, eligible, discount_bp = synthetic_lines(
+        args.lines, 1, args.seed
+    )
+    compare(
+        "one big cart",
+        args.lines,
+        1,
+        (cart_index, prices, quantities, 1, eligible, discount_bp, pricing.TAX_RATE_BP),
+        args.repeat,
+    )
+
+    history_lines = args.orders * 4
+    cart_index, prices, quantities, eligible, discount_bp = synthetic_lines(
+        history_lines, args.orders, args.seed + 1
+    )
+    compare(
+        "order history",
+        history_lines,
+        args.orders,
+        (
+            cart_index,
+            prices,
+            quantities,
+            args.orders,
+            None,
+            discount_bp,
+            pricing.TAX_RATE_BP,
+        ),
+        args.repeat,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,60 @@
+"""Sign/verify operations per second for each signing backend.
+
+Uses throwaway in-memory keys, so no database is needed:
+
+    python -m benchmarks.signer_bench --seconds 2
+"""
+
+import argparse
+import time
+
+from app.signers import BACKENDS, Signer, generate_key
+
+PAYLOAD = "session=5f0c3e9a8b7d6c5e4f3a2b1c; user=6523f0a9e1d2c3b4a5968778"
+
+
+def ops_per_second(fn, seconds: float) -> float:
+    count = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(50):
+            fn()
+        count += 50
+    return count / (time.perf_counter() - started)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(f"{'backend':<14}{'sign/s':>12}{'verify/s':>12}{'cached verify/s':>18}")
+    for algorithm in BACKENDS:
+        try:
+            key = generate_key("bench", algorithm)
+        except RuntimeError as e:
+            print(f"{algorithm:<14}  skipped: {e}")
+            continue
+        signer = Signer("bench-" + algorithm, loader=lambda key=key: [key])
+        signature = signer.sign(PAYLOAD)
+
+        sign_rate = ops_per_second(lambda: signer.sign(PAYLOAD), args.seconds)
+
+        def verify_uncached():
+            signer.verify_cache.clear()
+            signer.verify(PAYLOAD, signature)
+
+        verify_rate = ops_per_second(verify_uncached, args.seconds)
+        cached_rate = ops_per_second(
+            lambda: signer.verify(PAYLOAD, signature), args.seconds
+        )
+        print(
+            f"{algorithm:<14}{sign_rate:>12,.0f}"
+            f"{verify_rate:>12,.0f}{cached_rate:>18,.0f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
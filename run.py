@@ -1,9 +1,9 @@
 from app import app
-from app.database import init_db, create_item
+from app.database import ping_db, create_item
 from app.records.usermodel import ItemCategory
 
 if __name__ == "__main__":
-    if init_db():
+    if ping_db():
         # example seed item
         create_item(
             name="Test item",
@@ -0,0 +1,49 @@
+"""The HashingBusy limit counts hashes until they finish, not until we stop waiting."""
+
+import threading
+import time
+
+import pytest
+
+from app.records import passwords
+from app.records.passwords import HashingBusy
+
+
+@pytest.fixture
+def one_slot(monkeypatch):
+    monkeypatch.setattr(passwords, "_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(passwords, "WAIT_SECONDS", 0.05)
+
+
+def test_timed_out_hash_keeps_its_slot_until_it_finishes(one_slot):
+    release = threading.Event()
+    finished = threading.Event()
+
+    def slow_hash():
+        release.wait(5)
+        finished.set()
+        return "hash"
+
+    with pytest.raises(HashingBusy):
+        passwords._run(slow_hash)
+    # the first hash is still running, so there is no room for another
+    with pytest.raises(HashingBusy):
+        passwords._run(lambda: "hash")
+
+    release.set()
+    assert finished.wait(5)
+    for _ in range(100):
+        try:
+            assert passwords._run(lambda: "hash") == "hash"
+            break
+        except HashingBusy:
+            # the done callback may run a moment after the hash returns
+            time.sleep(0.01)
+    else:
+        pytest.fail("slot was never released")
+
+
+def test_hash_and_verify_round_trip():
+    pw_hash = passwords.hash_password("correct horse")
+    assert passwords.verify_password(pw_hash, "correct horse")
+    assert not passwords.verify_password(pw_hash, "battery staple")
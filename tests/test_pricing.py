@@ -0,0 +1,130 @@
+"""Golden totals for app.pricing: exact cents, half-up rounding, discount before tax."""
+
+import pytest
+
+from app import pricing
+from app.pricing import (
+    factor_to_bp,
+    order_lines,
+    percent_of,
+    percent_to_bp,
+    price_batch,
+    quote,
+)
+
+
+@pytest.mark.parametrize(
+    "subtotal, discount, tax_bp, expected",
+    [
+        (0, 0, 825, (0, 0, 0, 0)),
+        (999, 0, 825, (999, 0, 82, 1081)),
+        (1947, 300, 825, (1947, 300, 136, 1783)),
+        # 8.25% of 200 is 16.5 -> 17 (round() would give 16)
+        (200, 0, 825, (200, 0, 17, 217)),
+        (600, 0, 825, (600, 0, 50, 650)),
+        # discount can't exceed the subtotal
+        (500, 900, 825, (500, 500, 0, 0)),
+    ],
+)
+def test_quote(subtotal, discount, tax_bp, expected):
+    assert quote(subtotal, discount, tax_bp).as_tuple() == expected
+
+
+@pytest.mark.parametrize(
+    "amount, bp, expected",
+    [
+        (1947, 2000, 389),
+        (1947, 500, 97),
+        (1498, 2000, 300),
+        (10, 2500, 3),  # 2.5 -> 3
+        (2, 2500, 1),  # 0.5 -> 1
+    ],
+)
+def test_percent_of(amount, bp, expected):
+    assert percent_of(amount, bp) == expected
+
+
+@pytest.mark.parametrize(
+    "percent, expected",
+    [
+        (20, 2000),
+        (5, 500),
+        ("8.25", 825),
+        (8.25, 825),
+        (0, 0),
+        (12.5, 1250),
+        (12.345, 1235),  # half up, not truncated
+        (1e-05, 0),
+        (0.005, 1),
+        (1e2, 10000),
+    ],
+)
+def test_percent_to_bp(percent, expected):
+    assert percent_to_bp(percent) == expected
+
+
+@pytest.mark.parametrize(
+    "factor, price, expected",
+    [
+        (0.9, 1995, 1796),  # 1795.5 -> 1796
+        (1.15, 100, 115),  # 1.15 * 100 is 114.999... as a float
+        (0.5, 5, 3),  # 2.5 -> 3 (Mongo's $round would give 2)
+        (1, 1234, 1234),
+    ],
+)
+def test_price_factor_rounds_half_up(factor, price, expected):
+    assert percent_of(price, factor_to_bp(factor)) == expected
+
+
+# three carts: plain, 20% off the coffee lines only, no discount
+BATCH = dict(
+    cart_index=[0, 1, 1, 1, 2],
+    prices=[999, 749, 449, 599, 200],
+    quantities=[1, 2, 1, 1, 1],
+    n_carts=3,
+    eligible=[False, True, False, True, False],
+    discount_bp=[0, 2000, 0],
+    tax_bp=825,
+)
+BATCH_TOTALS = [(999, 0, 82, 1081), (2546, 419, 175, 2302), (200, 0, 17, 217)]
+
+
+def _rows(result, n):
+    return [tuple(int(col[c]) for col in result) for c in range(n)]
+
+
+def test_price_batch_python():
+    result = pricing._price_batch_python(*BATCH.values())
+    assert _rows(result, 3) == BATCH_TOTALS
+
+
+@pytest.mark.skipif(pricing.np is None, reason="numpy is not installed")
+def test_price_batch_numpy_matches_python():
+    result = pricing._price_batch_numpy(*BATCH.values())
+    assert _rows(result, 3) == BATCH_TOTALS
+
+
+def test_price_batch_per_cart_tax():
+    result = price_batch([0, 1], [1000, 1000], [1, 1], tax_bp=[825, 0])
+    assert _rows(result, 2) == [(1000, 0, 83, 1083), (1000, 0, 0, 1000)]
+
+
+def test_order_lines_keeps_scoped_discount():
+    orders = [
+        {
+            "items": [
+                {"price_cents": 749, "quantity": 2, "discount_eligible": True},
+                {"price_cents": 449, "quantity": 1, "discount_eligible": False},
+            ],
+            "discount_percent": 20,
+            "tax_rate_bp": 825,
+        },
+        # placed before lines carried the flag: the whole order was eligible
+        {"items": [{"price_cents": 1000, "quantity": 1}], "discount_percent": 5},
+    ]
+    cart_index, prices, quantities, eligible, discount_bp, tax_bp = order_lines(orders)
+    assert eligible == [True, False, True]
+    result = price_batch(
+        cart_index, prices, quantities, 2, eligible, discount_bp, tax_bp
+    )
+    assert _rows(result, 2) == [(1947, 300, 136, 1783), (1000, 50, 78, 1028)]
@@ -0,0 +1,47 @@
+"""Every signing backend round-trips, through the backend and through Signer."""
+
+import pytest
+
+from app import signers
+from app.signers import BACKENDS, Signer, generate_key
+
+
+def _available(algorithm: str) -> bool:
+    if algorithm == "ed25519":
+        return signers.Ed25519PrivateKey is not None
+    if algorithm == "ecdsa-p384":
+        return signers.SigningKey is not None
+    return True
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def algorithm(request):
+    if not _available(request.param):
+        pytest.skip(f"{request.param} backend dependency is not installed")
+    return request.param
+
+
+def test_backend_round_trip(algorithm):
+    backend = BACKENDS[algorithm]
+    sign, verify = backend.load(*backend.generate())
+    signature = sign(b"session:42")
+    assert verify(b"session:42", signature)
+    assert not verify(b"session:43", signature)
+
+
+def test_signer_round_trip(algorithm):
+    signer = Signer("test", lambda: [generate_key("test", algorithm)])
+    signature = signer.sign("session:42")
+    assert signer.verify("session:42", signature)
+    assert not signer.verify("session:43", signature)
+
+
+def test_signer_verifies_with_older_key(algorithm):
+    old = generate_key("test", algorithm)
+    keys = [old]
+    signer = Signer("test", lambda: list(keys), refresh_seconds=0)
+    signature = signer.sign("session:42")
+    keys.insert(0, generate_key("test", algorithm))
+    signer.reload()
+    assert signer.sign("session:42") != signature
+    assert signer.verify("session:42", signature)